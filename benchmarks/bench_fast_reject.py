@@ -0,0 +1,110 @@
+#  Copyright 2022 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import argparse
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../common/src'))
+os.environ.setdefault("PROJECT_ID", "bench-project")
+
+from fakes import ROOT_DIR, FakeCloud, load_cloud_function
+
+RUN_BATCH_DIR = os.path.join(ROOT_DIR, "cloud_functions", "run_batch")
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Cold start: fresh interpreter importing the entrypoint and handling a single non-trigger event
+COLD_THIN = f"""
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {RUN_BATCH_DIR!r})
+import main
+main.run_dragen_job({{"bucket": "bench-trigger", "name": "input_list/chunk_0.txt"}}, None)
+print(time.perf_counter() - start)
+"""
+
+COLD_FULL = f"""
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {BENCH_DIR!r})
+sys.path.insert(0, {os.path.join(ROOT_DIR, "common", "src")!r})
+sys.path.insert(0, {RUN_BATCH_DIR!r})
+from fakes import FakeCloud
+FakeCloud().install()
+import dragen_job
+dragen_job.run_dragen_job({{"bucket": "bench-trigger", "name": "input_list/chunk_0.txt"}}, None)
+print(time.perf_counter() - start)
+"""
+
+
+def cold_start(script: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True,
+                                env=dict(os.environ))
+        timings.append(float(output.stdout.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def warm(handler, events: int) -> float:
+    start = time.perf_counter()
+    for i in range(events):
+        handler({"bucket": "bench-trigger", "name": f"input_list/chunk_{i}.txt"}, None)
+    return (time.perf_counter() - start) / events
+
+
+def get_args():
+    args_parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="""
+      Per-event cost of non-trigger GCS events (such as chunk and config files written by prepare_input):
+      thin stdlib-only entrypoint (main.py) vs. the full orchestration module (dragen_job.py).
+      Full path imports use the offline stand-ins, so real cold starts (google-cloud libraries, credentials,
+      client construction) are more expensive than reported here.
+      """,
+        epilog="""
+      Examples:
+
+      python benchmarks/bench_fast_reject.py -n 10000 -r 5
+      """)
+    args_parser.add_argument('-n', dest="events", type=int, default=10000, help="warm events to send")
+    args_parser.add_argument('-r', dest="repeat", type=int, default=5, help="cold start repetitions")
+    return args_parser
+
+
+if __name__ == "__main__":
+    parser = get_args()
+    args = parser.parse_args()
+
+    thin_cold = cold_start(COLD_THIN, args.repeat)
+    full_cold = cold_start(COLD_FULL, args.repeat)
+
+    thin = load_cloud_function("run_batch", alias="run_batch_thin")
+    thin_warm = warm(thin.run_dragen_job, args.events)
+    heavy_modules = sorted(m for m in sys.modules if m.startswith(("commonek", "google", "dragen_job")))
+
+    cloud = FakeCloud().install()
+    import dragen_job
+    logging.getLogger().handlers = [logging.NullHandler()]
+    cloud.stats.reset()
+    full_warm = warm(dragen_job.run_dragen_job, args.events)
+
+    print(f"{'path':<10} {'cold_start_ms':>14} {'warm_per_event_us':>18}")
+    print(f"{'thin':<10} {thin_cold * 1000:>14.2f} {thin_warm * 1e6:>18.2f}")
+    print(f"{'full':<10} {full_cold * 1000:>14.2f} {full_warm * 1e6:>18.2f}")
+    print(f"modules loaded by the thin path: {heavy_modules or 'none of commonek/google'}")
+    print(f"API calls made by the full path for {args.events} events: {cloud.stats.total()}")
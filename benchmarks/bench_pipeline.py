@@ -0,0 +1,249 @@
+#  Copyright 2022 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import argparse
+import base64
+import json
+import logging
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../common/src'))
+TRIGGER_BUCKET = "bench-trigger"
+os.environ.setdefault("PROJECT_ID", "bench-project")
+os.environ.setdefault("JOBS_LIST_URI", f"gs://{TRIGGER_BUCKET}/scheduler/jobs.csv")
+
+from fakes import FakeCloud, load_cloud_function
+
+CONFIG_BUCKET = "bench-config"
+DATA_BUCKET = "bench-data"
+REGION = "us-central1"
+SECRET_NAMES = ["batchS3AccessKey", "batchS3SecretKey", "illuminaLicServer", "jarviceApiKey", "jarviceApiUsername"]
+
+CRAM_CONFIG = {
+    "dragen_options": {
+        "-r": f"s3://{DATA_BUCKET}/References/hg38_hash_3.7.8",
+        "--output-directory": "s3://bench-output/${SAMPLE_ID}/<date>",
+        "--output-file-prefix": "${SAMPLE_ID}",
+        "--vc-sample-name": "${SAMPLE_ID}",
+        "--enable-variant-caller": "true",
+    },
+    "jarvice_options": {
+        "dragen_app": "illumina-dragen_3_7_8n",
+        "entrypoint": "/bin/sh",
+        "stub": "/usr/local/bin/entrypoint",
+        "jarvice_machine_type": "nx1",
+        "api_host": "https://illumina.nimbix.net/api",
+        "image_uri": "us-docker.pkg.dev/jarvice/images/jarvice-dragen-service:1.0-rc.5",
+    },
+}
+
+
+def parse_latency(value: str):
+    """gcs=0.02,bigquery=0.05 -> {"gcs": 0.02, "bigquery": 0.05}"""
+    latency = {}
+    if value:
+        for item in value.split(","):
+            api, seconds = item.split("=")
+            latency[api.strip()] = float(seconds)
+    return latency
+
+
+def job_array_lookup(cloud: FakeCloud):
+    """Answers the job_array lookups of get_status from the rows inserted by run_dragen_job."""
+    index = {}
+
+    def handler(sql, client):
+        rows = client.table_rows("job_array")
+        if len(index) != len(rows):
+            index.clear()
+            for row in rows:
+                index[(row["job_id"], int(row["batch_task_index"]))] = row
+        match = re.search(r"job_id='([^']+)'.*batch_task_index=(\d+)", sql, re.S)
+        row = index.get((match.group(1), int(match.group(2)))) if match else None
+        return [row] if row else []
+
+    cloud.bigquery.add_query_handler(r"FROM\s+`[^`]*job_array`\s+WHERE", handler)
+
+
+def prepare_workload(cloud: FakeCloud, samples: int, label: str):
+    storage = cloud.storage
+    prefix = f"bench/{samples}"
+    lines = ["collaborator_sample_id\tcram_file_ref"]
+    for i in range(samples):
+        uri = f"gs://{DATA_BUCKET}/crams/S{i}.cram"
+        storage.put_uri(uri, b"c" * (1000 + i % 100))
+        lines.append(f"S{i}\t{uri}")
+    storage.put(TRIGGER_BUCKET, f"{prefix}/input_list.txt", "\n".join(lines))
+    storage.put(CONFIG_BUCKET, "cram_config.json", json.dumps(CRAM_CONFIG))
+    storage.put(TRIGGER_BUCKET, f"{prefix}/batch_config.json", json.dumps({
+        "run_options": {"parallelism": 14, "max_run_duration": "7200s", "machine": "e2-small", "max_retry_count": 1},
+        "input_options": {
+            "input_type": "cram",
+            "input_list": f"gs://{TRIGGER_BUCKET}/{prefix}/input_list.txt",
+            "config": f"gs://{CONFIG_BUCKET}/cram_config.json",
+        },
+    }))
+    storage.put(TRIGGER_BUCKET, f"{prefix}/START_PIPELINE", json.dumps({"dragen-job": label,
+                                                                          "config": "batch_config.json"}))
+    return prefix
+
+
+def encode(text: str) -> str:
+    return base64.b64encode(text.encode("utf-8")).decode("utf-8")
+
+
+def measure(cloud: FakeCloud, name: str, fn, memory=True):
+    cloud.stats.reset()
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    count = fn()
+    wall = time.perf_counter() - start
+    peak = 0
+    if memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    calls = cloud.stats.snapshot()
+    return {
+        "phase": name,
+        "wall_seconds": round(wall, 3),
+        "events": count,
+        "api_calls": sum(calls.values()),
+        "peak_memory_mib": round(peak / 1024 / 1024, 2),
+        "calls": calls,
+    }
+
+
+def run_workload(cloud, run_batch, get_status, scheduler, samples: int, status_events: int, memory: bool):
+    label = f"bench-{samples}"
+    prefix = prepare_workload(cloud, samples, label)
+    # next job in the schedule, so that get_job_update has something to trigger
+    cloud.storage.put(TRIGGER_BUCKET, "scheduler/jobs.csv",
+                      f"{label}, gs://{TRIGGER_BUCKET}/{prefix}/batch_config.json\n"
+                      f"{label}-next, gs://{TRIGGER_BUCKET}/{prefix}/batch_config.json\n")
+    results = []
+
+    def run_dragen_job():
+        run_batch.run_dragen_job({"bucket": TRIGGER_BUCKET, "name": f"{prefix}/START_PIPELINE"}, None)
+        return 1
+
+    results.append(measure(cloud, "run_dragen_job", run_dragen_job, memory))
+
+    job = [job for job in cloud.batch.jobs.values() if job.labels.get("dragen-job") == label][-1]
+    task_count = len(cloud.batch.tasks[job.name])
+    count = min(task_count, status_events) if status_events else task_count
+
+    def status_updates():
+        events = 0
+        for index in range(count):
+            for state in ["RUNNING", "SUCCEEDED"]:
+                get_status.get_status({
+                    "attributes": {
+                        "JobUID": job.uid,
+                        "NewTaskState": state,
+                        "TaskName": f"{job.name}/taskGroups/group0/tasks/{index}",
+                        "Region": REGION,
+                        "TaskUID": f"{job.uid}-group0-{index}",
+                        "Type": "TASK_STATE_CHANGED",
+                    },
+                    "data": encode(f"Task state was updated: currentState={state}"),
+                }, None)
+                events += 1
+        return events
+
+    results.append(measure(cloud, "get_status", status_updates, memory))
+
+    def job_update():
+        cloud.batch.set_job_state(job.name, "SUCCEEDED")
+        scheduler.get_job_update({
+            "attributes": {
+                "JobName": job.name,
+                "JobUID": job.uid,
+                "NewJobState": "SUCCEEDED",
+                "Region": REGION,
+            },
+            "data": encode("Job state was updated: currentState=SUCCEEDED"),
+        }, None)
+        return 1
+
+    results.append(measure(cloud, "get_job_update", job_update, memory))
+    for result in results:
+        result["samples"] = samples
+    return results
+
+
+def print_results(results):
+    header = f"{'samples':>8} {'phase':<16} {'events':>8} {'wall_s':>9} {'api_calls':>10} {'peak_mib':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['samples']:>8} {r['phase']:<16} {r['events']:>8} {r['wall_seconds']:>9} "
+              f"{r['api_calls']:>10} {r['peak_memory_mib']:>9}")
+        for call, count in sorted(r["calls"].items()):
+            print(f"{'':>8} {'':<16} {'':>8} {'':>9} {count:>10}  {call}")
+
+
+def get_args():
+    args_parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="""
+      Offline benchmark of run_dragen_job, get_status and get_job_update using in-memory stand-ins
+      for GCS, BigQuery, Batch, Secret Manager and Cloud Logging.
+      Reports wall time, number of API calls and peak memory per phase.
+      """,
+        epilog="""
+      Examples:
+
+      python benchmarks/bench_pipeline.py -n 1000 10000 100000
+      python benchmarks/bench_pipeline.py -n 1000 -l gcs=0.02,bigquery=0.05,batch=0.2 -e 100 -o results.json
+      """)
+    args_parser.add_argument('-n', dest="samples", type=int, nargs="+", default=[1000, 10000, 100000],
+                             help="number of samples per workload (default 1000 10000 100000)")
+    args_parser.add_argument('-e', dest="status_events", type=int, default=0,
+                             help="limit number of tasks sending status events (default all tasks)")
+    args_parser.add_argument('-l', dest="latency", default="",
+                             help="injected latency per api in seconds, such as gcs=0.02,bigquery=0.05 "
+                                  "(apis: gcs, bigquery, batch, secrets, logging)")
+    args_parser.add_argument('-o', dest="out_path", help="save results as json")
+    args_parser.add_argument('--no-memory', dest="memory", action="store_false",
+                             help="do not trace memory allocations (faster)")
+    return args_parser
+
+
+if __name__ == "__main__":
+    parser = get_args()
+    args = parser.parse_args()
+
+    fake_cloud = FakeCloud(latency=parse_latency(args.latency)).install()
+    for secret in SECRET_NAMES:
+        fake_cloud.secrets.secrets[secret] = f"{secret}-value"
+    job_array_lookup(fake_cloud)
+
+    run_batch_module = load_cloud_function("run_batch")
+    get_status_module = load_cloud_function("get_status")
+    scheduler_module = load_cloud_function("scheduler")
+    # Format and write the log messages (as the handlers do in Cloud Functions), but to devnull
+    logging.getLogger().handlers = [logging.StreamHandler(open(os.devnull, "w"))]
+
+    all_results = []
+    for workload in args.samples:
+        all_results.extend(run_workload(fake_cloud, run_batch_module, get_status_module, scheduler_module,
+                                        workload, args.status_events, args.memory))
+    print_results(all_results)
+    if args.out_path:
+        with open(args.out_path, "w") as f:
+            json.dump(all_results, f, indent=2)
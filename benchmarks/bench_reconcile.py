@@ -0,0 +1,150 @@
+#  Copyright 2022 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import argparse
+import logging
+import os
+import random
+import re
+import time
+
+from bench_pipeline import REGION, parse_latency
+from bench_status_consumer import bulk_job_array_lookup
+from fakes import FakeCloud, Message, load_cloud_function
+
+LABEL = "bench-reconcile"
+
+
+def recorded_states_lookup(cloud: FakeCloud):
+    """Answers the ARRAY_AGG query of the reconciler from the tasks_status rows."""
+
+    def handler(sql, client):
+        job_ids = set(re.findall(r"'([^']+)'", re.search(r"job_id IN \(([^)]*)\)", sql).group(1)))
+        statuses = {}
+        for row in client.table_rows("tasks_status"):
+            if row["job_id"] in job_ids:
+                statuses.setdefault(row["task_id"], set()).add(row["status"])
+        return [{"task_id": task_id, "statuses": sorted(states)} for task_id, states in statuses.items()]
+
+    cloud.bigquery.add_query_handler(r"ARRAY_AGG\(DISTINCT status\)", handler)
+
+
+def prepare_jobs(cloud: FakeCloud, jobs: int, tasks: int, failed: float, dropped: float, seed: int = 0) -> int:
+    """Completed jobs with all the task events handled but a fraction dropped, returns the missing transitions."""
+    rng = random.Random(seed)
+    parent = f"projects/{os.environ['PROJECT_ID']}/locations/{REGION}"
+    job_array, tasks_status = [], []
+    missing = 0
+    for j in range(jobs):
+        job = cloud.batch.create_job(Message(parent=parent, job_id=f"job-dragen-rec{j:04d}", job=Message(
+            labels={"dragen-job": LABEL}, task_groups=[Message(task_count=tasks)])))
+        for index in range(tasks):
+            task_id = f"{job.uid}-group0-{index}"
+            state = "FAILED" if rng.random() < failed else "SUCCEEDED"
+            cloud.batch.set_task_state(job.name, index, "RUNNING", "Task state is updated from ASSIGNED to RUNNING")
+            cloud.batch.set_task_state(job.name, index, state, f"Task state is updated from RUNNING to {state}")
+            job_array.append({"job_id": job.uid, "batch_task_index": index, "sample_id": f"S{j}-{index}",
+                              "output_path": f"gs://bench-output/S{j}-{index}", "job_label": LABEL})
+            statuses = ["RUNNING", state] + (["VERIFIED_OK"] if state == "SUCCEEDED" else [])
+            for status in statuses:
+                if status != "VERIFIED_OK" and rng.random() < dropped:
+                    missing += 1
+                    if status == "SUCCEEDED":  # the verification is written with its event
+                        break
+                    continue
+                tasks_status.append({"job_id": job.uid, "task_id": task_id, "status": status})
+        cloud.batch.set_job_state(job.name, "SUCCEEDED" if state == "SUCCEEDED" else "FAILED")
+    cloud.bigquery.tables["job_array"].extend(job_array)
+    cloud.bigquery.tables["tasks_status"].extend(tasks_status)
+    return missing
+
+
+def run(cloud, name, fn, workers):
+    cloud.stats.reset()
+    rows_before = len(cloud.bigquery.table_rows("tasks_status"))
+    start = time.perf_counter()
+    summary = fn()
+    wall = time.perf_counter() - start
+    calls = cloud.stats.snapshot()
+    return {
+        "run": name,
+        "workers": workers,
+        "jobs": summary["jobs"],
+        "tasks": summary["tasks"],
+        "wall_seconds": round(wall, 3),
+        "api_calls": sum(calls.values()),
+        "missing": sum(summary["missing"].values()),
+        "rows": len(cloud.bigquery.table_rows("tasks_status")) - rows_before,
+        "calls": calls,
+    }
+
+
+def get_args():
+    args_parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="""
+      Time of a reconciliation of the task statuses over completed jobs whose task events were partly lost:
+      listing of the tasks one job at a time against concurrently, then the replay of the missing transitions
+      through get_status, and a second pass which should find nothing left.
+      """,
+        epilog="""
+      Examples:
+
+      python benchmarks/bench_reconcile.py -j 100 -n 50 -l batch=0.1,bigquery=0.5
+      """)
+    args_parser.add_argument('-j', dest="jobs", type=int, default=100, help="completed jobs (default 100)")
+    args_parser.add_argument('-n', dest="tasks", type=int, default=50, help="tasks per job (default 50)")
+    args_parser.add_argument('-d', dest="dropped", type=float, default=0.02,
+                             help="fraction of the task events lost (default 0.02)")
+    args_parser.add_argument('-f', dest="failed", type=float, default=0.05,
+                             help="fraction of the tasks failed (default 0.05)")
+    args_parser.add_argument('-w', dest="workers", type=int, default=16,
+                             help="jobs listed at a time by the concurrent runs (default 16)")
+    args_parser.add_argument('-l', dest="latency", default="batch=0.05,bigquery=0.2",
+                             help="injected latency per api in seconds (default batch=0.05,bigquery=0.2; "
+                                  "apis: gcs, bigquery, batch, secrets, logging, pubsub)")
+    return args_parser
+
+
+if __name__ == "__main__":
+    parser = get_args()
+    args = parser.parse_args()
+
+    fake_cloud = FakeCloud().install()
+    bulk_job_array_lookup(fake_cloud)
+    recorded_states_lookup(fake_cloud)
+
+    get_status = load_cloud_function("get_status")
+    from commonek.reconciler import reconcile
+    logging.getLogger().handlers = [logging.StreamHandler(open(os.devnull, "w"))]
+
+    expected = prepare_jobs(fake_cloud, args.jobs, args.tasks, args.failed, args.dropped)
+    fake_cloud.latency.update(parse_latency(args.latency))
+
+    def pass_(workers, replay=True):
+        return lambda: reconcile(job_label=LABEL, max_workers=workers, settle_seconds=0,
+                                 replay=get_status.replay_transitions if replay else None, dry_run=not replay)
+
+    results = [run(fake_cloud, "dry-run", pass_(1, replay=False), 1),
+               run(fake_cloud, "dry-run", pass_(args.workers, replay=False), args.workers),
+               run(fake_cloud, "replay", pass_(args.workers), args.workers),
+               run(fake_cloud, "again", pass_(args.workers), args.workers)]
+
+    print(f"{expected} transitions dropped over {args.jobs} jobs of {args.tasks} tasks")
+    print(f"{'run':<8} {'workers':>8} {'jobs':>5} {'tasks':>6} {'wall_s':>8} {'api_calls':>10} {'missing':>8} "
+          f"{'rows':>6}")
+    for r in results:
+        print(f"{r['run']:<8} {r['workers']:>8} {r['jobs']:>5} {r['tasks']:>6} {r['wall_seconds']:>8} "
+              f"{r['api_calls']:>10} {r['missing']:>8} {r['rows']:>6}")
+        for call, count in sorted(r["calls"].items()):
+            print(f"{'':<8} {'':>8} {'':>5} {'':>6} {'':>8} {count:>10}  {call}")
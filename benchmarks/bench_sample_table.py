@@ -0,0 +1,145 @@
+#  Copyright 2022 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../common/src'))
+os.environ.setdefault("PROJECT_ID", "bench-project")
+
+from fakes import FakeCloud, load_cloud_function
+
+CRAM_OPTIONS = {
+    "--output-directory": "s3://bench-output/${SAMPLE_ID}/<date>",
+    "--output-file-prefix": "${SAMPLE_ID}",
+    "--vc-sample-name": "${SAMPLE_ID}",
+}
+JARVICE_OPTIONS = {"dragen_app": "illumina-dragen_3_7_8n", "stub": "/usr/local/bin/entrypoint"}
+
+
+def input_rows(samples: int):
+    """Rows of an input list, as returned by get_rows_from_file."""
+    return [[f"S{i}", f"gs://bench-data/crams/S{i}.cram"] for i in range(samples)]
+
+
+def previous_representation(dragen_job, rows, batch_size):
+    """Sample flow before the sample table: list of lists -> dict of parallel lists -> per-task dicts ->
+    Environment protos, then the environments are built again and all the job_array rows at once."""
+    from google.cloud import batch_v1
+
+    sizes = {row[1]: 1000 for row in rows}
+    variables = {"SAMPLE_ID": [], "INPUT_PATH": [], "OUTPUT_PATH": []}
+    for sample_id, uri in rows:
+        variables["SAMPLE_ID"].append(sample_id)
+        variables["INPUT_PATH"].append(uri.replace("gs://", "s3://"))
+        variables["OUTPUT_PATH"].append(CRAM_OPTIONS["--output-directory"].replace("${SAMPLE_ID}", sample_id))
+    s3_sizes = {uri.replace("gs://", "s3://"): size for uri, size in sizes.items()}
+    input_sizes = [s3_sizes.get(uri) for uri in variables["INPUT_PATH"]]
+
+    def environments():
+        return [batch_v1.Environment(variables={key: variables[key][i] for key in variables})
+                for i in range(len(variables["SAMPLE_ID"]))]
+
+    job_environments = environments()
+    task_environments = environments()
+    job_array = []
+    for i, environment in enumerate(task_environments):
+        task_variables = {key: variables[key][i] for key in variables}
+        job_array.append({
+            "batch_task_index": i,
+            "variables": json.dumps(task_variables),
+            "command": dragen_job.magic_replace("${SAMPLE_ID} ${OUTPUT_PATH}", i, environment.variables),
+            "sample_id": task_variables["SAMPLE_ID"],
+            "input_size": input_sizes[i],
+        })
+    inserted = 0
+    for start in range(0, len(job_array), batch_size):
+        inserted += len(job_array[start:start + batch_size])
+    return len(job_environments), inserted
+
+
+def sample_table(dragen_job, rows, batch_size):
+    """Sample flow with the sample table: the columns are filled once and shared down to the job_array rows."""
+    samples = dragen_job.SampleTable.from_rows(rows)
+    del rows[:]
+    samples.input_sizes = [1000] * len(samples)
+    _, tasks = dragen_job.task_info(CRAM_OPTIONS, JARVICE_OPTIONS, samples, "cram")
+    job_environments = tasks.task_environments()
+    inserted = 0
+    for start in range(0, len(tasks), batch_size):
+        job_array = [{
+            "batch_task_index": i,
+            "variables": json.dumps(task_variables),
+            "command": dragen_job.magic_replace("${SAMPLE_ID} ${OUTPUT_PATH}", i, task_variables),
+            "sample_id": task_variables["SAMPLE_ID"],
+            "input_size": tasks.input_sizes[i],
+        } for i, task_variables in enumerate(tasks.rows(start, start + batch_size), start)]
+        inserted += len(job_array)
+    return len(job_environments), inserted
+
+
+def measure(name, fn, dragen_job, samples, batch_size):
+    rows = input_rows(samples)
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    tasks, inserted = fn(dragen_job, rows, batch_size)
+    wall = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert tasks == inserted == samples, f"{name}: {tasks} tasks, {inserted} rows for {samples} samples"
+    return {"representation": name, "samples": samples, "wall_seconds": round(wall, 3),
+            "peak_memory_mib": round(peak / 1024 / 1024, 2)}
+
+
+def get_args():
+    args_parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="""
+      Peak memory of the samples of a job from the input list to the task environments and the job_array rows:
+      the previous lists / dicts of parallel lists / per-task dicts against the columnar sample table.
+      Task environments use the offline stand-in of batch_v1.Environment, real protos are larger in both cases.
+      """,
+        epilog="""
+      Examples:
+
+      python benchmarks/bench_sample_table.py -n 100000
+      """)
+    args_parser.add_argument('-n', dest="samples", type=int, nargs="+", default=[100000],
+                             help="number of samples (default 100000)")
+    args_parser.add_argument('-b', dest="batch_size", type=int, default=500,
+                             help="job_array rows per insert request (default 500)")
+    return args_parser
+
+
+if __name__ == "__main__":
+    parser = get_args()
+    args = parser.parse_args()
+
+    FakeCloud().install()
+    load_cloud_function("run_batch")
+    import dragen_job
+    logging.getLogger().handlers = [logging.NullHandler()]
+
+    print(f"{'samples':>8} {'representation':<24} {'wall_s':>8} {'peak_mib':>9}")
+    for workload in args.samples:
+        for name, fn in [("lists (previous)", previous_representation), ("sample table", sample_table)]:
+            result = measure(name, fn, dragen_job, workload, args.batch_size)
+            print(f"{result['samples']:>8} {result['representation']:<24} {result['wall_seconds']:>8} "
+                  f"{result['peak_memory_mib']:>9}")
@@ -0,0 +1,134 @@
+#  Copyright 2022 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import argparse
+import logging
+import os
+import re
+import time
+
+from bench_pipeline import REGION, SECRET_NAMES, TRIGGER_BUCKET
+from bench_pipeline import encode, job_array_lookup, parse_latency, prepare_workload
+from fakes import FakeCloud, load_cloud_function
+
+SUBSCRIPTION = "bench-task-state-change-pull"
+
+
+def bulk_job_array_lookup(cloud: FakeCloud):
+    """Answers the `batch_task_index IN (...)` lookups of the batch consumer."""
+
+    def handler(sql, client):
+        job_id = re.search(r"job_id='([^']+)'", sql).group(1)
+        indices = {int(index) for index in re.search(r"IN \(([^)]*)\)", sql).group(1).split(",")}
+        return [row for row in client.table_rows("job_array")
+                if row["job_id"] == job_id and int(row["batch_task_index"]) in indices]
+
+    cloud.bigquery.add_query_handler(r"batch_task_index IN \(", handler)
+
+
+def task_events(job, tasks: int):
+    """RUNNING then SUCCEEDED for every task, as (attributes, data)."""
+    events = []
+    for state in ["RUNNING", "SUCCEEDED"]:
+        for index in range(tasks):
+            events.append(({
+                "JobUID": job.uid,
+                "NewTaskState": state,
+                "TaskName": f"{job.name}/taskGroups/group0/tasks/{index}",
+                "Region": REGION,
+                "TaskUID": f"{job.uid}-group0-{index}",
+                "Type": "TASK_STATE_CHANGED",
+            }, f"Task state was updated: previousState=PENDING, currentState={state}"))
+    return events
+
+
+def run(cloud, name, fn, events):
+    cloud.stats.reset()
+    rows_before = len(cloud.bigquery.table_rows("tasks_status"))
+    start = time.perf_counter()
+    fn()
+    wall = time.perf_counter() - start
+    calls = cloud.stats.snapshot()
+    return {
+        "consumer": name,
+        "events": events,
+        "wall_seconds": round(wall, 3),
+        "events_per_second": round(events / wall, 1) if wall else None,
+        "api_calls": sum(calls.values()),
+        "rows": len(cloud.bigquery.table_rows("tasks_status")) - rows_before,
+        "calls": calls,
+    }
+
+
+def get_args():
+    args_parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="""
+      Throughput of the task state events (RUNNING and SUCCEEDED of every task of a job) handled one per
+      invocation by get_status, against the batch consumer draining a (stand-in) pull subscription.
+      Function start-up costs of the per-event path are not included.
+      """,
+        epilog="""
+      Examples:
+
+      python benchmarks/bench_status_consumer.py -n 500 -l bigquery=0.05,logging=0.1,pubsub=0.02
+      """)
+    args_parser.add_argument('-n', dest="tasks", type=int, default=500, help="tasks of the job (default 500)")
+    args_parser.add_argument('-m', dest="max_messages", type=int, default=500,
+                             help="messages per pull of the batch consumer (default 500)")
+    args_parser.add_argument('-l', dest="latency", default="",
+                             help="injected latency per api in seconds, such as bigquery=0.05,logging=0.1 "
+                                  "(apis: gcs, bigquery, batch, secrets, logging, pubsub)")
+    return args_parser
+
+
+if __name__ == "__main__":
+    parser = get_args()
+    args = parser.parse_args()
+
+    fake_cloud = FakeCloud().install()
+    for secret in SECRET_NAMES:
+        fake_cloud.secrets.secrets[secret] = f"{secret}-value"
+    bulk_job_array_lookup(fake_cloud)
+    job_array_lookup(fake_cloud)
+
+    run_batch = load_cloud_function("run_batch")
+    get_status = load_cloud_function("get_status")
+    logging.getLogger().handlers = [logging.StreamHandler(open(os.devnull, "w"))]
+
+    label = f"bench-status-{args.tasks}"
+    prefix = prepare_workload(fake_cloud, args.tasks, label)
+    run_batch.run_dragen_job({"bucket": TRIGGER_BUCKET, "name": f"{prefix}/START_PIPELINE"}, None)
+    job = [job for job in fake_cloud.batch.jobs.values() if job.labels.get("dragen-job") == label][-1]
+    events = task_events(job, args.tasks)
+    fake_cloud.latency.update(parse_latency(args.latency))
+
+    def per_event():
+        for attributes, data in events:
+            get_status.get_status({"attributes": attributes, "data": encode(data)}, None)
+
+    def batch_consumer():
+        for attributes, data in events:
+            fake_cloud.pubsub.publish(f"projects/{os.environ['PROJECT_ID']}/subscriptions/{SUBSCRIPTION}",
+                                      data.encode("utf-8"), attributes)
+        get_status.drain_subscription(SUBSCRIPTION, max_messages=args.max_messages)
+
+    results = [run(fake_cloud, "per-event", per_event, len(events)),
+               run(fake_cloud, "batch", batch_consumer, len(events))]
+
+    print(f"{'consumer':<10} {'events':>7} {'wall_s':>8} {'events/s':>9} {'api_calls':>10} {'rows':>6}")
+    for r in results:
+        print(f"{r['consumer']:<10} {r['events']:>7} {r['wall_seconds']:>8} {r['events_per_second']:>9} "
+              f"{r['api_calls']:>10} {r['rows']:>6}")
+        for call, count in sorted(r["calls"].items()):
+            print(f"{'':<10} {'':>7} {'':>8} {'':>9} {count:>10}  {call}")
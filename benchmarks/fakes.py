@@ -0,0 +1,684 @@
+#  Copyright 2022 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""In-memory stand-ins for GCS, BigQuery, Batch, Secret Manager, Cloud Logging and Pub/Sub (pull subscriptions).
+
+FakeCloud.install() registers stand-in `google.cloud.*` modules in sys.modules, so that `commonek` and the
+Cloud Functions can be imported and driven offline (no credentials, no network). Every client call is counted
+and can be delayed by a configured latency, to emulate the round trip to the real API.
+Must be called before importing `commonek` or any of the Cloud Functions.
+"""
+
+import base64
+import datetime
+import hashlib
+import importlib.util
+import io
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+import types
+import uuid
+import zlib
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# API names used for counting calls and for latency injection
+GCS = "gcs"
+BIGQUERY = "bigquery"
+BATCH = "batch"
+SECRETS = "secrets"
+LOGGING = "logging"
+PUBSUB = "pubsub"
+
+
+class CallStats:
+    """Thread-safe counter of the API calls per api and method."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = defaultdict(int)
+
+    def add(self, api: str, method: str):
+        with self.lock:
+            self.calls[f"{api}.{method}"] += 1
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.calls)
+
+    def total(self) -> int:
+        with self.lock:
+            return sum(self.calls.values())
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Generic protobuf-like messages (stand-in for google.cloud.batch_v1 and friends)
+# ---------------------------------------------------------------------------------------------------------------
+
+class _MessageMeta(type):
+    """Nested types (CamelCase) are created on first access, enum values (UPPER_CASE) are their own names."""
+
+    def __getattr__(cls, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name.isupper():
+            return name
+        nested = _MessageMeta(name, (Message,), {})
+        setattr(cls, name, nested)
+        return nested
+
+
+class Message(metaclass=_MessageMeta):
+    def __init__(self, mapping=None, **kwargs):
+        if mapping:
+            kwargs.update(mapping)
+        self.__dict__.update(kwargs)
+
+    def __getattr__(self, name):
+        if name[:1].isupper():
+            return getattr(type(self), name)
+        raise AttributeError(f"{type(self).__name__} has no field {name}")
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.__dict__})"
+
+
+class _MessageModule(types.ModuleType):
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        message = _MessageMeta(name, (Message,), {})
+        setattr(self, name, message)
+        return message
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Exceptions (stand-in for google.api_core.exceptions)
+# ---------------------------------------------------------------------------------------------------------------
+
+class GoogleAPICallError(Exception):
+    code = 500
+
+
+class NotFound(GoogleAPICallError):
+    code = 404
+
+
+class NotModified(GoogleAPICallError):
+    code = 304
+
+
+class PreconditionFailed(GoogleAPICallError):
+    code = 412
+
+
+class Conflict(GoogleAPICallError):
+    code = 409
+
+
+class Forbidden(GoogleAPICallError):
+    code = 403
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Cloud Storage
+# ---------------------------------------------------------------------------------------------------------------
+
+class FakeBlob:
+    def __init__(self, name, bucket=None, **kwargs):
+        self.name = name
+        self.bucket = bucket
+        self.size = None
+        self.generation = None
+        self.crc32c = None
+        self.md5_hash = None
+        self.content_type = None
+        self.updated = None
+        self.metadata = None
+
+    @property
+    def _cloud(self) -> "FakeCloud":
+        return self.bucket.client.cloud
+
+    def _stored(self):
+        return self._cloud.storage.objects.get(self.bucket.name, {}).get(self.name)
+
+    def _load(self, stored):
+        self.size = len(stored["data"])
+        self.generation = stored["generation"]
+        self.crc32c = stored["crc32c"]
+        self.md5_hash = stored["md5_hash"]
+        self.content_type = stored["content_type"]
+        self.updated = stored["updated"]
+        self.metadata = stored.get("metadata")
+        return self
+
+    def exists(self, client=None, **kwargs):
+        self._cloud.call(GCS, "blob.exists")
+        return self._stored() is not None
+
+    def reload(self, client=None, **kwargs):
+        self._cloud.call(GCS, "blob.reload")
+        stored = self._stored()
+        if stored is None:
+            raise NotFound(f"gs://{self.bucket.name}/{self.name}")
+        self._load(stored)
+
+    def download_as_bytes(self, client=None, if_generation_not_match=None, if_generation_match=None, **kwargs):
+        self._cloud.call(GCS, "blob.download")
+        stored = self._stored()
+        if stored is None:
+            raise NotFound(f"gs://{self.bucket.name}/{self.name}")
+        if if_generation_not_match is not None and stored["generation"] == if_generation_not_match:
+            raise NotModified(f"gs://{self.bucket.name}/{self.name}")
+        if if_generation_match is not None and stored["generation"] != if_generation_match:
+            raise PreconditionFailed(f"gs://{self.bucket.name}/{self.name}")
+        self._load(stored)
+        return stored["data"]
+
+    def download_as_text(self, client=None, encoding="utf-8", **kwargs):
+        return self.download_as_bytes(client=client, **kwargs).decode(encoding or "utf-8")
+
+    def download_as_string(self, client=None, **kwargs):
+        return self.download_as_bytes(client=client, **kwargs)
+
+    def open(self, mode="r", **kwargs):
+        data = self.download_as_bytes()
+        return io.BytesIO(data) if "b" in mode else io.StringIO(data.decode(kwargs.get("encoding") or "utf-8"))
+
+    def upload_from_string(self, data, content_type="text/plain", client=None, if_generation_match=None, **kwargs):
+        self._cloud.call(GCS, "blob.upload")
+        stored = self._stored()
+        if if_generation_match is not None:
+            current = stored["generation"] if stored else 0
+            if current != if_generation_match:
+                raise PreconditionFailed(f"gs://{self.bucket.name}/{self.name}")
+        self._cloud.storage.put(self.bucket.name, self.name, data, content_type=content_type)
+        self._load(self._stored())
+
+    def delete(self, client=None, **kwargs):
+        self._cloud.call(GCS, "blob.delete")
+        if self._stored() is None:
+            raise NotFound(f"gs://{self.bucket.name}/{self.name}")
+        del self._cloud.storage.objects[self.bucket.name][self.name]
+
+
+class FakeBucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def exists(self, client=None, **kwargs):
+        self.client.cloud.call(GCS, "bucket.exists")
+        return True
+
+    def blob(self, blob_name, **kwargs):
+        return FakeBlob(blob_name, bucket=self)
+
+    def get_blob(self, blob_name, client=None, **kwargs):
+        self.client.cloud.call(GCS, "bucket.get_blob")
+        stored = self.client.objects.get(self.name, {}).get(blob_name)
+        if stored is None:
+            return None
+        return FakeBlob(blob_name, bucket=self)._load(stored)
+
+    def list_blobs(self, **kwargs):
+        return self.client.list_blobs(self, **kwargs)
+
+
+class _BlobIterator:
+    def __init__(self, blobs, prefixes):
+        self._blobs = blobs
+        self.prefixes = prefixes
+
+    def __iter__(self):
+        return iter(self._blobs)
+
+
+def _glob_regex(pattern: str):
+    """GCS match_glob: `**` any characters, `*` and `?` within a path segment, `{a,b}` alternatives."""
+    regex, i = "", 0
+    while i < len(pattern):
+        if pattern.startswith("**", i):
+            regex, i = regex + ".*", i + 2
+        elif pattern[i] == "*":
+            regex, i = regex + "[^/]*", i + 1
+        elif pattern[i] == "?":
+            regex, i = regex + "[^/]", i + 1
+        elif pattern[i] == "{":
+            end = pattern.index("}", i)
+            regex += "(?:" + "|".join(re.escape(a) for a in pattern[i + 1:end].split(",")) + ")"
+            i = end + 1
+        else:
+            regex, i = regex + re.escape(pattern[i]), i + 1
+    return re.compile(regex + r"\Z")
+
+
+class FakeStorageClient:
+    def __init__(self, cloud: "FakeCloud"):
+        self.cloud = cloud
+        self.objects: Dict[str, Dict[str, Dict]] = defaultdict(dict)
+        self._generations = itertools.count(1)
+        self.lock = threading.Lock()
+
+    # Helpers to prepare the data, not counted as API calls
+    def put(self, bucket_name: str, name: str, data, content_type: Optional[str] = None, metadata=None):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        with self.lock:
+            self.objects[bucket_name][name] = {
+                "data": data,
+                "generation": next(self._generations),
+                "crc32c": base64.b64encode(zlib.crc32(data).to_bytes(4, "big")).decode(),
+                "md5_hash": base64.b64encode(hashlib.md5(data).digest()).decode(),
+                "content_type": content_type,
+                "updated": time.time(),
+                "metadata": metadata,
+            }
+
+    def put_uri(self, uri: str, data, **kwargs):
+        match = re.match(r"(gs|s3)://([^/]+)/(.+)", uri)
+        self.put(match.group(2), match.group(3), data, **kwargs)
+
+    def get_text(self, bucket_name: str, name: str) -> Optional[str]:
+        stored = self.objects.get(bucket_name, {}).get(name)
+        return stored["data"].decode("utf-8") if stored else None
+
+    # API
+    def bucket(self, bucket_name, user_project=None):
+        return FakeBucket(self, bucket_name)
+
+    def get_bucket(self, bucket_or_name, **kwargs):
+        self.cloud.call(GCS, "get_bucket")
+        name = bucket_or_name.name if isinstance(bucket_or_name, FakeBucket) else bucket_or_name
+        return FakeBucket(self, name)
+
+    def list_blobs(self, bucket_or_name, prefix=None, delimiter=None, max_results=None, start_offset=None,
+                   end_offset=None, match_glob=None, **kwargs):
+        self.cloud.call(GCS, "list_blobs")
+        bucket = bucket_or_name if isinstance(bucket_or_name, FakeBucket) else FakeBucket(self, bucket_or_name)
+        prefix = prefix or ""
+        glob = _glob_regex(match_glob) if match_glob else None
+        blobs, prefixes = [], set()
+        for name in sorted(self.objects.get(bucket.name, {})):
+            if not name.startswith(prefix):
+                continue
+            if glob and not glob.match(name):
+                continue
+            if start_offset and name < start_offset:
+                continue
+            if end_offset and name >= end_offset:
+                continue
+            if delimiter:
+                rest = name[len(prefix):]
+                if delimiter in rest:
+                    prefixes.add(prefix + rest.split(delimiter)[0] + delimiter)
+                    continue
+            blobs.append(FakeBlob(name, bucket=bucket)._load(self.objects[bucket.name][name]))
+            if max_results and len(blobs) >= max_results:
+                break
+        return _BlobIterator(blobs, prefixes)
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# BigQuery
+# ---------------------------------------------------------------------------------------------------------------
+
+class Row(dict):
+    """Row of the query result, fields accessible as attributes or keys."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class _QueryJob:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def result(self, **kwargs):
+        return [Row(row) for row in self._rows]
+
+
+class _LoadJob:
+    def __init__(self, errors=None):
+        self.errors = errors
+        self.output_rows = None
+
+    def result(self, **kwargs):
+        return self
+
+
+class FakeBigQueryClient:
+    """Stores inserted rows per table; queries are answered by the registered handlers."""
+
+    def __init__(self, cloud: "FakeCloud"):
+        self.cloud = cloud
+        self.tables: Dict[str, List[Dict]] = defaultdict(list)
+        self.handlers: List = []
+        self.queries: List[str] = []
+        self.lock = threading.Lock()
+
+    def add_query_handler(self, pattern: str, handler: Callable[[str, "FakeBigQueryClient"], List[Dict]]):
+        """Registers handler(sql, client) -> rows for the queries matching regex `pattern`."""
+        self.handlers.append((re.compile(pattern, re.S), handler))
+
+    def table_rows(self, table_id: str) -> List[Dict]:
+        return self.tables[table_id.split(".")[-1]]
+
+    def insert_rows_json(self, table, json_rows, **kwargs):
+        self.cloud.call(BIGQUERY, "insert_rows_json")
+        table_id = table if isinstance(table, str) else str(table)
+        with self.lock:
+            self.tables[table_id.split(".")[-1]].extend(json_rows)
+        return []
+
+    def load_table_from_json(self, json_rows, destination, job_config=None, **kwargs):
+        self.cloud.call(BIGQUERY, "load_table_from_json")
+        table_id = destination if isinstance(destination, str) else str(destination)
+        with self.lock:
+            self.tables[table_id.split(".")[-1]].extend(list(json_rows))
+        return _LoadJob()
+
+    def query(self, sql, job_config=None, **kwargs):
+        self.cloud.call(BIGQUERY, "query")
+        with self.lock:
+            self.queries.append(sql)
+        for pattern, handler in self.handlers:
+            if pattern.search(sql):
+                return _QueryJob(handler(sql, self))
+        return _QueryJob([])
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Batch
+# ---------------------------------------------------------------------------------------------------------------
+
+def _state_filter(filter_str: Optional[str]) -> Optional[List[str]]:
+    if not filter_str:
+        return None
+    states = re.findall(r"state\s*=\s*\"?([A-Z_]+)\"?", filter_str)
+    return states or None
+
+
+def _label_filter(filter_str: Optional[str]) -> Dict[str, str]:
+    return dict(re.findall(r'labels\."([^"]+)"\s*=\s*"([^"]*)"', filter_str or ""))
+
+
+class FakeBatchServiceClient:
+    """Keeps the created jobs and their tasks in memory; task states are driven by the benchmark."""
+
+    def __init__(self, cloud: "FakeCloud"):
+        self.cloud = cloud
+        self.jobs: Dict[str, Message] = {}
+        self.tasks: Dict[str, List[Message]] = {}
+        self.lock = threading.Lock()
+
+    def create_job(self, request=None, **kwargs):
+        self.cloud.call(BATCH, "create_job")
+        request = request or Message(**kwargs)
+        job = request.job
+        name = f"{request.parent}/jobs/{request.job_id}"
+        job.name = name
+        job.uid = f"{request.job_id[:17]}-{uuid.uuid4().hex[:8]}-{uuid.uuid4().hex[:4]}-{uuid.uuid4().hex[:5]}"
+        job.labels = dict(job.__dict__.get("labels") or {})
+        job.status = Message(state="QUEUED", status_events=[])
+        group = job.task_groups[0]
+        environments = group.__dict__.get("task_environments") or []
+        task_count = len(environments) or int(group.__dict__.get("task_count", 1))
+        tasks = []
+        for index in range(task_count):
+            tasks.append(Message(
+                name=f"{name}/taskGroups/group0/tasks/{index}",
+                status=Message(state="PENDING", status_events=[]),
+            ))
+        with self.lock:
+            self.jobs[name] = job
+            self.tasks[name] = tasks
+        return job
+
+    def get_job(self, request=None, name=None, **kwargs):
+        self.cloud.call(BATCH, "get_job")
+        name = name or (request["name"] if isinstance(request, dict) else request.name)
+        if name not in self.jobs:
+            raise NotFound(name)
+        return self.jobs[name]
+
+    def delete_job(self, request=None, name=None, **kwargs):
+        self.cloud.call(BATCH, "delete_job")
+        name = name or (request["name"] if isinstance(request, dict) else request.name)
+        with self.lock:
+            if name not in self.jobs:
+                raise NotFound(name)
+            self.jobs[name].status.state = "DELETION_IN_PROGRESS"
+
+    def list_jobs(self, request=None, parent=None, filter=None, **kwargs):
+        self.cloud.call(BATCH, "list_jobs")
+        if request is not None:
+            parent = getattr(request, "parent", None) or parent
+            filter = getattr(request, "filter", None) or filter
+        states = _state_filter(filter)
+        labels = _label_filter(filter)
+        return [
+            job for name, job in list(self.jobs.items())
+            if (not parent or name.startswith(parent)) and (states is None or job.status.state in states)
+            and all((job.labels or {}).get(key) == value for key, value in labels.items())
+        ]
+
+    def list_tasks(self, request=None, parent=None, filter=None, **kwargs):
+        self.cloud.call(BATCH, "list_tasks")
+        if request is not None:
+            parent = getattr(request, "parent", None) or parent
+            filter = getattr(request, "filter", None) or filter
+        job_name = parent.split("/taskGroups/")[0]
+        states = _state_filter(filter)
+        return [task for task in self.tasks.get(job_name, []) if states is None or task.status.state in states]
+
+    def get_task(self, request=None, name=None, **kwargs):
+        self.cloud.call(BATCH, "get_task")
+        name = name or (request["name"] if isinstance(request, dict) else request.name)
+        job_name, index = name.split("/taskGroups/")[0], int(name.split("/")[-1])
+        return self.tasks[job_name][index]
+
+    # Helpers to drive the state, not counted as API calls
+    def set_task_state(self, job_name: str, index: int, state: str, description: str = ""):
+        task = self.tasks[job_name][index]
+        task.status.state = state
+        task.status.status_events.append(Message(description=description, event_time=time.time()))
+
+    def set_job_state(self, job_name: str, state: str):
+        self.jobs[job_name].status.state = state
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Secret Manager and Cloud Logging
+# ---------------------------------------------------------------------------------------------------------------
+
+class FakeSecretManagerServiceClient:
+    def __init__(self, cloud: "FakeCloud"):
+        self.cloud = cloud
+        self.secrets: Dict[str, str] = {}
+
+    def access_secret_version(self, request=None, name=None, **kwargs):
+        self.cloud.call(SECRETS, "access_secret_version")
+        name = name or request["name"]
+        secret_name = name.split("/secrets/")[1].split("/")[0]
+        if secret_name not in self.secrets:
+            raise NotFound(name)
+        return Message(payload=Message(data=self.secrets[secret_name].encode("UTF-8")))
+
+
+class FakeLoggingServiceV2Client:
+    """Returns the configured text payloads for the task ids found in the filter."""
+
+    def __init__(self, cloud: "FakeCloud"):
+        self.cloud = cloud
+        self.default_payloads: List[str] = ["DRAGEN finished normally"]
+        self.payloads: Dict[str, List[str]] = {}
+
+    def list_log_entries(self, request=None, **kwargs):
+        self.cloud.call(LOGGING, "list_log_entries")
+        request = request or kwargs
+        filters = request["filter"] if isinstance(request, dict) else request.filter
+        task_ids = re.findall(r"task/([\w\-]+)/0/0", filters)
+        patterns = re.findall(r"textPayload\s*=~\s*\"(.*?)\"", filters)
+        entries = []
+        for task_id in task_ids or [None]:
+            for payload in self.payloads.get(task_id, self.default_payloads):
+                if not patterns or any(re.search(pattern, payload) for pattern in patterns):
+                    entries.append(Message(text_payload=payload, labels={"task_id": f"task/{task_id}/0/0"},
+                                           resource=Message(labels={"task_id": f"task/{task_id}/0/0"})))
+        return entries
+
+
+class FakeSubscriberClient:
+    """Pull subscriptions: published messages are kept until acknowledged (no ack deadline, no redelivery)."""
+
+    def __init__(self, cloud: "FakeCloud"):
+        self.cloud = cloud
+        self.messages: Dict[str, List[Message]] = defaultdict(list)
+        self.outstanding: Dict[str, Message] = {}
+        self.ack_ids = itertools.count()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def subscription_path(project: str, subscription: str) -> str:
+        return f"projects/{project}/subscriptions/{subscription}"
+
+    def publish(self, subscription: str, data: bytes, attributes: Dict[str, str]):
+        """Helper to feed the subscription, not counted as an API call."""
+        message = Message(data=data, attributes=dict(attributes), message_id=uuid.uuid4().hex,
+                          publish_time=datetime.datetime.now(datetime.timezone.utc))
+        with self.lock:
+            self.messages[subscription].append(message)
+
+    def pull(self, request=None, **kwargs):
+        self.cloud.call(PUBSUB, "pull")
+        request = request or kwargs
+        subscription, max_messages = request["subscription"], request.get("max_messages", 100)
+        received = []
+        with self.lock:
+            queue = self.messages[subscription]
+            for message in queue[:max_messages]:
+                ack_id = f"{subscription}:{next(self.ack_ids)}"
+                self.outstanding[ack_id] = message
+                received.append(Message(ack_id=ack_id, message=message))
+            del queue[:max_messages]
+        return Message(received_messages=received)
+
+    def acknowledge(self, request=None, **kwargs):
+        self.cloud.call(PUBSUB, "acknowledge")
+        request = request or kwargs
+        with self.lock:
+            for ack_id in request["ack_ids"]:
+                self.outstanding.pop(ack_id, None)
+
+
+class _LoggingClient:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def get_default_handler(self):
+        return None
+
+    def setup_logging(self, *args, **kwargs):
+        return None
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# FakeCloud
+# ---------------------------------------------------------------------------------------------------------------
+
+class FakeCloud:
+    """Holds a single instance of every fake client, the call counters and the injected latencies (seconds)."""
+
+    def __init__(self, latency: Optional[Dict[str, float]] = None):
+        self.latency = latency or {}
+        self.stats = CallStats()
+        self.storage = FakeStorageClient(self)
+        self.bigquery = FakeBigQueryClient(self)
+        self.batch = FakeBatchServiceClient(self)
+        self.secrets = FakeSecretManagerServiceClient(self)
+        self.logging = FakeLoggingServiceV2Client(self)
+        self.pubsub = FakeSubscriberClient(self)
+
+    def call(self, api: str, method: str):
+        self.stats.add(api, method)
+        delay = self.latency.get(api, 0)
+        if delay:
+            time.sleep(delay)
+
+    def install(self):
+        """Registers the stand-in google.cloud modules, returning the fake clients from every constructor."""
+        cloud = self
+
+        def module(name, **attributes):
+            mod = _MessageModule(name)
+            mod.__dict__.update(attributes)
+            sys.modules[name] = mod
+            parent_name, _, child = name.rpartition(".")
+            if parent_name in sys.modules:
+                setattr(sys.modules[parent_name], child, mod)
+            return mod
+
+        google = module("google")
+        google.__path__ = []
+        module("google.cloud").__path__ = []
+        module("google.api_core").__path__ = []
+        module("google.api_core.exceptions", GoogleAPICallError=GoogleAPICallError, NotFound=NotFound,
+               NotModified=NotModified, PreconditionFailed=PreconditionFailed, Conflict=Conflict,
+               Forbidden=Forbidden)
+        module("google.cloud.storage", Client=lambda *a, **k: cloud.storage, Blob=FakeBlob, Bucket=FakeBucket)
+        module("google.cloud.bigquery", Client=lambda *a, **k: cloud.bigquery)
+        module("google.cloud.batch_v1", BatchServiceClient=lambda *a, **k: cloud.batch)
+        module("google.cloud.secretmanager", SecretManagerServiceClient=lambda *a, **k: cloud.secrets)
+        module("google.cloud.logging_v2", Client=_LoggingClient).__path__ = []
+        module("google.cloud.logging_v2.services").__path__ = []
+        module("google.cloud.logging_v2.services.logging_service_v2",
+               LoggingServiceV2Client=lambda *a, **k: cloud.logging)
+        module("google.cloud.pubsub_v1", SubscriberClient=lambda *a, **k: cloud.pubsub)
+
+        # Slack is only used when SLACK_CHANNEL is set, stand-ins are enough for the imports
+        if importlib.util.find_spec("slack_sdk") is None:
+            module("slack_sdk", WebClient=lambda *a, **k: None).__path__ = []
+            module("slack_sdk.errors", SlackApiError=type("SlackApiError", (Exception,), {}))
+        if importlib.util.find_spec("certifi") is None:
+            module("certifi", where=lambda: None)
+        return self
+
+
+def load_cloud_function(name: str, alias: Optional[str] = None):
+    """Imports cloud_functions/<name>/main.py under a unique module name."""
+    path = os.path.join(ROOT_DIR, "cloud_functions", name, "main.py")
+    alias = alias or f"cf_{name}"
+    function_dir = os.path.dirname(path)
+    if function_dir not in sys.path:
+        sys.path.insert(0, function_dir)
+    spec = importlib.util.spec_from_file_location(alias, path)
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[alias] = mod
+    spec.loader.exec_module(mod)
+    return mod
@@ -16,14 +16,18 @@ from __future__ import annotations
 
 import base64
 import datetime
+import json
+import os
 import re
-from typing import List
+import time
+from typing import Dict, List, Optional, Set
 
+from google.cloud import batch_v1
 from google.cloud import storage
 from google.cloud.logging_v2.services.logging_service_v2 import LoggingServiceV2Client
 
 from commonek.bq_helper import stream_data_to_bigquery, run_query
-from commonek.logging import Logger
+from commonek.logging import Logger, flush_logs
 from commonek.params import (
     PROJECT_ID,
     DRAGEN_SUCCESS_ENTRIES,
@@ -31,17 +35,39 @@ from commonek.params import (
     TASK_VERIFIED_FAILED,
     SUCCEEDED,
     FAILED,
+    RUNNING,
+    TASK_PREEMPTED,
     BIGQUERY_DB_TASKS,
     BIGQUERY_DB_JOB_ARRAY,
+    PREFETCH_ACTIVE_TASKS,
+    SPECULATION_PERCENTILE,
 
 )
+from commonek.prefetch import prefetch_next_job
+from commonek.speculation import monitor, settle_completed
+from commonek.provisioning import is_preempted
+from commonek.reconciler import Transition, reconcile
 from commonek.slack import send_task_message
+from commonek.tasks_status import get_task_index, task_details
+from commonek.tracing import traced
 
 # API clients
 storage_client = storage.Client()
 client = LoggingServiceV2Client()
+batch = None  # batch job client, only needed when a task stops running without succeeding
+subscriber = None  # pub/sub subscriber client, only needed by the batch consumer (get_status_batch)
 
+# Batch consumer: pull subscription of the task state change topic, drained up to STATUS_BATCH_MAX_SECONDS. The last
+# batch pulled still needs its queries and insert, within the 300s function timeout and ack deadline
+STATUS_SUBSCRIPTION = os.getenv("STATUS_SUBSCRIPTION", "job-dragen-task-state-change-pull")
+STATUS_BATCH_MAX_MESSAGES = int(os.getenv("STATUS_BATCH_MAX_MESSAGES", "500"))  # messages per pull (up to 1000)
+STATUS_BATCH_MAX_SECONDS = float(os.getenv("STATUS_BATCH_MAX_SECONDS", "150"))
+VERIFY_TASKS_PER_QUERY = 100  # task ids per Cloud Logging filter
+# PREEMPTED rows are written before the state row of the same event, so that the latest status of the task is the state
+PREEMPTED_OFFSET = datetime.timedelta(seconds=1)
 
+
+@traced("logging.is_dragen_success_check_logging")
 def is_dragen_success_check_logging(job_uid: str, task_id: str):
     def get_task_log_entries(payload_patterns: List[str]):
         Logger.info(
@@ -73,32 +99,48 @@ def is_dragen_success_check_logging(job_uid: str, task_id: str):
     return False
 
 
+def get_previous_state(data: str):
+    """previousState of the Task state was updated message, such as
+    Task state was updated: taskUID=..., previousState=RUNNING, currentState=FAILED, timestamp=..."""
+    match = re.search(r"previousState=([A-Z_]+)", data)
+    return match.group(1) if match else None
+
+
+@traced("batch.is_task_preempted")
+def is_task_preempted(task_name: str) -> bool:
+    global batch
+    if not batch:
+        batch = batch_v1.BatchServiceClient()
+    try:
+        return is_preempted(batch.get_task(name=task_name))
+    except Exception as exc:
+        Logger.warning(f"is_task_preempted - could not get task {task_name}: {exc}")
+        return False
+
+
 def get_task_info_from_bq(job_uid: str, task_id: str):
-    regex = r"group0-(\d+)"
-    match = re.search(regex, task_id)
-    if match:
-        task_index = match.group(1)
-    else:
+    task_index = get_task_index(task_id)
+    if task_index is None:
         Logger.warning(
             f"get_task_info_from_bq could not extract task index from task_id = {task_id}"
         )
-        return None
+        return None, None, None, None, None, None
 
     table_id = f"`{PROJECT_ID}.{BIGQUERY_DB_JOB_ARRAY}`"
 
-    sql = f"SELECT sample_id, input_path, output_path, input_type, command FROM {table_id} WHERE " \
+    sql = f"SELECT sample_id, input_path, output_path, input_type, command, job_label FROM {table_id} WHERE " \
           f"job_id='{job_uid}' and batch_task_index={task_index}"
 
     results = run_query(sql)
     if results:
         for row in results:
-            return row.sample_id, row.input_path, row.output_path, row.input_type, row.command
-    else:
-        return None, None, None, None, None
+            return row.sample_id, row.input_path, row.output_path, row.input_type, row.command, row.job_label
+    return None, None, None, None, None, None
 
 
+@flush_logs
 def get_status(event, context):
-    Logger.info(f"============================ get_status - Event received {event} with context {context}")
+    Logger.info("============================ get_status - Event received %s with context %s", event, context)
 
     data = base64.b64decode(event["data"]).decode("utf-8")
     Logger.info(f"get_status - data={data}")
@@ -121,12 +163,29 @@ def get_status(event, context):
     )
 
     job_name = task_name.split("/")[5]
-    sample_id, input_path, output_path, input_type, command = get_task_info_from_bq(job_uid=job_uid, task_id=task_id)
+    sample_id, input_path, output_path, input_type, command, job_label = get_task_info_from_bq(job_uid=job_uid,
+                                                                                              task_id=task_id)
+    details = task_details(get_task_index(task_id), sample_id, job_label, job_name)
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    if state != SUCCEEDED and get_previous_state(data) == RUNNING and is_task_preempted(task_name):
+        # Spot VM preemption, counted separately from the task failures (the task is retried)
+        Logger.warning(f"get_status - Task preempted for job_uid={job_uid}, task_id={task_id}, "
+                       f"sample_id={sample_id}")
+        save_task_to_bq(
+            job_uid=job_uid,
+            status=TASK_PREEMPTED,
+            task_id=task_id,
+            details=details,
+            timestamp=now - PREEMPTED_OFFSET,
+        )
 
     save_task_to_bq(
         job_uid=job_uid,
         status=state,
         task_id=task_id,
+        details=details,
+        timestamp=now,
     )
 
     if state == SUCCEEDED:
@@ -148,35 +207,57 @@ def get_status(event, context):
             job_uid=job_uid,
             status=verification_status,
             task_id=task_id,
+            details=details,
         )
         send_task_message(job_name=job_name, job_uid=job_uid, task_id=task_id, sample_id=sample_id,
                           status=verification_status,
-                          output_path=output_path)
+                          output_path=output_path, region=region)
+        settle_speculations([[job_name, task_id, verification_status == TASK_VERIFIED_OK]])
 
     elif state == FAILED:
         Logger.warning(f"get_status - Task Failed for job_uid={job_uid}, task_id={task_id}, "
                        f"sample_id={sample_id}")
-        send_task_message(job_name=job_name, job_uid=job_uid, task_id=task_id, sample_id=sample_id, status=state)
+        send_task_message(job_name=job_name, job_uid=job_uid, task_id=task_id, sample_id=sample_id, status=state,
+                          region=region)
+        settle_speculations([[job_name, task_id, False]])
     else:
         return
+    check_job_tail(job_name, region)
+
+
+def settle_speculations(completed_tasks: List[List]):
+    """Cancels the other attempt of the speculated tasks among the [job name, task id, verified] of completed
+    tasks (see speculation.py)."""
+    if not SPECULATION_PERCENTILE or not completed_tasks:
+        return
+    try:
+        settle_completed(completed_tasks)
+    except Exception as exc:
+        Logger.error(f"settle_speculations - could not settle the speculations of {completed_tasks}: {exc}")
+
+
+def check_job_tail(job_name: str, region: str):
+    """Starts the next job of jobs.csv once the job is down to its last tasks (see prefetch.py)."""
+    if not PREFETCH_ACTIVE_TASKS:
+        return
+    try:
+        prefetch_next_job(job_name=job_name, region=region)
+    except Exception as exc:
+        # the next job is still triggered by the scheduler when the job completes
+        Logger.error(f"check_job_tail - could not check the tasks left in {job_name}: {exc}")
 
 
 def save_task_to_bq(
     job_uid,
     status,
     task_id,
+    details: Optional[Dict] = None,
+    timestamp: Optional[datetime.datetime] = None,
 ):
-    now = datetime.datetime.now(datetime.timezone.utc)
+    now = timestamp or datetime.datetime.now(datetime.timezone.utc)
     table_id = f"{PROJECT_ID}.{BIGQUERY_DB_TASKS}"
     errors = stream_data_to_bigquery(
-        [
-            {
-                "job_id": job_uid,
-                "task_id": task_id,
-                "status": status,
-                "timestamp": now.strftime("%Y-%m-%d %H:%M:%S"),
-            }
-        ], table_id
+        [task_row(job_uid, task_id, status, now.strftime("%Y-%m-%d %H:%M:%S"), details)], table_id
     )
     if not errors:
         Logger.info(
@@ -190,6 +271,198 @@ def save_task_to_bq(
         )
 
 
+class TaskEvent:
+    """Task state change notification of Batch."""
+    __slots__ = ["job_uid", "state", "task_name", "task_id", "region", "data", "timestamp", "recorded"]
+
+    def __init__(self, attributes: Dict[str, str], data: str, timestamp: Optional[datetime.datetime] = None,
+                 recorded: bool = False):
+        self.job_uid = attributes["JobUID"]
+        self.state = attributes["NewTaskState"]
+        self.task_name = attributes["TaskName"]
+        self.task_id = attributes["TaskUID"]
+        self.region = attributes.get("Region")
+        self.data = data
+        self.timestamp = timestamp or datetime.datetime.now(datetime.timezone.utc)
+        self.recorded = recorded  # status row already written (replayed by the reconciler for its verification)
+
+    @property
+    def task_index(self) -> Optional[int]:
+        return get_task_index(self.task_id)
+
+
+def get_tasks_info_from_bq(job_uid: str, task_indices: List[int]) -> Dict[int, List]:
+    """{batch_task_index: [sample_id, output_path, job_label]} of the tasks of the job, with a single query."""
+    table_id = f"`{PROJECT_ID}.{BIGQUERY_DB_JOB_ARRAY}`"
+    sql = f"SELECT batch_task_index, sample_id, output_path, job_label FROM {table_id} WHERE " \
+          f"job_id='{job_uid}' and batch_task_index IN ({', '.join(str(index) for index in task_indices)})"
+    results = run_query(sql)
+    return {int(row.batch_task_index): [row.sample_id, row.output_path, row.job_label] for row in results or []}
+
+
+@traced("logging.get_verified_task_ids")
+def get_verified_task_ids(job_uid: str, task_ids: List[str]) -> Set[str]:
+    """Task ids of the job with a DRAGEN success entry in their logs, one log query per VERIFY_TASKS_PER_QUERY
+    tasks."""
+    verified = set()
+    pattern = "|".join(DRAGEN_SUCCESS_ENTRIES)
+    for start in range(0, len(task_ids), VERIFY_TASKS_PER_QUERY):
+        tasks_filter = " OR ".join(f"resource.labels.task_id=task/{task_id}/0/0"
+                                   for task_id in task_ids[start:start + VERIFY_TASKS_PER_QUERY])
+        filters = (
+            f"logName=projects/{PROJECT_ID}/logs/batch_task_logs AND resource.labels.job={job_uid} "
+            f"AND ({tasks_filter}) AND textPayload=~\"{pattern}\""
+        )
+        iterator = client.list_log_entries({"resource_names": [f"projects/{PROJECT_ID}"], "filter": filters})
+        for entry in iterator:
+            match = re.match(r"task/(.+)/0/0$", entry.resource.labels.get("task_id", ""))
+            if match:
+                verified.add(match.group(1))
+    return verified
+
+
+def process_task_events(events: List[TaskEvent]) -> int:
+    """Handles the task events as get_status does, but grouped by job: the job_array lookup and the log
+    verification run once per job, and all the status rows are written with a single insert. Slack messages,
+    speculations and the next jobs are only handled once the rows are written, since a failed insert raises and the
+    events are delivered again.
+
+    Returns:
+        Number of status rows written.
+    """
+    by_job: Dict[str, List[TaskEvent]] = {}
+    seen = set()
+    for event in events:
+        # Pub/Sub delivers at least once; a task retried by Batch has several RUNNING events, at different times
+        key = (event.task_id, event.state, event.timestamp)
+        if key not in seen:
+            seen.add(key)
+            by_job.setdefault(event.job_uid, []).append(event)
+
+    rows = []
+    messages = []  # send_task_message arguments
+    completed_jobs = {}  # job name: region, of the jobs with completed tasks
+    completed_tasks = []  # [job name, task id, verified]
+    for job_uid, job_events in by_job.items():
+        indices = sorted({event.task_index for event in job_events if event.task_index is not None})
+        tasks_info = get_tasks_info_from_bq(job_uid, indices) if indices else {}
+        succeeded = [event.task_id for event in job_events if event.state == SUCCEEDED]
+        verified = get_verified_task_ids(job_uid, succeeded) if succeeded else set()
+        Logger.info(f"process_task_events - job_uid={job_uid}: {len(job_events)} events, "
+                    f"{len(verified)}/{len(succeeded)} succeeded tasks verified")
+
+        for event in job_events:
+            sample_id, output_path, job_label = tasks_info.get(event.task_index, [None, None, None])
+            job_name = event.task_name.split("/")[5]
+            details = task_details(event.task_index, sample_id, job_label, job_name)
+            event_time = event.timestamp.astimezone(datetime.timezone.utc)
+            timestamp = event_time.strftime("%Y-%m-%d %H:%M:%S")
+            if (not event.recorded and event.state != SUCCEEDED and get_previous_state(event.data) == RUNNING
+                    and is_task_preempted(event.task_name)):
+                Logger.warning(f"process_task_events - Task preempted for job_uid={job_uid}, "
+                               f"task_id={event.task_id}, sample_id={sample_id}")
+                rows.append(task_row(job_uid, event.task_id, TASK_PREEMPTED,
+                                     (event_time - PREEMPTED_OFFSET).strftime("%Y-%m-%d %H:%M:%S"), details))
+            if not event.recorded:
+                rows.append(task_row(job_uid, event.task_id, event.state, timestamp, details))
+
+            if event.state == SUCCEEDED:
+                verification_status = TASK_VERIFIED_OK if event.task_id in verified else TASK_VERIFIED_FAILED
+                rows.append(task_row(job_uid, event.task_id, verification_status,
+                                     datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+                                     details))
+                messages.append(dict(job_name=job_name, job_uid=job_uid, task_id=event.task_id, sample_id=sample_id,
+                                     status=verification_status, output_path=output_path, region=event.region))
+                completed_tasks.append([job_name, event.task_id, verification_status == TASK_VERIFIED_OK])
+            elif event.state == FAILED:
+                Logger.warning(f"process_task_events - Task Failed for job_uid={job_uid}, "
+                               f"task_id={event.task_id}, sample_id={sample_id}")
+                messages.append(dict(job_name=job_name, job_uid=job_uid, task_id=event.task_id, sample_id=sample_id,
+                                     status=event.state, region=event.region))
+                completed_tasks.append([job_name, event.task_id, False])
+            if event.state in [SUCCEEDED, FAILED]:
+                completed_jobs[job_name] = event.region
+
+    if rows:
+        table_id = f"{PROJECT_ID}.{BIGQUERY_DB_TASKS}"
+        errors = stream_data_to_bigquery(rows, table_id)
+        if errors and isinstance(errors, list):
+            Logger.error(f"process_task_events - Encountered errors while inserting {len(rows)} rows: {errors}")
+            raise RuntimeError(f"Could not insert the status rows into {table_id}")
+    for message in messages:
+        send_task_message(**message)
+    settle_speculations(completed_tasks)
+    for job_name, region in completed_jobs.items():
+        check_job_tail(job_name, region)
+    return len(rows)
+
+
+def task_row(job_uid, task_id, status, timestamp, details: Optional[Dict] = None):
+    row = {"job_id": job_uid, "task_id": task_id, "status": status, "timestamp": timestamp}
+    row.update(details or {})
+    return row
+
+
+def drain_subscription(subscription: str = STATUS_SUBSCRIPTION, max_messages: int = STATUS_BATCH_MAX_MESSAGES,
+                       max_seconds: float = STATUS_BATCH_MAX_SECONDS) -> Dict:
+    """Pulls and handles the task events until the subscription is empty or the time is up. Messages are
+    acknowledged once their status rows are written, so failed batches are delivered again."""
+    global subscriber
+    if not subscriber:
+        from google.cloud import pubsub_v1  # only imported by the batch consumer
+        subscriber = pubsub_v1.SubscriberClient()
+    subscription_path = subscriber.subscription_path(PROJECT_ID, subscription)
+
+    summary = {"pulls": 0, "events": 0, "rows": 0}
+    deadline = time.monotonic() + max_seconds
+    while time.monotonic() < deadline:
+        response = subscriber.pull(request={"subscription": subscription_path, "max_messages": max_messages})
+        received = list(response.received_messages)
+        if not received:
+            break
+        summary["pulls"] += 1
+        events = []
+        for received_message in received:
+            message = received_message.message
+            try:
+                events.append(TaskEvent(dict(message.attributes), message.data.decode("utf-8"),
+                                        message.publish_time))
+            except KeyError:
+                Logger.error(f"drain_subscription - message is not in the expected format: {message}")
+        summary["rows"] += process_task_events(events)
+        summary["events"] += len(events)
+        subscriber.acknowledge(request={"subscription": subscription_path,
+                                        "ack_ids": [received_message.ack_id for received_message in received]})
+    Logger.info(f"drain_subscription - {subscription}: {summary}")
+    return summary
+
+
+def replay_transitions(transitions: List[Transition]) -> int:
+    """Handles the missing transitions found by the reconciler as their task events."""
+    return process_task_events([TaskEvent(transition.attributes, transition.data, transition.timestamp,
+                                          transition.recorded) for transition in transitions])
+
+
+@flush_logs
+def get_status_batch(request):
+    """HTTP entry point (called by Cloud Scheduler) of the batch consumer of the task state events."""
+    return json.dumps(drain_subscription())
+
+
+@flush_logs
+def monitor_stragglers(request):
+    """HTTP entry point (called by Cloud Scheduler) of the straggler monitor, launching speculative duplicates."""
+    return json.dumps(monitor())
+
+
+@flush_logs
+def reconcile_task_states(request):
+    """HTTP entry point (called by Cloud Scheduler) of the reconciler, replaying the missed task events."""
+    summary = reconcile(replay=replay_transitions)
+    summary.pop("transitions")
+    return json.dumps(summary)
+
+
 if __name__ == "__main__":
     # Using Logger (cram)
     # get_status({
@@ -0,0 +1,869 @@
+#  Copyright 2022 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from google.api_core.exceptions import NotFound
+from google.cloud import batch_v1
+from google.cloud import storage
+
+from commonek.bq_helper import stream_data_to_bigquery
+from commonek.config_loader import load_json_config
+from commonek.csv_helper import trigger_job_from_csv
+from commonek.dedup import DEDUP_ALIAS, DEDUP_OFF
+from commonek.dedup import config_hash
+from commonek.dedup import dedup_samples
+from commonek.dedup import get_dedup_mode
+from commonek.dedup import save_aliases
+from commonek.dragen_command_helper import DragenCommand
+from commonek.dragen_command_helper import validate_dragen_options
+from commonek.gcs_helper import content_hash
+from commonek.gcs_helper import file_exists
+from commonek.gcs_helper import get_rows_from_file
+from commonek.gcs_helper import preflight_check_inputs
+from commonek.helper import get_secret_value
+from commonek.helper import split_uri_2_bucket_prefix
+from commonek.job_dag import find_dag_spec, start_dag
+from commonek.logging import Logger, flush_logs
+from commonek.params import BIGQUERY_DB_JOB_ARRAY
+from commonek.params import CRAM_INPUT
+from commonek.params import FASTQ_INPUT
+from commonek.params import FASTQ_LIST_INPUT
+from commonek.params import INPUT_PATH
+from commonek.params import JOBS_LIST_URI
+from commonek.params import JOB_LABEL_NAME
+from commonek.params import JOB_LIST_FILE_NAME
+from commonek.params import NETWORK
+from commonek.params import OUTPUT_PATH
+from commonek.params import PROJECT_ID
+from commonek.params import REGION
+from commonek.params import SAMPLE_ID
+from commonek.params import SUBNET
+from commonek.params import TRIGGER_FILE_NAME
+from commonek.admission import DEFAULT_MACHINE
+from commonek.admission import machine_vcpus
+from commonek.phase_pipeline import PhasePipeline, PipelineAbort
+from commonek.placement import BatchRegion
+from commonek.placement import SHARD_LABEL
+from commonek.placement import get_region_loads
+from commonek.placement import plan_shards
+from commonek.placement import shard_label
+from commonek.provisioning import PROVISIONING_LABEL
+from commonek.provisioning import STANDARD
+from commonek.provisioning import get_lifecycle_policies
+from commonek.provisioning import get_provisioning_model
+from commonek.provisioning import provisioning_label
+from commonek.provisioning import set_provisioning_model
+from commonek.runtime_estimator import estimate_run_options
+from commonek.runtime_estimator import get_duration_history
+from commonek.runtime_estimator import needs_estimate
+from commonek.sample_table import SampleTable
+from commonek.tracing import span
+from commonek.tracing import traced
+
+BATCH_CONFIG_FILE_NAME = "batch_config.json"
+JOB_ARRAY_INSERT_BATCH_SIZE = 500  # rows per BigQuery insert request
+# API clients
+gcs = storage.Client()  # cloud storage
+batch = None  # batch job client
+
+JOB_NAME = os.getenv("JOB_NAME_SHORT", "job-dragen")
+
+# Secrets
+S3_ACCESS_KEY_SECRET_NAME = os.getenv("S3_ACCESS_KEY_SECRET_NAME", "batchS3AccessKey")
+S3_SECRET_KEY_SECRET_NAME = os.getenv("S3_SECRET_KEY_SECRET_NAME", "batchS3SecretKey")
+ILLUMINA_LIC_SERVER_SECRET_NAME = os.getenv(
+    "ILLUMINA_LIC_SERVER_SECRET_NAME", "illuminaLicServer"
+)
+JARVICE_API_KEY_SECRET_NAME = os.getenv("JARVICE_API_KEY_SECRET_NAME", "jarviceApiKey")
+JARVICE_API_USERNAME_SECRET_NAME = os.getenv(
+    "JARVICE_API_USERNAME_SECRET_NAME", "jarviceApiUsername"
+)
+
+
+SERVICE_ACCOUNT_EMAIL = os.getenv(
+    "JOB_SERVICE_ACCOUNT", f"illumina-script-sa@{PROJECT_ID}.iam.gserviceaccount.com"
+)
+DRAGEN_APP_DEFAULT = "illumina-dragen_3_7_8n"
+IMAGE_URI_DEFAULT = os.getenv(
+    "IMAGE_URI", "us-docker.pkg.dev/jarvice/images/jarvice-dragen-service:1.0-rc.5"
+)
+PUBSUB_TOPIC_BATCH_TASK_STATE_CHANGE = os.getenv(
+    "PUBSUB_TOPIC_BATCH_TASK_STATE_CHANGE", "job-dragen-task-state-change-topic"
+)
+PUBSUB_TOPIC_BATCH_JOB_STATE_CHANGE = os.getenv(
+    "PUBSUB_TOPIC_BATCH_JOB_STATE_CHANGE", "job-dragen-job-state-change-topic"
+)
+
+
+def load_config(bucket_name, file_path, recursive_find=False):
+    Logger.info(f"load_config with bucket={bucket_name}, file_path={file_path}")
+    try:
+        data = load_json_config(bucket_name, file_path, recursive_find=recursive_find)
+        if data is not None:
+            return data
+        Logger.error(f"Error: file gs://{bucket_name}/{file_path} does not exist")
+    except Exception as e:
+        Logger.error(
+            f"Error: while obtaining file from GCS gs://{bucket_name}/{file_path} {e}"
+        )
+    return {}
+
+
+@flush_logs
+def run_dragen_job(event, context):
+    Logger.info("============================ run_dragen_job - Event received %s with context %s", event, context)
+    bucket_name, file_path = None, None
+
+    if "bucket" in event:
+        bucket_name = event["bucket"]
+
+    if "name" in event:
+        file_path = event["name"]
+
+    assert bucket_name, "Bucket unknown where to run pipeline"
+    assert file_path, "Filename unknown"
+
+    Logger.info(
+        f"run_dragen_job - Using PROJECT_ID = {PROJECT_ID}, region = {REGION},"
+        f" job_name = {JOB_NAME}, network = {NETWORK},"
+        f" subnet = {SUBNET}, "
+        f"service_account_email = {SERVICE_ACCOUNT_EMAIL}"
+    )
+
+    # file=inputs/START_PIPELINE
+    # bucket
+    Logger.info(
+        f"run_dragen_job - Received GCS finalized event on bucket={bucket_name}, file_path={file_path} "
+    )
+    filename = os.path.basename(file_path)
+
+    if filename != TRIGGER_FILE_NAME:
+        Logger.info(
+            f"run_dragen_job - Skipping action on {filename}, since waiting for {TRIGGER_FILE_NAME} to trigger pipe-line"
+        )
+        return
+
+    Logger.info(f"run_dragen_job - handling {TRIGGER_FILE_NAME}...")
+    bucket = gcs.bucket(bucket_name)
+
+    dirs = os.path.dirname(file_path)
+    prefix = ""
+    if dirs is not None and dirs != "":
+        prefix = dirs + "/"
+
+    file_string = ""
+    batch_config_file_name = BATCH_CONFIG_FILE_NAME
+    job_labels = None
+    run_options_override = None
+
+    try:
+        blob = bucket.blob(file_path)
+        file_string = blob.download_as_text()
+    except NotFound as exc:
+        Logger.warning(f"File not found {exc}")
+        # Still we want to proceed, will be same behaviour as empty file uploaded
+
+    if (
+        file_string != ""
+    ):  # START_PIPELINE can contain additional info, that could be parsed
+        try:
+            json_string = json.loads(file_string)
+            job_labels = {JOB_LABEL_NAME: json_string[JOB_LABEL_NAME]}
+            batch_config_file_name = json_string["config"]
+            # set by the scheduler, such as parallelism reduced by the admission control
+            run_options_override = json_string.get("run_options")
+            Logger.info(
+                f"run_dragen_job - job_labels = {job_labels}, config_file_name={batch_config_file_name}, "
+                f"run_options_override={run_options_override}"
+            )
+        except Exception as exc:
+            Logger.warning(
+                f"Caught exception when parsing json file {file_string} - {exc}"
+            )
+            pass
+
+        batch_config_file_path = f"{prefix}{batch_config_file_name}"
+        return create_batch_job(bucket_name, batch_config_file_path, job_labels, run_options_override)
+
+    # Check if a DAG of jobs (jobs_dag.json/yaml) is located in the bucket
+    dag_spec_path = find_dag_spec(bucket_name, prefix)
+    if dag_spec_path:
+        Logger.info(f"run_dragen_job - Handling {dag_spec_path}... ")
+        start_dag(bucket_name, dag_spec_path)
+        return
+
+    jobs_list_path = f"{prefix}{JOB_LIST_FILE_NAME}"
+    # Check if jobs.csv file or if jobs list is located in the bucket
+    if file_exists(bucket_name, jobs_list_path):
+        Logger.info(f"run_dragen_job - Handling {jobs_list_path}... ")
+        bucket = gcs.get_bucket(bucket_name)
+        jobs_list_blob = bucket.blob(jobs_list_path)
+        csv_string = jobs_list_blob.download_as_text()
+        Logger.info("run_dragen_job - csv_string = %s", csv_string)
+
+        # Make sure that job_list file is uploaded to where scheduler is expected to read it from
+        # (cannot have multiple scheduled jobs!)
+        if f"gs://{bucket_name}/{jobs_list_path}" != JOBS_LIST_URI:
+            Logger.info(
+                f"run_dragen_job - Copying gs://{bucket_name}/{jobs_list_path} to "
+                f"location={JOBS_LIST_URI} where scheduler expects it to be... "
+            )
+            bucket_name_jobs_list, jobs_list_uri_path = split_uri_2_bucket_prefix(
+                JOBS_LIST_URI
+            )
+            bucket = gcs.get_bucket(bucket_name_jobs_list)
+            jobs_list_blob_copy = bucket.blob(jobs_list_uri_path)
+            jobs_list_blob_copy.upload_from_string(csv_string)
+
+        # Trigger First job in the list
+        trigger_job_from_csv(bucket_name, jobs_list_path)
+        return
+
+    batch_config_file_path = f"{prefix}{batch_config_file_name}"
+    return create_batch_job(bucket_name, batch_config_file_path, job_labels)
+
+
+def create_batch_job(bucket_name, batch_config_path, job_labels, run_options_override=None):
+    """Creates the Batch job for the batch configuration.
+
+    Phases not depending on each other (secrets check, DRAGEN config, input list and input path discovery,
+    runtime history, load of the Batch regions) run concurrently, the job_array rows (and the input_aliases rows of
+    the duplicate inputs) are written to BigQuery after the job is submitted.
+
+    Returns:
+        [(shard, created job)], a single job unless the job is split across regions.
+    """
+    Logger.info(f"create_batch_job - config_path={batch_config_path}")
+    pipeline = PhasePipeline("create_batch_job")
+    pipeline.add("secrets", check_secrets)
+    pipeline.add("batch_config", lambda: get_batch_config(bucket_name, batch_config_path, run_options_override))
+    pipeline.add("dragen_config", get_dragen_config, depends_on=["batch_config"])
+    pipeline.add("input_list", get_input_list_samples, depends_on=["batch_config"])
+    pipeline.add("input_path", get_input_path_samples, depends_on=["batch_config"])
+    pipeline.add("history", get_runtime_history, depends_on=["batch_config", "dragen_config"])
+    pipeline.add("samples", get_valid_samples, depends_on=["batch_config", "input_list", "input_path"])
+    pipeline.add(
+        "dedup",
+        lambda batch_config, dragen_config, samples: dedup_inputs(batch_config, dragen_config, samples, job_labels),
+        depends_on=["batch_config", "dragen_config", "samples"],
+    )
+    pipeline.add("tasks", get_job_tasks, depends_on=["batch_config", "dragen_config", "samples", "secrets", "dedup"])
+    pipeline.add("region_loads", get_region_loads)
+    pipeline.add(
+        "submit",
+        lambda batch_config, dragen_config, tasks, history, region_loads: submit_job(
+            batch_config, dragen_config, tasks, history, region_loads, job_labels),
+        depends_on=["batch_config", "dragen_config", "tasks", "history", "region_loads"],
+    )
+    pipeline.add("job_array", save_job_array_to_bq, depends_on=["batch_config", "tasks", "submit", "dedup"])
+    pipeline.add(
+        "aliases",
+        lambda dedup, tasks, submit: save_input_aliases(dedup, tasks, submit, job_labels),
+        depends_on=["dedup", "tasks", "submit"],
+    )
+    try:
+        results = pipeline.run()
+    except PipelineAbort as exc:
+        Logger.error(f"create_batch_job - {exc}")
+        return None
+    return results["submit"]
+
+
+def check_secrets():
+    """Checks that the secrets used by the tasks can be retrieved."""
+    names = [S3_ACCESS_KEY_SECRET_NAME, S3_SECRET_KEY_SECRET_NAME, ILLUMINA_LIC_SERVER_SECRET_NAME,
+             JARVICE_API_KEY_SECRET_NAME, JARVICE_API_USERNAME_SECRET_NAME]
+    with ThreadPoolExecutor(max_workers=len(names)) as executor:
+        values = list(executor.map(lambda name: get_secret_value(name, PROJECT_ID), names))
+    for name, value in zip(names, values):
+        assert value, f"Could not retrieve secret {name}"
+
+
+def get_batch_config(bucket_name, batch_config_path, run_options_override=None):
+    batch_config = load_config(bucket_name=bucket_name, file_path=batch_config_path)
+    if batch_config == {}:
+        raise PipelineAbort("Error: batch_options could not be retrieved.")
+    if run_options_override:
+        batch_config.setdefault("run_options", {}).update(run_options_override)
+    Logger.info(f"create_batch_job - batch_options={batch_config}")
+    input_type = batch_config.get("input_options", {}).get("input_type") or ""
+    if input_type.lower() not in [CRAM_INPUT, FASTQ_INPUT]:
+        raise PipelineAbort(f"Error, unsupported type {input_type}")
+    return batch_config
+
+
+def get_dragen_config(batch_config):
+    """(dragen_options, jarvice_options) from the DRAGEN configuration file."""
+    input_option = batch_config.get("input_options", {})
+    config_file_name = input_option.get("config", None)
+    if not config_file_name:
+        raise PipelineAbort(f"Error, config path is not properly specified for the input {input_option}")
+    config_bucket, config_prefix = split_uri_2_bucket_prefix(config_file_name)
+    config_options = load_config(config_bucket, config_prefix)
+    if config_options == {}:
+        raise PipelineAbort(f"Error, could not load configuration options from {config_file_name}")
+    dragen_options, jarvice_options = get_options(config_options)
+    # a mistyped option would otherwise only fail the tasks, once the VMs and the Jarvice jobs are started
+    errors = validate_dragen_options(dragen_options)
+    if errors:
+        raise PipelineAbort(f"Error, invalid dragen_options in {config_file_name}: {'; '.join(errors)}")
+    return dragen_options, jarvice_options
+
+
+def get_input_list_samples(batch_config):
+    input_list_uri = batch_config.get("input_options", {}).get("input_list", None)
+    if not input_list_uri:
+        return SampleTable()
+    return SampleTable.from_rows(get_rows_from_file(input_list_uri))
+
+
+def get_input_path_samples(batch_config):
+    input_option = batch_config.get("input_options", {})
+    input_path = input_option.get("input_path", None)
+    if not input_path:
+        return SampleTable()
+    if input_option["input_type"].lower() == CRAM_INPUT:
+        extensions = [".cram"]
+    else:
+        extensions = [".ora", ".gz"]
+    return get_samples_list_from_path(input_path, extensions)
+
+
+def get_runtime_history(batch_config, dragen_config):
+    """Durations of the previous tasks, only queried when run_options need to be estimated."""
+    if not needs_estimate(batch_config.get("run_options", {})):
+        return None
+    _, jarvice_options = dragen_config
+    return get_duration_history(jarvice_options.get("dragen_app", DRAGEN_APP_DEFAULT))
+
+
+def get_valid_samples(batch_config, input_list, input_path):
+    """Samples from the input list and the input path, without those failing the pre-flight check."""
+    samples = input_list
+    samples.extend(input_path)
+    if len(samples) == 0:
+        raise PipelineAbort("Error, no input files detected")
+    Logger.info(f"create_batch_job - samples_list - {len(samples)} loaded")
+
+    if batch_config.get("run_options", {}).get("preflight_check", True):
+        preflight_samples(samples, batch_config["input_options"]["input_type"])
+        if len(samples) == 0:
+            raise PipelineAbort("Error, no valid input files left after pre-flight check")
+    return samples
+
+
+def dedup_inputs(batch_config, dragen_config, samples, job_labels=None):
+    """(mode, config hash, duplicates) of the CRAM inputs, the duplicates being dropped from the samples.
+
+    None when the deduplication is off (run_options.dedup or DEDUP_MODE), or for fastq inputs (a single task).
+    """
+    mode = get_dedup_mode(batch_config.get("run_options", {}))
+    if mode == DEDUP_OFF or batch_config["input_options"]["input_type"].lower() != CRAM_INPUT:
+        return None
+    dragen_options, jarvice_options = dragen_config
+    config = config_hash(dragen_options, jarvice_options)
+    try:
+        duplicates = dedup_samples(samples, config, mode)
+    except Exception as exc:
+        # the index is only an optimization, the samples are processed as listed
+        Logger.error(f"dedup_inputs - could not deduplicate the inputs: {exc}")
+        return mode, config, []
+    if len(samples) == 0:
+        if mode == DEDUP_ALIAS:
+            save_aliases(duplicates, config, (job_labels or {}).get(JOB_LABEL_NAME))
+        raise PipelineAbort("Error, all the inputs were processed before")
+    return mode, config, duplicates
+
+
+def save_input_aliases(dedup, tasks, submit, job_labels):
+    """input_aliases rows of the duplicate inputs, with the output directory and job of their originals."""
+    if dedup is None:
+        return 0
+    mode, config, duplicates = dedup
+    if mode != DEDUP_ALIAS or not duplicates:
+        return 0
+    _, task_table = tasks
+    job_names = [None] * len(task_table)
+    for shard, created_job in submit:
+        job_names[shard.start:shard.stop] = [created_job.name.split("/")[-1]] * (shard.stop - shard.start)
+    save_aliases(duplicates, config, (job_labels or {}).get(JOB_LABEL_NAME), task_table, job_names)
+    return len(duplicates)
+
+
+def get_job_tasks(batch_config, dragen_config, samples, secrets, dedup):
+    """(command, tasks) of the job, tasks being the SampleTable with one row per task."""
+    dragen_options, jarvice_options = dragen_config
+    return task_info(
+        dragen_options=dragen_options,
+        jarvice_options=jarvice_options,
+        samples=samples,
+        input_type=batch_config["input_options"]["input_type"],
+    )
+
+
+def submit_job(batch_config, dragen_config, tasks, history, region_loads, job_labels):
+    """Submits the job in the region with the most room, or one job per region for the shards of a large job."""
+    _, jarvice_options = dragen_config
+    command, task_table = tasks
+    run_options = estimate_run_options(
+        run_options=batch_config.get("run_options", {}),
+        input_sizes=task_table.input_sizes,
+        dragen_app=jarvice_options.get("dragen_app", DRAGEN_APP_DEFAULT),
+        history=history,
+    )
+    shards = plan_shards(
+        task_count=len(task_table),
+        vcpus_per_task=machine_vcpus(run_options.get("machine", DEFAULT_MACHINE)),
+        parallelism=run_options.get("parallelism", 3),
+        loads=region_loads,
+    )
+    submitted = []
+    for index, shard in enumerate(shards):
+        shard_labels = job_labels
+        if len(shards) > 1:
+            shard_labels = dict(job_labels or {}, **{SHARD_LABEL: shard_label(index, len(shards))})
+        created_job = create_script_job(
+            run_options=dict(run_options, parallelism=shard.parallelism),
+            jarvice_options=jarvice_options,
+            job_labels=shard_labels,
+            command=command,
+            tasks=task_table if len(shards) == 1 else task_table.slice(shard.start, shard.stop),
+            region=shard.region,
+        )
+        submitted.append((shard, created_job))
+    return submitted
+
+
+def preflight_samples(samples: SampleTable, input_type):
+    """Drop samples whose input object is missing or empty, before any VM or license slot is used.
+
+    The samples are filtered in place, and the sizes (in bytes) and content hashes of their inputs are recorded.
+    """
+    uris = samples.column(INPUT_PATH)
+    preflight = preflight_check_inputs(uris)
+    samples.input_sizes = [preflight.get_size(uri) for uri in uris]
+    samples.input_hashes = [preflight.get_hash(uri) or key for uri, key in zip(uris, samples.input_hashes)]
+    if not preflight.missing and not preflight.empty:
+        return samples
+
+    if input_type.lower() == FASTQ_INPUT:
+        # All fastq files make up a single command, so there is nothing to run without any of them
+        Logger.error(
+            f"preflight_samples - Error, fastq inputs are missing or empty: "
+            f"missing={preflight.missing}, empty={preflight.empty}"
+        )
+        samples.keep([])
+        return samples
+
+    valid = []
+    for index, (sample_id, uri) in enumerate(zip(samples.column(SAMPLE_ID), uris)):
+        if not preflight.is_ok(uri):
+            Logger.error("preflight_samples - Excluding sample %s, input %s is not usable", sample_id, uri,
+                         sample=True)
+            continue
+        valid.append(index)
+    samples.keep(valid)
+    return samples
+
+
+def task_info(dragen_options, jarvice_options, samples: SampleTable, input_type):
+    date_str = datetime.datetime.now(datetime.timezone.utc).strftime(
+        "%Y-%m-%d-%H-%M-%S"
+    )
+    replace_options = [("<date>", date_str)]
+    if input_type == FASTQ_INPUT:
+        # fastq files - combine all inputs in one command, as a single task
+        inputs = ""
+        for index, input_file in enumerate(samples.column(INPUT_PATH)):
+            inputs = inputs + f" -{index + 1} {input_file} "
+
+        columns = {INPUT_PATH: [inputs.replace("gs://", "s3://")]}
+        if "--output-directory" in dragen_options:
+            columns[OUTPUT_PATH] = [
+                dragen_options.get("--output-directory").replace("<date>", date_str)
+            ]
+        sizes = samples.input_sizes
+        tasks = SampleTable(columns, [None if None in sizes else sum(sizes)])
+        inputs = [(None, "${INPUT_PATH}")]
+        command = get_task_command(
+            dragen_options=dragen_options,
+            jarvice_options=jarvice_options,
+            inputs=inputs,
+            replace_options=replace_options,
+        )
+
+        return command, tasks
+    elif input_type == CRAM_INPUT:
+        # one task per sample, the columns of the samples become the task environments
+        samples.set_column(INPUT_PATH, [uri.replace("gs://", "s3://") for uri in samples.column(INPUT_PATH)])
+        if "--output-directory" in dragen_options:
+            output_directory = dragen_options.get("--output-directory").replace("<date>", date_str)
+            samples.set_column(OUTPUT_PATH, [output_directory.replace("${SAMPLE_ID}", sample_id)
+                                             for sample_id in samples.column(SAMPLE_ID)])
+        inputs = [("--cram-input", "${INPUT_PATH}")]
+        command = get_task_command(
+            dragen_options=dragen_options,
+            jarvice_options=jarvice_options,
+            inputs=inputs,
+            replace_options=replace_options,
+        )
+
+        return command, samples
+
+    elif input_type == FASTQ_LIST_INPUT:
+        inputs = [("--fastq-list", "")]  # TODO
+        Logger.error("Method Not implemented yet")
+    else:
+        Logger.error(f"Error, unsupported input_type {input_type}")
+
+    return None, None
+
+
+@traced("gcs.get_samples_list_from_path")
+def get_samples_list_from_path(path_uri: str, extensions: List[str]):
+    Logger.info(f"get_samples_list_from_path - {path_uri}")
+    bucket_name, prefix = split_uri_2_bucket_prefix(path_uri)
+    if prefix != "":
+        prefix = prefix + "/"
+
+    samples = SampleTable()
+
+    # for b in gcs.list_blobs(bucket_name, prefix=f"{dir_name}", delimiter="/"):
+    for b in gcs.list_blobs(bucket_name, prefix=f"{prefix}"):
+        for extension in extensions:
+            if b.name.lower().endswith(extension.lower()):
+                sample_name = os.path.splitext(os.path.basename(b.name))[0]
+                samples.append(sample_name, f"s3://{bucket_name}/{b.name}", b.size,
+                               content_hash(b.size, b.md5_hash, b.crc32c))
+
+    Logger.info("get_samples_list_from_path - %s samples", len(samples))
+    return samples
+
+
+def get_dragen_command(dragen_command_options, replacements=None):
+    options = {}
+    for field in dragen_command_options:
+        value = dragen_command_options[field]
+        if replacements:
+            for r, s in replacements:
+                value = value.replace(r, s)
+        options[field] = value
+    return options
+
+
+def get_task_command(dragen_options, jarvice_options, inputs, replace_options):
+    Logger.info(
+        f"Using PROJECT_ID = {PROJECT_ID}, region = {REGION},"
+        f" job_name = {JOB_NAME}, network = {NETWORK},"
+        f" subnet = {SUBNET}, "
+        f"service_account_email = {SERVICE_ACCOUNT_EMAIL}"
+    )
+
+    dragen_app = jarvice_options.get("dragen_app", DRAGEN_APP_DEFAULT)
+    api_host = jarvice_options.get("api_host", "https://illumina.nimbix.net/api")
+    jarvice_machine_type = jarvice_options.get("jarvice_machine_type", "nx1")
+    stub_script = jarvice_options.get("stub", None)
+
+    dragen_options_replaced = get_dragen_command(dragen_options, replace_options)
+    launcher_options = [
+        ("--api-host", api_host),
+        ("--machine", jarvice_machine_type),
+        ("--dragen-app", dragen_app),
+        ("--google-sa", SERVICE_ACCOUNT_EMAIL),
+    ]
+    dragen_command = DragenCommand.from_options(
+        launcher_options, inputs + list(dragen_options_replaced.items()), stub_script)
+    Logger.info(f"DRAGEN Command: {dragen_command}")
+    return dragen_command
+
+
+def get_options(config):
+    dragen_options = config.get("dragen_options", {})
+    assert dragen_options != {}, "Error: dragen_options could not be retrieved"
+
+    jarvice_options = config.get("jarvice_options", {})
+    assert jarvice_options != {}, "Error: jarvice_options could not be retrieved"
+
+    return dragen_options, jarvice_options
+
+
+def create_script_job(
+    run_options,
+    command: DragenCommand,
+    jarvice_options,
+    job_labels,
+    tasks: SampleTable,
+    region: BatchRegion = None,
+):
+    """
+    This method shows how to create a sample Batch Job that will run
+    a simple command on Cloud Compute instances.
+
+    Returns:
+        A job object representing the job created.
+    """
+
+    image_uri = jarvice_options.get("image_uri", IMAGE_URI_DEFAULT)
+    entrypoint = jarvice_options.get("entrypoint", "/bin/bash")
+
+    # We can specify what resources are requested by each task.
+    resources = batch_v1.ComputeResource()
+
+    # in milliseconds per cpu-second. This means the task requires 2 whole CPUs.
+    resources.cpu_milli = run_options.get("cpu_milli", 1000)
+    resources.memory_mib = run_options.get("memory_mib", 512)
+    machine = run_options.get("machine", "e2-micro")
+    parallelism = run_options.get("parallelism", 3)
+    provisioning_model = get_provisioning_model(run_options)
+
+    # Tasks are grouped inside a job using TaskGroups.
+    # Currently, it's possible to have only one task group.
+    group = batch_v1.TaskGroup()
+    task_count = len(tasks)
+    Logger.info(
+        f"======== Creating job with {task_count} tasks and {parallelism} to be run in parallel ========"
+    )
+
+    group.parallelism = parallelism
+    group.task_environments = tasks.task_environments()
+    group.task_count_per_node = 1
+
+    # Policies are used to define on what kind of virtual machines the tasks will run on.
+    # In this case, we tell the system to use "e2-standard-4" machine type.
+    # Read more about machine types here: https://cloud.google.com/compute/docs/machine-types
+    policy = batch_v1.AllocationPolicy.InstancePolicy()
+
+    policy.machine_type = machine
+    # Spot VMs are much cheaper for the driver VM, which mostly waits on the remote DRAGEN service
+    set_provisioning_model(policy, provisioning_model)
+    Logger.info(f"Using {provisioning_model} provisioning model for {machine}")
+    instances = batch_v1.AllocationPolicy.InstancePolicyOrTemplate()
+    instances.policy = policy
+
+    region = region or BatchRegion(REGION)
+    location_policy = batch_v1.AllocationPolicy.LocationPolicy()
+    location_policy.allowed_locations = [f"regions/{region.name}"]
+
+    # Set Network
+    network_interface = batch_v1.AllocationPolicy.NetworkInterface()
+    network_id = region.network_id
+    subnetwork_id = region.subnetwork_id
+    Logger.info(f"Using network_id={network_id}")
+    Logger.info(f"Using subnetwork_id={subnetwork_id}")
+    network_interface.network = network_id
+    network_interface.subnetwork = subnetwork_id
+    # network_interface.no_external_ip_address = True
+
+    network_policy = batch_v1.AllocationPolicy.NetworkPolicy()
+    network_policy.network_interfaces = [network_interface]
+
+    service_account = batch_v1.types.ServiceAccount()
+    service_account.email = SERVICE_ACCOUNT_EMAIL
+    Logger.info(f"Using service account {SERVICE_ACCOUNT_EMAIL}")
+
+    allocation_policy = batch_v1.AllocationPolicy()
+    allocation_policy.instances = [instances]
+    allocation_policy.location = location_policy
+    allocation_policy.network = network_policy
+    allocation_policy.service_account = service_account
+
+    task_notification = batch_v1.JobNotification()
+    task_notification.pubsub_topic = (
+        f"projects/{PROJECT_ID}/topics/{PUBSUB_TOPIC_BATCH_TASK_STATE_CHANGE}"
+    )
+    message = batch_v1.JobNotification.Message()
+    message.type_ = task_notification.Type.TASK_STATE_CHANGED
+    task_notification.message = message
+
+    job_notification = batch_v1.JobNotification()
+    job_notification.pubsub_topic = (
+        f"projects/{PROJECT_ID}/topics/{PUBSUB_TOPIC_BATCH_JOB_STATE_CHANGE}"
+    )
+    message = batch_v1.JobNotification.Message()
+    message.type_ = job_notification.Type.JOB_STATE_CHANGED
+    job_notification.message = message
+
+    job_name = f"{JOB_NAME}-{uuid.uuid4().hex[:10]}"
+    # Define what will be done as part of the job.
+    runnable = batch_v1.Runnable()
+    runnable.container = batch_v1.Runnable.Container()
+
+    runnable.container.image_uri = image_uri
+    runnable.container.entrypoint = entrypoint
+    runnable.container.commands = command.get_commands()
+
+    environment = batch_v1.Environment()
+    environment.secret_variables = {
+        "ILLUMINA_LIC_SERVER": f"projects/{PROJECT_ID}/secrets/{ILLUMINA_LIC_SERVER_SECRET_NAME}/versions/latest",
+        "JARVICE_API_KEY": f"projects/{PROJECT_ID}/secrets/{JARVICE_API_KEY_SECRET_NAME}/versions/latest",
+        "JARVICE_API_USER": f"projects/{PROJECT_ID}/secrets/{JARVICE_API_USERNAME_SECRET_NAME}/versions/latest",
+        "S3_ACCESS_KEY": f"projects/{PROJECT_ID}/secrets/{S3_ACCESS_KEY_SECRET_NAME}/versions/latest",
+        "S3_SECRET_KEY": f"projects/{PROJECT_ID}/secrets/{S3_SECRET_KEY_SECRET_NAME}/versions/latest",
+    }
+    # runnable.environment = environment
+
+    # Define what will be done as part of the job.
+    task = batch_v1.TaskSpec()
+    task.compute_resource = resources
+
+    task.max_retry_count = run_options.get("max_retry_count", 2)
+    task.max_run_duration = run_options.get("max_run_duration", "7200s")
+    # retry on preemption and transient exit codes, fail fast on deterministic DRAGEN errors
+    task.lifecycle_policies = get_lifecycle_policies(run_options)
+    task.runnables = [runnable]
+    task.environment = environment
+    group.task_spec = task
+
+    job = batch_v1.Job()
+    job.task_groups = [group]
+    job.allocation_policy = allocation_policy
+    job.notifications = [task_notification, job_notification]
+    # We use Cloud Logging as it's an out of the box available option
+    job.logs_policy = batch_v1.LogsPolicy()
+    job.logs_policy.destination = batch_v1.LogsPolicy.Destination.CLOUD_LOGGING
+
+    if job_labels:
+        job.labels = job_labels
+    if provisioning_model != STANDARD:
+        job.labels = dict(job_labels or {}, **{PROVISIONING_LABEL: provisioning_label(provisioning_model)})
+    create_request = batch_v1.CreateJobRequest()
+    create_request.job = job
+
+    create_request.job_id = job_name
+    # The job's parent is the region in which the job will run
+    create_request.parent = region.parent
+
+    global batch
+    if not batch:
+        batch = batch_v1.BatchServiceClient()
+
+    with span("batch.create_job", tasks=task_count, parallelism=parallelism, region=region.name):
+        created_job = batch.create_job(create_request)
+    return created_job
+
+
+def save_job_array_to_bq(batch_config, tasks, submit, dedup=None):
+    """Writes one job_array row per task (to simplify BigQuery operations), in batches of inserts.
+
+    The rows are built from the task table batch by batch, so only one batch of rows is kept in memory.
+    batch_task_index is the index of the task in its job (the shard of the task table).
+    With the deduplication of the inputs, the rows carry the content hash of the input and the hash of the
+    configuration, which index the processed inputs.
+    """
+    command, task_table = tasks
+    input_type = batch_config["input_options"]["input_type"]
+    now = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    table_id = f"{PROJECT_ID}.{BIGQUERY_DB_JOB_ARRAY}"
+
+    for shard, created_job in submit:
+        job_name = created_job.name.split("/")[-1]
+        job_label = created_job.labels.get(JOB_LABEL_NAME) if created_job.labels else None
+        for start in range(shard.start, shard.stop, JOB_ARRAY_INSERT_BATCH_SIZE):
+            batch_rows = []
+            rows = task_table.rows(start, min(start + JOB_ARRAY_INSERT_BATCH_SIZE, shard.stop))
+            for i, task_variables in enumerate(rows, start):
+                batch_rows.append({
+                    "batch_task_index": i - shard.start,
+                    "variables": json.dumps(task_variables),
+                    "job_id": created_job.uid,
+                    "timestamp": now,
+                    "job_label": job_label,
+                    "command": magic_replace(command, i - shard.start, task_variables),
+                    "job_name": job_name,
+                    "input_type": input_type,
+                    "input_path": task_variables.get(INPUT_PATH),
+                    "output_path": task_variables.get(OUTPUT_PATH),
+                    "sample_id": task_variables.get(SAMPLE_ID),
+                    "input_size": task_table.input_sizes[i],
+                })
+                if dedup is not None:
+                    batch_rows[-1]["input_hash"] = task_table.input_hashes[i]
+                    batch_rows[-1]["config_hash"] = dedup[1]
+            errors = stream_data_to_bigquery(batch_rows, table_id)
+            if not errors:
+                Logger.info("New rows have been added into %s for job_id %s: %s", table_id, created_job.uid,
+                            len(batch_rows), sample=True)
+            elif isinstance(errors, list):
+                Logger.error(
+                    f"Encountered errors while inserting rows into {table_id} for job_id {created_job.uid}: {errors}"
+                )
+    return len(task_table)
+
+
+def magic_replace(input_str, batch_task_index, task_variables):
+    input_str = str(input_str)
+    input_str = input_str.replace("${BATCH_TASK_INDEX}", str(batch_task_index)).replace(
+        "$BATCH_TASK_INDEX", str(batch_task_index)
+    )
+
+    for key in task_variables:
+        input_str = input_str.replace("${" + key + "}", task_variables[key])
+        input_str = input_str.replace(key, task_variables[key])
+    return input_str
+
+
+def get_args():
+    # Read command line arguments
+    args_parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="""
+      Script to Analyze log files of the Jobs as listed in the status.csv file.
+      """,
+        epilog="""
+      Examples:
+
+      python main.py -in=gs://path-to/job_list.csv  -out=gs://path-to/summary.csv
+      """,
+    )
+
+    args_parser.add_argument(
+        "-d",
+        dest="dir_path",
+        help="Path to input gcs directory where START_PIPELINE file to be uploaded",
+    )
+    return args_parser
+
+
+def main():
+    parser = get_args()
+    args = parser.parse_args()
+    name = "START_PIPELINE"
+
+    args_dir_path = args.dir_path
+
+    if args_dir_path:
+        name = f"{args_dir_path}/START_PIPELINE"
+
+    args_bucket_name = f"{PROJECT_ID}-trigger"
+    Logger.info(f"Using file_name={name}, bucket={args_bucket_name}")
+    run_dragen_job(
+        {
+            "bucket": args_bucket_name,
+            "name": name,
+        },
+        None,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -21,15 +21,22 @@ from commonek.slack import send_job_message
 from commonek.batch_helper import get_job_by_name
 from commonek.csv_helper import trigger_job_from_csv
 from commonek.helper import split_uri_2_bucket_prefix
-from commonek.logging import Logger
-from commonek.params import JOBS_LIST_URI, JOB_LABEL_NAME, SUCCEEDED, FAILED
+from commonek.job_dag import on_job_completed
+from commonek.logging import Logger, flush_logs
+from commonek.params import JOBS_LIST_URI, JOB_LABEL_NAME, QC_HARVEST_AUTO, RECOVERY_AUTO, SUCCEEDED, FAILED
+from commonek.placement import other_active_shards
+from commonek.provisioning import resubmit_preempted_tasks
+from commonek.qc_metrics import harvest
+from commonek.recovery import recover_completed_job
+from commonek.speculation import SPECULATIVE_LABEL
 
 # API clients
 gcs = storage.Client()  # cloud storage
 
 
+@flush_logs
 def get_job_update(event, context):
-    Logger.info(f"============================ get_job_update - Event received {event} with context {context}")
+    Logger.info("============================ get_job_update - Event received %s with context %s", event, context)
     data = base64.b64decode(event["data"]).decode("utf-8")
     Logger.info(f"get_job_update - data={data}")
 
@@ -51,23 +58,24 @@ def get_job_update(event, context):
     )
 
     job_name = job_name_full.split("/")[-1]
-    found_job = get_job_by_name(job_name=job_name)
+    found_job = get_job_by_name(job_name=job_name, region=region)
     if state in [SUCCEEDED, FAILED]:
-        send_job_message(job_name=job_name, job_uid=job_uid, status=state)
+        send_job_message(job_name=job_name, job_uid=job_uid, status=state, region=region)
         Logger.info(
             f"get_job_update - Job state {state}, checking scheduling file {JOBS_LIST_URI} "
             f"for next job to trigger"
         )
-        if found_job:
-            if JOB_LABEL_NAME in found_job.labels:
-                found_label = found_job.labels[JOB_LABEL_NAME]
-                Logger.info(f"get_job_update - label = {found_label}")
-                bucket_name, file_path = split_uri_2_bucket_prefix(JOBS_LIST_URI)
-                trigger_job_from_csv(
-                    bucket_name=bucket_name,
-                    file_path=file_path,
-                    previous_job_label=found_label,
-                )
+        if found_job and SPECULATIVE_LABEL in (found_job.labels or {}):
+            # duplicate of a straggler, the job of the original task drives the pipeline
+            Logger.info(f"get_job_update - {job_name} is a speculative duplicate, nothing to trigger")
+            return
+        trigger_next_job(found_job, job_name, state)
+        if found_job and QC_HARVEST_AUTO:
+            # last, so that a harvest running out of time never holds back the next job
+            try:
+                harvest(job_id=job_uid)
+            except Exception as exc:
+                Logger.error(f"get_job_update - QC metrics harvest of {job_name} failed: {exc}")
     else:
         Logger.info(
             f"get_job_update - Not triggering next job, since the state of the previous job = {state} does "
@@ -76,6 +84,41 @@ def get_job_update(event, context):
         )
 
 
+def trigger_next_job(found_job, job_name: str, state: str):
+    """Resubmits the failed tasks of the completed job, or releases its DAG dependents and triggers the next job."""
+    if found_job and state == FAILED:
+        fallback_job = resubmit_preempted_tasks(found_job)
+        if fallback_job:
+            # the next job is triggered once the fallback job (with the same label) completes
+            Logger.info(f"trigger_next_job - preempted tasks of {job_name} resubmitted as {fallback_job.name}")
+            return
+    if found_job and RECOVERY_AUTO:
+        retry_job = recover_completed_job(found_job)
+        if retry_job:
+            # the DAG and the next job are driven by the completion of the retry job (with the same label)
+            Logger.info(f"trigger_next_job - transient failures of {job_name} resubmitted as {retry_job}")
+            return
+    if found_job and other_active_shards(found_job):
+        # a job split across regions completes with its last shard
+        Logger.info(f"trigger_next_job - other shards of {job_name} are still active")
+        return
+    if found_job:
+        if JOB_LABEL_NAME in found_job.labels:
+            found_label = found_job.labels[JOB_LABEL_NAME]
+            Logger.info(f"trigger_next_job - label = {found_label}")
+            if on_job_completed(found_label, state):
+                # job is a node of a DAG, its dependents were released
+                Logger.info(f"trigger_next_job - {found_label} is part of a DAG")
+            bucket_name, file_path = split_uri_2_bucket_prefix(JOBS_LIST_URI)
+            trigger_job_from_csv(
+                bucket_name=bucket_name,
+                file_path=file_path,
+                previous_job_label=found_label,
+            )
+        else:
+            # nodes of the DAGs delayed by the admission control may fit now
+            on_job_completed(None, state)
+
 if __name__ == "__main__":
     get_job_update(
         {
@@ -0,0 +1,195 @@
+"""
+Copyright 2022 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Quota-aware admission control of the jobs started by the scheduler.
+
+Quota budgets are configured in vCPUs per machine family (ADMISSION_QUOTA_BUDGETS, such as e2=96,n2=128).
+The vCPUs in use are counted from the queued, scheduled and running jobs of the regions (server-side filtered
+list_jobs, with list_tasks for jobs without task counts in their status): every job commits
+min(parallelism, active tasks) VMs of its machine type (one task per VM).
+
+The next job is:
+    - admitted as is when its parallelism fits into the remaining budget,
+    - admitted with a smaller parallelism (run_options override in START_PIPELINE) when at least
+      ADMISSION_MIN_PARALLELISM tasks fit,
+    - delayed otherwise, until the completion of another job of the pipeline triggers the scheduler again. When no
+      job of the pipeline is active (nothing would trigger it again), it is admitted with ADMISSION_MIN_PARALLELISM.
+Without a budget for the machine family, jobs are always admitted and the Batch API is not called.
+"""
+
+import re
+from typing import Dict, List, Optional
+
+from commonek.batch_helper import ACTIVE_TASK_STATES
+from commonek.batch_helper import count_tasks
+from commonek.batch_helper import list_active_jobs
+from commonek.config_loader import get_json_config
+from commonek.helper import split_uri_2_bucket_prefix
+from commonek.logging import Logger
+from commonek.params import ADMISSION_MIN_PARALLELISM
+from commonek.params import ADMISSION_QUOTA_BUDGETS
+from commonek.params import JOB_LABEL_NAME
+from commonek.params import REGION
+
+ADMIT = "ADMIT"
+SHRINK = "SHRINK"
+DELAY = "DELAY"
+
+DEFAULT_MACHINE = "e2-micro"  # as used by run_batch when the machine is not set in run_options
+DEFAULT_PARALLELISM = 3
+SHARED_CORE_VCPUS = {"e2-micro": 2, "e2-small": 2, "e2-medium": 2, "f1-micro": 1, "g1-small": 1}
+
+
+def parse_budgets(value: str) -> Dict[str, float]:
+    """e2=96,n2=128 -> {"e2": 96.0, "n2": 128.0}"""
+    budgets = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            family, vcpus = item.split("=", 1)
+            budgets[family.strip()] = float(vcpus)
+    return budgets
+
+
+def machine_family(machine: str) -> str:
+    return machine.split("-")[0]
+
+
+def machine_vcpus(machine: str) -> int:
+    """vCPUs of a machine type: e2-standard-8 -> 8, n2-custom-4-16384 -> 4, e2-small -> 2."""
+    if machine in SHARED_CORE_VCPUS:
+        return SHARED_CORE_VCPUS[machine]
+    match = re.search(r"-custom-(\d+)-", machine)
+    if match:
+        return int(match.group(1))
+    match = re.search(r"-(\d+)$", machine)
+    return int(match.group(1)) if match else 1
+
+
+class Capacity:
+    """vCPUs committed per machine family (and per region) by the active jobs of the regions."""
+
+    def __init__(self):
+        self.vcpus: Dict[str, float] = {}
+        self.region_vcpus: Dict[str, float] = {}
+        self.own_active_jobs = 0
+
+    def add(self, machine: str, tasks: int, region: Optional[str] = None):
+        family = machine_family(machine)
+        self.vcpus[family] = self.vcpus.get(family, 0) + tasks * machine_vcpus(machine)
+        if region:
+            self.region_vcpus[region] = self.region_vcpus.get(region, 0) + tasks * machine_vcpus(machine)
+
+    def used(self, family: str) -> float:
+        return self.vcpus.get(family, 0)
+
+    def used_in_region(self, region: str) -> float:
+        return self.region_vcpus.get(region, 0)
+
+    @classmethod
+    def from_batch(cls, regions: Optional[List[str]] = None) -> "Capacity":
+        capacity = cls()
+        for region in regions or [REGION]:
+            for job in list_active_jobs(region):
+                capacity.add(job_machine_type(job), job_committed_tasks(job), region)
+                if JOB_LABEL_NAME in (job.labels or {}):
+                    capacity.own_active_jobs += 1
+        Logger.info(f"Capacity - vCPUs in use {capacity.vcpus}, per region {capacity.region_vcpus}, "
+                    f"pipeline jobs active {capacity.own_active_jobs}")
+        return capacity
+
+
+def job_machine_type(job) -> str:
+    try:
+        return job.allocation_policy.instances[0].policy.machine_type or DEFAULT_MACHINE
+    except (AttributeError, IndexError):
+        return DEFAULT_MACHINE
+
+
+def job_active_tasks(job) -> int:
+    """Number of tasks of the job pending, assigned or running (from the task counts of its status if available)."""
+    group = job.task_groups[0]
+    counts = None
+    try:
+        group_status = job.status.task_groups.get(group.name.split("/")[-1])
+        counts = dict(group_status.counts) if group_status else None
+    except AttributeError:
+        pass
+    if counts:
+        return sum(int(counts.get(state, 0)) for state in ACTIVE_TASK_STATES)
+    return count_tasks(job.name, ACTIVE_TASK_STATES)
+
+
+def job_committed_tasks(job) -> int:
+    """Number of VMs the job keeps busy: min(parallelism, tasks not completed yet)."""
+    parallelism = getattr(job.task_groups[0], "parallelism", 0) or 0
+    active = job_active_tasks(job)
+    return min(parallelism, active) if parallelism else active
+
+
+class AdmissionDecision:
+    def __init__(self, action: str, run_options: Optional[Dict] = None, reason: str = ""):
+        self.action = action
+        self.run_options = run_options or {}  # overrides for the run_options of the job
+        self.reason = reason
+
+    def __repr__(self):
+        return f"AdmissionDecision({self.action}, run_options={self.run_options}, {self.reason})"
+
+
+def decide(run_options: Dict, capacity: Capacity, budgets: Dict[str, float],
+           min_parallelism: int = ADMISSION_MIN_PARALLELISM) -> AdmissionDecision:
+    machine = run_options.get("machine", DEFAULT_MACHINE)
+    family = machine_family(machine)
+    if family not in budgets:
+        return AdmissionDecision(ADMIT, reason=f"no quota budget for {family}")
+
+    auto = str(run_options.get("parallelism", "")).lower() == "auto"
+    option = "max_parallelism" if auto else "parallelism"
+    requested = int(run_options.get(option, 100 if auto else DEFAULT_PARALLELISM))
+    per_task = machine_vcpus(machine)
+    headroom = budgets[family] - capacity.used(family)
+    fits = max(0, int(headroom // per_task))
+    reason = f"{family}: budget {budgets[family]}, in use {capacity.used(family)}, {per_task} vCPUs per task"
+
+    if fits >= requested:
+        decision = AdmissionDecision(ADMIT, reason=reason)
+    elif fits >= min_parallelism:
+        decision = AdmissionDecision(SHRINK, {option: fits}, reason=reason)
+    elif capacity.own_active_jobs == 0:
+        decision = AdmissionDecision(SHRINK, {option: min_parallelism},
+                                     reason=f"{reason}, no pipeline job active to retry later")
+    else:
+        return AdmissionDecision(DELAY, reason=reason)
+    capacity.add(machine, int(decision.run_options.get(option, requested)))
+    return decision
+
+
+def check_admission(config_uri: str, capacity: Optional[Capacity] = None,
+                    budgets: Optional[Dict[str, float]] = None,
+                    regions: Optional[List[str]] = None) -> AdmissionDecision:
+    """Admission decision for the job of the batch configuration (the capacity is updated when admitted).
+
+    The budgets are shared by the jobs of all the regions (REGION when not set)."""
+    budgets = budgets if budgets is not None else parse_budgets(ADMISSION_QUOTA_BUDGETS)
+    if not budgets:
+        return AdmissionDecision(ADMIT, reason="admission control disabled")
+    bucket_name, path = split_uri_2_bucket_prefix(config_uri)
+    batch_config = get_json_config(bucket_name, path) or {}
+    if capacity is None:
+        capacity = Capacity.from_batch(regions)
+    decision = decide(batch_config.get("run_options", {}), capacity, budgets)
+    Logger.info(f"check_admission - {config_uri}: {decision}")
+    return decision
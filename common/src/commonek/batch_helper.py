@@ -14,29 +14,38 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 from collections.abc import Iterable
+from typing import Dict, List, Optional
 from google.cloud import batch_v1
 
 from commonek.params import PROJECT_ID, REGION
 
 
-def list_jobs() -> Iterable[batch_v1.Job]:
+def list_jobs(region: str = REGION, filter: Optional[str] = None) -> Iterable[batch_v1.Job]:
     """
     Get a list of all jobs defined in given region.
 
+    Args:
+        region: Batch region of the jobs.
+        filter: server-side filter of the jobs, such as label_filter(...) or state_filter(...) (all jobs if None).
+
     Returns:
         An iterable collection of Job object.
     """
     client = batch_v1.BatchServiceClient()
 
-    return list(client.list_jobs(parent=f"projects/{PROJECT_ID}/locations/{REGION}"))
+    if filter:
+        return list(client.list_jobs(request=batch_v1.ListJobsRequest(
+            parent=f"projects/{PROJECT_ID}/locations/{region}", filter=filter)))
+    return list(client.list_jobs(parent=f"projects/{PROJECT_ID}/locations/{region}"))
 
 
-def get_job_by_name(job_name: str) -> batch_v1.Job:
+def get_job_by_name(job_name: str, region: str = REGION) -> batch_v1.Job:
     """
     Retrieve information about a Batch Job.
 
     Args:
         job_name: the name of the job you want to retrieve information about.
+        region: Batch region of the job.
 
     Returns:
         A Job object representing the specified job.
@@ -44,16 +53,17 @@ def get_job_by_name(job_name: str) -> batch_v1.Job:
     client = batch_v1.BatchServiceClient()
 
     return client.get_job(
-        name=f"projects/{PROJECT_ID}/locations/{REGION}/jobs/{job_name}"
+        name=f"projects/{PROJECT_ID}/locations/{region}/jobs/{job_name}"
     )
 
 
-def get_job_by_uid(job_uid: str) -> batch_v1.Job:
+def get_job_by_uid(job_uid: str, region: str = REGION) -> batch_v1.Job:
     """
     Get a list of all jobs defined in given region.
 
     Args:
         job_uid: id of the job.
+        region: Batch region of the job.
 
     Returns:
         A Job object representing the specified job.
@@ -61,7 +71,130 @@ def get_job_by_uid(job_uid: str) -> batch_v1.Job:
     client = batch_v1.BatchServiceClient()
 
     for job in list(
-        client.list_jobs(parent=f"projects/{PROJECT_ID}/locations/{REGION}")
+        client.list_jobs(parent=f"projects/{PROJECT_ID}/locations/{region}")
     ):
         if job.uid == job_uid:
             return job
+
+
+ACTIVE_JOB_STATES = ["QUEUED", "SCHEDULED", "RUNNING"]
+ACTIVE_TASK_STATES = ["PENDING", "ASSIGNED", "RUNNING"]
+
+
+def state_filter(states: List[str]) -> str:
+    """Server-side filter for list_jobs / list_tasks, such as status.state="RUNNING" OR status.state="QUEUED"."""
+    return " OR ".join(f'status.state="{state}"' for state in states)
+
+
+def label_filter(name: str, value: str) -> str:
+    """Server-side filter for list_jobs on a job label, such as labels."dragen-job"="job1"."""
+    return f'labels."{name}"="{value}"'
+
+
+def list_active_jobs(region: str = REGION) -> List[batch_v1.Job]:
+    """
+    Get the jobs in the region which are queued, scheduled or running (filtered by the Batch API).
+
+    Args:
+        region: Batch region of the jobs.
+
+    Returns:
+        A list of Job objects.
+    """
+    client = batch_v1.BatchServiceClient()
+
+    return list(client.list_jobs(request=batch_v1.ListJobsRequest(
+        parent=f"projects/{PROJECT_ID}/locations/{region}", filter=state_filter(ACTIVE_JOB_STATES))))
+
+
+def count_tasks(job_name: str, states: List[str], group: str = "group0") -> int:
+    """
+    Count the tasks of a job in the given states (filtered by the Batch API).
+
+    Args:
+        job_name: full name of the job (projects/.../locations/.../jobs/...).
+        states: task states to count.
+        group: task group of the job.
+    """
+    client = batch_v1.BatchServiceClient()
+
+    return len(list(client.list_tasks(request=batch_v1.ListTasksRequest(
+        parent=f"{job_name}/taskGroups/{group}", filter=state_filter(states)))))
+
+
+def list_tasks(job_name: str, states: Optional[List[str]] = None, group: str = "group0",
+               page_size: int = 1000) -> Iterable[batch_v1.Task]:
+    """
+    List the tasks of a job, optionally only the ones in the given states (filtered by the Batch API).
+
+    Args:
+        job_name: full name of the job (projects/.../locations/.../jobs/...).
+        states: task states to list, all the tasks if None.
+        group: task group of the job.
+        page_size: tasks per page, the pages are fetched while iterating.
+
+    Returns:
+        An iterable collection of Task objects.
+    """
+    client = batch_v1.BatchServiceClient()
+
+    return client.list_tasks(request=batch_v1.ListTasksRequest(
+        parent=f"{job_name}/taskGroups/{group}", filter=state_filter(states) if states else None,
+        page_size=page_size))
+
+
+def get_task(task_name: str) -> batch_v1.Task:
+    """
+    Retrieve a task of a job.
+
+    Args:
+        task_name: full name of the task (projects/.../jobs/.../taskGroups/group0/tasks/<index>).
+    """
+    client = batch_v1.BatchServiceClient()
+
+    return client.get_task(name=task_name)
+
+
+def delete_job(job_name: str):
+    """
+    Delete a job, cancelling its tasks which are still running.
+
+    Args:
+        job_name: full name of the job (projects/.../locations/.../jobs/...).
+    """
+    client = batch_v1.BatchServiceClient()
+
+    return client.delete_job(name=job_name)
+
+
+def create_job_from_template(template: batch_v1.Job, task_environments: List[batch_v1.Environment], job_id: str,
+                             labels: Dict[str, str]) -> batch_v1.Job:
+    """
+    Create a job running other tasks with the task spec, VMs, network and notifications of an existing job.
+
+    Args:
+        template: the existing job.
+        task_environments: environment variables of the tasks of the new job.
+        job_id: id of the new job.
+        labels: labels of the new job.
+
+    Returns:
+        A Job object representing the created job.
+    """
+    client = batch_v1.BatchServiceClient()
+
+    group = batch_v1.TaskGroup()
+    group.task_spec = template.task_groups[0].task_spec
+    group.parallelism = template.task_groups[0].parallelism
+    group.task_count_per_node = 1
+    group.task_environments = task_environments
+
+    job = batch_v1.Job()
+    job.task_groups = [group]
+    job.allocation_policy = template.allocation_policy
+    job.notifications = template.notifications
+    job.logs_policy = template.logs_policy
+    job.labels = labels
+
+    return client.create_job(batch_v1.CreateJobRequest(
+        job=job, job_id=job_id, parent=template.name.split("/jobs/")[0]))
@@ -15,16 +15,17 @@ limitations under the License.
 """
 from typing import List, Dict
 from commonek.logging import Logger
+from commonek.tracing import traced
 from google.cloud import bigquery
 
 bigquery_client = bigquery.Client()
 
 
+@traced("bigquery.stream_data_to_bigquery", payload_arg="rows_to_insert", is_error=bool)
 def stream_data_to_bigquery(rows_to_insert: List[Dict], table_id: str):
     try:
-        Logger.info(
-            f"stream_data_to_bigquery table_id={table_id}, rows_to_insert={rows_to_insert}"
-        )
+        Logger.info("stream_data_to_bigquery table_id=%s, rows_to_insert=%s", table_id, rows_to_insert,
+                    sample=True)
         errors = bigquery_client.insert_rows_json(table_id, rows_to_insert)
 
         return errors
@@ -33,14 +34,30 @@ def stream_data_to_bigquery(rows_to_insert: List[Dict], table_id: str):
         return [{"errors": exc}]
 
 
+@traced("bigquery.run_query", is_error=lambda result: result is None)
 def run_query(sql: str):
     try:
-        Logger.info(
-            f"run_query with sql={sql}"
-        )
+        Logger.info("run_query with sql=%s", sql)
         query_config = bigquery.QueryJobConfig(use_legacy_sql=False)
         query_job = bigquery_client.query(sql, job_config=query_config)
         return query_job.result()
     except Exception as exc:
         Logger.error(f"run_query - failed with {exc}")
         return None
+
+
+@traced("bigquery.load_rows_to_bigquery", payload_arg="rows", is_error=bool)
+def load_rows_to_bigquery(rows: List[Dict], table_id: str):
+    """Appends the rows with a load job (batch, no streaming buffer), returns the errors of the job if any."""
+    try:
+        Logger.info("load_rows_to_bigquery table_id=%s, rows=%s", table_id, len(rows))
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        )
+        load_job = bigquery_client.load_table_from_json(rows, table_id, job_config=job_config)
+        load_job.result()
+        return load_job.errors
+    except Exception as exc:
+        Logger.error(f"load_rows_to_bigquery - failed with {exc}")
+        return [{"errors": exc}]
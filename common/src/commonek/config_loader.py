@@ -0,0 +1,128 @@
+"""
+Copyright 2022 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Loading of json configurations from GCS with a single round trip.
+
+Parsed configurations are cached per uri together with the object generation, across warm invocations.
+A cached configuration is revalidated with a conditional GET (if_generation_not_match), so an unchanged object
+costs a 304 response and no parsing; a missing object (404) is reported as None instead of an error.
+"""
+
+import copy
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from google.api_core.exceptions import NotFound, NotModified
+from google.cloud import storage
+
+from commonek.logging import Logger
+from commonek.tracing import traced
+
+storage_client = storage.Client()
+
+_cache: Dict[str, Tuple[int, Dict]] = {}  # uri -> (generation, parsed config)
+_cache_lock = threading.Lock()
+
+
+def _cached(uri: str, generation=None) -> Optional[Dict]:
+    with _cache_lock:
+        entry = _cache.get(uri)
+    if entry is None or (generation is not None and entry[0] != generation):
+        return None
+    # configurations are updated in place by the callers (such as run_options)
+    return copy.deepcopy(entry[1])
+
+
+@traced("gcs.get_json_config", is_error=lambda result: result is None)
+def get_json_config(bucket_name: str, file_path: str) -> Optional[Dict]:
+    """Parsed json object gs://bucket_name/file_path, or None when it does not exist."""
+    uri = f"gs://{bucket_name}/{file_path}"
+    with _cache_lock:
+        entry = _cache.get(uri)
+    blob = storage_client.bucket(bucket_name).blob(file_path)
+    try:
+        if entry is not None:
+            data = blob.download_as_bytes(if_generation_not_match=entry[0])
+        else:
+            data = blob.download_as_bytes()
+    except NotModified:
+        Logger.info(f"get_json_config - using cached {uri}, generation {entry[0]}")
+        return copy.deepcopy(entry[1])
+    except NotFound:
+        with _cache_lock:
+            _cache.pop(uri, None)
+        return None
+
+    config = json.loads(data.decode("utf-8"))
+    if blob.generation is not None:
+        with _cache_lock:
+            _cache[uri] = (int(blob.generation), config)
+    Logger.info(f"get_json_config - loaded {uri}, generation {blob.generation}")
+    return copy.deepcopy(config)
+
+
+def parent_candidates(file_path: str) -> List[str]:
+    """Same file name in every parent directory, nearest first: a/b/c.json -> [a/c.json, c.json]."""
+    file_name = os.path.basename(file_path)
+    dirs = os.path.dirname(file_path).split("/") if os.path.dirname(file_path) else []
+    return ["/".join(dirs[:i] + [file_name]) for i in range(len(dirs) - 1, -1, -1)]
+
+
+@traced("gcs.find_json_config_in_parents", is_error=lambda result: result is None)
+def find_json_config_in_parents(bucket_name: str, file_path: str) -> Optional[Tuple[str, Dict]]:
+    """Nearest config with the same file name in the parent directories of file_path, as (file_path, config).
+
+    All the candidates are resolved with one listing (common prefix of the candidates, matching only their names),
+    then the nearest one is served from the cache if its generation did not change, or downloaded otherwise.
+    """
+    candidates = parent_candidates(file_path)
+    if not candidates:
+        return None
+    prefix = os.path.commonprefix(candidates)
+    match_glob = candidates[0] if len(candidates) == 1 else "{" + ",".join(candidates) + "}"
+    found = {b.name: b.generation for b in
+             storage_client.list_blobs(bucket_name, prefix=prefix, match_glob=match_glob)}
+    for candidate in candidates:
+        if candidate not in found:
+            continue
+        uri = f"gs://{bucket_name}/{candidate}"
+        config = _cached(uri, int(found[candidate]))
+        if config is None:
+            config = get_json_config(bucket_name, candidate)
+        if config is not None:
+            return candidate, config
+    return None
+
+
+def load_json_config(bucket_name: str, file_path: str, recursive_find: bool = False) -> Optional[Dict]:
+    """Parsed json config, optionally falling back to the same file name in the parent directories."""
+    config = get_json_config(bucket_name, file_path)
+    if config is not None or not recursive_find:
+        return config
+
+    Logger.warning(f"load_json_config - gs://{bucket_name}/{file_path} does not exist, checking parent folders")
+    found = find_json_config_in_parents(bucket_name, file_path)
+    if found is None:
+        return None
+    Logger.info(f"load_json_config - using gs://{bucket_name}/{found[0]}")
+    return found[1]
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
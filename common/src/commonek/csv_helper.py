@@ -17,76 +17,140 @@ limitations under the License.
 import csv
 import json
 import os
+import time
 from io import StringIO
+from typing import Dict, List, Optional
 
 from google.cloud import storage
 
+from commonek.admission import DELAY, check_admission
 from commonek.helper import split_uri_2_bucket_prefix
 from commonek.logging import Logger
 from commonek.gcs_helper import file_exists
-from commonek.params import TRIGGER_FILE_NAME, JOB_LABEL_NAME
+from commonek.job_queue import JobEntry, JobQueue
+from commonek.params import TRIGGER_FILE_NAME, JOB_LABEL_NAME, SCHEDULER_STATE_URI
+from commonek.placement import get_regions
+from commonek.scheduler_state import GcsStateStore
 
 # API clients
 gcs = storage.Client()  # cloud storage
 
 
-# uses CSV file with jobs list, to select and trigger next job (that comes as next row after previous_job_label or
-# is first row if previous_job_label is none)
-def trigger_job_from_csv(
-    bucket_name: str, file_path: str, previous_job_label: str = None
-):
-    Logger.info(
-        f"trigger_job_from_csv - using gs://{bucket_name}/{file_path} scheduling file, "
-        f"finding job listed after {previous_job_label} (or first if None)"
-    )
+def parse_jobs_list(csv_string: str) -> List[JobEntry]:
+    """Rows of jobs.csv: <job_label>, <batch_config_file_path.json>[, <priority>[, <group>]]
 
-    if not file_exists(bucket_name, file_path):
-        Logger.info(
-            f"trigger_job_from_csv - Exiting since file gs://{bucket_name}/{file_path} i was not found."
-        )
-        return
-
-    bucket = gcs.get_bucket(bucket_name)
-    jobs_list_blob = bucket.blob(file_path)
-    csv_string = jobs_list_blob.download_as_text()
-    Logger.info(f"trigger_job_from_csv - scheduling file: [{csv_string}]")
-    f = StringIO(csv_string)
-    reader = csv.reader(f, delimiter=",")
-    if not previous_job_label:
-        next_row = True
-    else:
-        next_row = False
-
-    for row in reader:
+    priority is an integer (higher is more urgent, 0 by default), group is used for fair sharing between groups of
+    jobs, such as project or cohort.
+    """
+    entries = []
+    for row in csv.reader(StringIO(csv_string), delimiter=","):
         if len(row) < 2:
             Logger.error(
                 f"trigger_job_from_csv - Wrong format of the row {row}, "
-                f"should be: <job_label>, <batch_config_file_path.csv>"
+                f"should be: <job_label>, <batch_config_file_path.csv>[, <priority>[, <group>]]"
             )
             continue
-        # <job_label>,  <batch_config_file_path.csv>
-        job_label_name = row[0].strip()
-        config_gcs = row[1].strip()
-
-        if next_row:
-            config_bucket_name, config_path = split_uri_2_bucket_prefix(config_gcs)
-
-            # Constructing START_PIPELINE to upload to trigger job
-            json_dic = {
-                JOB_LABEL_NAME: job_label_name,
-                "config": os.path.basename(config_path),
-            }
-            bucket = gcs.bucket(config_bucket_name)
-            blob = bucket.blob(f"{os.path.dirname(config_path)}/{TRIGGER_FILE_NAME}")
-            blob.upload_from_string(json.dumps(json_dic))
-            Logger.info(
-                f"trigger_job_from_csv - Uploading {json_dic} to gs://{config_bucket_name}/{blob.name} "
-            )
-            break
+        priority = 0
+        if len(row) > 2 and row[2].strip():
+            try:
+                priority = int(row[2].strip())
+            except ValueError:
+                Logger.error(f"trigger_job_from_csv - Wrong priority in the row {row}, using 0")
+        group = row[3].strip() if len(row) > 3 else None
+        entries.append(JobEntry(row[0].strip(), row[1].strip(), priority, group))
+    return entries
+
+
+def trigger_job(entry: JobEntry, run_options: Optional[Dict] = None):
+    """Uploads START_PIPELINE next to the batch configuration of the job.
+
+    run_options (such as a reduced parallelism) override the run_options of the batch configuration.
+    """
+    config_bucket_name, config_path = split_uri_2_bucket_prefix(entry.config)
+
+    # Constructing START_PIPELINE to upload to trigger job
+    json_dic = {
+        JOB_LABEL_NAME: entry.job_label,
+        "config": os.path.basename(config_path),
+    }
+    if run_options:
+        json_dic["run_options"] = run_options
+    bucket = gcs.bucket(config_bucket_name)
+    blob = bucket.blob(f"{os.path.dirname(config_path)}/{TRIGGER_FILE_NAME}")
+    blob.upload_from_string(json.dumps(json_dic))
+    Logger.info(
+        f"trigger_job_from_csv - Uploading {json_dic} to gs://{config_bucket_name}/{blob.name} "
+    )
 
-        if job_label_name == previous_job_label:
-            next_row = True
 
+# uses CSV file with jobs list, to select and trigger next job using the scheduler queue (priorities, fair share
+# across groups and aging): when previous_job_label is None, the jobs.csv file was uploaded and the queue is
+# (re)created from it, otherwise previous_job_label has completed and the next job in the queue is started.
+# With early=True, previous_job_label is still running its last tasks (see prefetch.py): the next job is started
+# once per job, and not again when previous_job_label completes (unless a job is waiting for admission)
+def trigger_job_from_csv(
+    bucket_name: str, file_path: str, previous_job_label: str = None, early: bool = False
+):
+    jobs_list_uri = f"gs://{bucket_name}/{file_path}"
     Logger.info(
-        f"No job found to trigger comming after the completed one {previous_job_label}"
+        f"trigger_job_from_csv - using {jobs_list_uri} scheduling file, "
+        f"finding job to run after {previous_job_label} (or first if None)"
     )
+    entries = []
+
+    def load_entries():
+        if not entries:
+            if not file_exists(bucket_name, file_path):
+                Logger.info(f"trigger_job_from_csv - file {jobs_list_uri} was not found.")
+                return []
+            csv_string = gcs.bucket(bucket_name).blob(file_path).download_as_text()
+            Logger.info("trigger_job_from_csv - scheduling file: [%s]", csv_string)
+            entries.extend(parse_jobs_list(csv_string))
+        return [JobEntry(*entry.to_list()) for entry in entries]
+
+    def pick_next(state):
+        queue = JobQueue(state)
+        now = time.time()
+        if early:
+            if not queue.prefetch(previous_job_label, now):
+                Logger.info(f"trigger_job_from_csv - next job after {previous_job_label} was already started "
+                            f"or {previous_job_label} was not started by the scheduler")
+                return None
+        elif previous_job_label is None:
+            queue.reset(load_entries(), jobs_list_uri, now)
+        elif queue.jobs_list is None:
+            # no scheduler state yet (jobs.csv uploaded before it was introduced): continue after previous job
+            labels = [entry.job_label for entry in load_entries()]
+            if previous_job_label not in labels:
+                return None
+            queue.reset(load_entries()[labels.index(previous_job_label) + 1:], jobs_list_uri, now)
+        elif queue.complete_prefetched(previous_job_label) and not queue.delayed:
+            Logger.info(f"trigger_job_from_csv - next job after {previous_job_label} was started ahead of time")
+            return None
+        elif not queue.complete(previous_job_label) and not queue.delayed:
+            Logger.info(f"trigger_job_from_csv - {previous_job_label} was not started by the scheduler")
+            return None
+        entry = queue.pick_next(now)
+        if entry:
+            Logger.info(f"trigger_job_from_csv - next {entry}, still queued {[e.job_label for e in queue.order(now)]}")
+        return entry
+
+    store = GcsStateStore(SCHEDULER_STATE_URI)
+    entry = store.update(pick_next)
+    if entry is None:
+        Logger.info(
+            f"No job found to trigger comming after the completed one {previous_job_label}"
+        )
+        return None
+    decision = check_admission(entry.config, regions=[region.name for region in get_regions()])
+    if decision.action == DELAY:
+        Logger.info(f"trigger_job_from_csv - not enough quota for {entry}, delaying it - {decision.reason}")
+        store.update(lambda state: JobQueue(state).requeue(entry, delayed=True))
+        return None
+    try:
+        trigger_job(entry, decision.run_options)
+    except Exception as exc:
+        Logger.error(f"trigger_job_from_csv - failed to trigger {entry}, putting it back into the queue - {exc}")
+        store.update(lambda state: JobQueue(state).requeue(entry))
+        raise
+    return entry
@@ -0,0 +1,214 @@
+"""
+Copyright 2022 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Deduplication of the CRAM inputs of a job by content.
+
+The content of an input is identified by the md5 (crc32c for composite objects) and the size from its GCS metadata,
+gathered with the listing of the input path or by the pre-flight check (see gcs_helper.content_hash), and the DRAGEN
+configuration by the hash of its options (config_hash). An input is a duplicate when:
+    - an earlier row of the same submission has the same content (such as a CRAM listed under two sample ids),
+    - or a task with the same content and configuration was verified before: job_array keeps the content and
+      configuration hashes of the tasks, and tasks_status their VERIFIED_OK statuses (including the retries of the
+      sample), so that both tables make up the index of the processed inputs.
+With dedup "skip" the duplicates are dropped from the job. With "alias" they are dropped too, and one row per duplicate
+is written to the input_aliases table with the sample and output directory of the original, where its results are.
+"""
+
+import datetime
+import hashlib
+import json
+from typing import Dict, List, Optional, Tuple
+
+from commonek.bq_helper import run_query, stream_data_to_bigquery
+from commonek.gcs_helper import preflight_check_inputs
+from commonek.logging import Logger
+from commonek.params import BIGQUERY_DB_INPUT_ALIASES
+from commonek.params import BIGQUERY_DB_JOB_ARRAY
+from commonek.params import BIGQUERY_DB_TASKS
+from commonek.params import DEDUP_MODE
+from commonek.params import INPUT_PATH
+from commonek.params import OUTPUT_PATH
+from commonek.params import PROJECT_ID
+from commonek.params import SAMPLE_ID
+from commonek.params import TASK_VERIFIED_OK
+from commonek.sample_table import SampleTable
+
+DEDUP_OFF = "off"
+DEDUP_SKIP = "skip"
+DEDUP_ALIAS = "alias"
+DEDUP_MODES = [DEDUP_OFF, DEDUP_SKIP, DEDUP_ALIAS]
+
+# options which do not change the results: where they are written, scratch space, overwriting
+IGNORED_OPTIONS = ["--output-directory", "--intermediate-results-dir", "--force"]
+INDEX_QUERY_BATCH_SIZE = 2000  # content hashes per index query
+
+
+def get_dedup_mode(run_options: Dict) -> str:
+    mode = str(run_options.get("dedup", DEDUP_MODE) or DEDUP_OFF).lower()
+    if mode not in DEDUP_MODES:
+        Logger.warning(f"get_dedup_mode - unknown dedup mode {mode}, expected one of {DEDUP_MODES}")
+        return DEDUP_OFF
+    return mode
+
+
+def config_hash(dragen_options: Dict, jarvice_options: Dict) -> str:
+    """Hash of the DRAGEN options and app, as written in the configuration (before the per-task replacements)."""
+    options = {name: value for name, value in dragen_options.items() if name not in IGNORED_OPTIONS}
+    content = json.dumps({"dragen_app": jarvice_options.get("dragen_app"), "dragen_options": options},
+                         sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:32]
+
+
+class Duplicate:
+    """Input of a sample with the same content as the one of an original sample."""
+    __slots__ = ["sample_id", "input_path", "input_hash", "original_index", "original_sample_id",
+                 "original_input_path", "original_output_path", "original_job_name", "original_job_label"]
+
+    def __init__(self, sample_id: str, input_path: str, input_hash: str, original_index: Optional[int] = None,
+                 original_sample_id: Optional[str] = None, original_input_path: Optional[str] = None,
+                 original_output_path: Optional[str] = None, original_job_name: Optional[str] = None,
+                 original_job_label: Optional[str] = None):
+        self.sample_id = sample_id
+        self.input_path = input_path
+        self.input_hash = input_hash
+        self.original_index = original_index  # row of the original in the deduplicated samples, None if processed
+        self.original_sample_id = original_sample_id
+        self.original_input_path = original_input_path
+        self.original_output_path = original_output_path
+        self.original_job_name = original_job_name
+        self.original_job_label = original_job_label
+
+    @property
+    def processed(self) -> bool:
+        """The original was processed by an earlier job (not part of this submission)."""
+        return self.original_index is None
+
+    def __repr__(self):
+        origin = self.original_job_name if self.processed else "this job"
+        return f"Duplicate({self.sample_id} = {self.original_sample_id} of {origin})"
+
+
+def fill_input_hashes(samples: SampleTable):
+    """Content hashes of the inputs which were neither listed nor pre-flight checked, from their metadata."""
+    uris = [uri for uri, key in zip(samples.column(INPUT_PATH), samples.input_hashes) if key is None]
+    if not uris:
+        return
+    hashes = preflight_check_inputs(uris, outlier_factor=0).hashes
+    samples.input_hashes = [key or hashes.get(uri) for uri, key in zip(samples.column(INPUT_PATH),
+                                                                        samples.input_hashes)]
+
+
+def load_processed(input_hashes: List[str], config: str) -> Dict[str, Dict]:
+    """{content hash: latest verified job_array row} of the inputs already processed with the configuration."""
+    processed = {}
+    for start in range(0, len(input_hashes), INDEX_QUERY_BATCH_SIZE):
+        keys = ", ".join(f"'{key}'" for key in input_hashes[start:start + INDEX_QUERY_BATCH_SIZE])
+        sql = f"""
+        WITH verified AS (
+            SELECT DISTINCT job_id, job_label, sample_id
+            FROM `{PROJECT_ID}.{BIGQUERY_DB_TASKS}`
+            WHERE status = '{TASK_VERIFIED_OK}'
+        )
+        SELECT J.input_hash, J.sample_id, J.input_path, J.output_path, J.job_name, J.job_label
+        FROM `{PROJECT_ID}.{BIGQUERY_DB_JOB_ARRAY}` J
+        JOIN verified V
+        ON J.sample_id = V.sample_id AND (J.job_id = V.job_id OR J.job_label = V.job_label)
+        WHERE J.config_hash = '{config}' AND J.input_hash IN ({keys})
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY J.input_hash ORDER BY J.timestamp DESC) = 1
+        """
+        results = run_query(sql)
+        if results is None:
+            raise RuntimeError("load_processed - could not query the processed inputs")
+        for row in results:
+            processed[row.input_hash] = dict(row.items())
+    return processed
+
+
+def find_duplicates(samples: SampleTable, processed: Dict[str, Dict]) -> Tuple[List[int], List[Duplicate]]:
+    """(rows to keep, duplicates) of the samples, rows without a content hash are always kept."""
+    keep = []
+    first = {}  # content hash -> row of the original among the kept ones
+    duplicates = []
+    for index, (sample_id, uri, key) in enumerate(zip(samples.column(SAMPLE_ID), samples.column(INPUT_PATH),
+                                                      samples.input_hashes)):
+        if key and key in processed:
+            row = processed[key]
+            duplicates.append(Duplicate(sample_id, uri, key, None, row["sample_id"], row["input_path"],
+                                        row["output_path"], row["job_name"], row["job_label"]))
+        elif key and key in first:
+            original = keep[first[key]]
+            duplicates.append(Duplicate(sample_id, uri, key, first[key], samples.column(SAMPLE_ID)[original],
+                                        samples.column(INPUT_PATH)[original]))
+        else:
+            if key:
+                first[key] = len(keep)
+            keep.append(index)
+    return keep, duplicates
+
+
+def dedup_samples(samples: SampleTable, config: str, mode: str) -> List[Duplicate]:
+    """Drops the duplicate inputs from the samples (in place) and returns them."""
+    fill_input_hashes(samples)
+    keys = list(dict.fromkeys(key for key in samples.input_hashes if key))
+    processed = load_processed(keys, config) if keys else {}
+    keep, duplicates = find_duplicates(samples, processed)
+    for duplicate in duplicates:
+        Logger.warning("dedup_samples - %s: sample %s (%s) has the content of %s (%s)%s", mode,
+                       duplicate.sample_id, duplicate.input_path, duplicate.original_sample_id,
+                       duplicate.original_input_path,
+                       f", processed by {duplicate.original_job_name}" if duplicate.processed else "", sample=True)
+    if duplicates:
+        samples.keep(keep)
+        Logger.info(f"dedup_samples - {len(duplicates)} duplicates dropped, {len(samples)} samples left "
+                    f"({len([d for d in duplicates if d.processed])} processed before)")
+    return duplicates
+
+
+def save_aliases(duplicates: List[Duplicate], config: str, job_label: Optional[str],
+                 tasks: Optional[SampleTable] = None, job_names: Optional[List[str]] = None):
+    """Writes the input_aliases rows of the duplicates.
+
+    tasks, job_names: task table of the job and job name of every task, for the originals of the same submission.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    rows = []
+    for duplicate in duplicates:
+        output_path, job_name, original_label = (duplicate.original_output_path, duplicate.original_job_name,
+                                                 duplicate.original_job_label)
+        if not duplicate.processed:
+            if tasks is None:
+                continue
+            output_path = tasks.column(OUTPUT_PATH)[duplicate.original_index] if tasks.column(OUTPUT_PATH) else None
+            job_name = job_names[duplicate.original_index] if job_names else None
+            original_label = job_label
+        rows.append({
+            "timestamp": now,
+            "job_label": job_label,
+            "sample_id": duplicate.sample_id,
+            "input_path": duplicate.input_path,
+            "input_hash": duplicate.input_hash,
+            "config_hash": config,
+            "alias_of_sample_id": duplicate.original_sample_id,
+            "alias_of_input_path": duplicate.original_input_path,
+            "alias_of_output_path": output_path,
+            "alias_of_job_name": job_name,
+            "alias_of_job_label": original_label,
+        })
+    if not rows:
+        return
+    errors = stream_data_to_bigquery(rows, f"{PROJECT_ID}.{BIGQUERY_DB_INPUT_ALIASES}")
+    if errors:
+        Logger.error(f"save_aliases - errors while inserting {len(rows)} rows: {errors}")
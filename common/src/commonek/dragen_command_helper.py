@@ -13,52 +13,215 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-from typing import List
-from typing import Optional
+import difflib
+import os
+import re
+import shlex
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
+from commonek.logging import Logger
 from commonek.params import CRAM_INPUT, FASTQ_INPUT, FASTQ_LIST_INPUT
+from commonek.params import DRAGEN_EXTRA_OPTIONS
+from commonek.params import DRAGEN_HELP_PATH
+
+# Options of DRAGEN versions newer than data/dragen_help.txt (3.7.8), used by the sample configurations
+NEWER_DRAGEN_OPTIONS = [
+    "--enable-cyp2b6", "--enable-gba", "--enable-smn", "--enable-star-allele", "--logging-to-output-dir",
+    "--ora-reference", "--repeat-genotype-use-catalog", "--syslogging-to-output-dir", "--vc-enable-prefilter-output",
+    "--vc-frd-max-effective-depth", "--vc-hard-filter", "--vc-sample-name",
+]
+
+# Words passed to bash as they are: shell-safe characters and ${VAR} references expanded by the task
+SAFE_WORD = re.compile(r"^(?:[\w@%+=:,./-]|\$\{\w+\})+$")
+OPTION_TOKEN = re.compile(r"^(?:--[A-Za-z][\w-]*|-[A-Za-z0-9])$")
+HELP_OPTION = re.compile(r"^  (--?[A-Za-z0-9][\w-]*)(?: \[ (--[\w-]+) \])?( arg)?(?:\s|$)")
+
+
+def quote_word(word: str) -> str:
+    if SAFE_WORD.match(word):
+        return word
+    if "${" in word:
+        # double quotes keep the variables of the task environment expanded
+        return '"' + re.sub(r'(["\\`])', r"\\\1", word) + '"'
+    return shlex.quote(word)
 
 
 class DragenCommand:
-    def __init__(self, command_line: str, stub: Optional[str] = ""):
-        self.script = command_line
+    """Tokenized command line of the Jarvice DRAGEN service: `<launcher options> -- <DRAGEN options>`.
+
+    Options are kept in order as [name, words] (name is None for positional arguments, such as the fastq inputs
+    expanded from ${INPUT_PATH}), with an index by name.
+    """
+
+    __slots__ = ["launcher", "options", "index", "stub"]
+
+    def __init__(self, command_line: str = "", stub: Optional[str] = ""):
         self.stub = stub
+        tokens = shlex.split(command_line)
+        if "--" in tokens:
+            split = tokens.index("--")
+            launcher, dragen = tokens[:split], tokens[split + 1:]
+        else:
+            launcher, dragen = [], tokens
+        self.launcher = group_tokens(launcher)
+        self.options = []
+        self.index = {}
+        for name, words in group_tokens(dragen):
+            self.add(name, words)
+
+    @classmethod
+    def from_options(cls, launcher_options: Sequence[Tuple[str, str]],
+                     dragen_options: Iterable[Tuple[Optional[str], str]], stub: Optional[str] = ""):
+        """Command from option values as written in the configuration (shell words, such as `a\\;b` or `'a;b'`)."""
+        command = cls(stub=stub)
+        command.launcher = [[name, shlex.split(str(value))] for name, value in launcher_options]
+        for name, value in dragen_options:
+            command.add(name, shlex.split(str(value)))
+        return command
+
+    def add(self, name: Optional[str], words: List[str]):
+        if name is not None:
+            self.index.setdefault(name, len(self.options))
+        self.options.append([name, words])
+
+    def get(self, name: str) -> Optional[str]:
+        position = self.index.get(name)
+        return " ".join(self.options[position][1]) if position is not None else None
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
 
     def get_commands(self) -> List[str]:
-        return ["-c", f"{self.stub} {self.script}"]
-        # return self.script.split()
+        return ["-c", f"{self.stub} {self}"]
 
     def get_input(self):
         if self.get_input_type() == CRAM_INPUT:
-            return get_parameter_value(self.script, "--cram-input")
+            return self.get("--cram-input")
         if self.get_input_type() == FASTQ_LIST_INPUT:
-            return get_parameter_value(self.script, "--fastq-list")
+            return self.get("--fastq-list")
         if self.get_input_type() == FASTQ_INPUT:
-            param1 = get_parameter_value(self.script, "-1")
-            param2 = get_parameter_value(self.script, "-2")
-            return ",".join([param1, param2])
+            return ",".join([self.get("-1"), self.get("-2")])
 
     def __str__(self):
-        return self.script
+        return " ".join(render(self.launcher) + ["--"] + render(self.options))
 
     def get_input_type(self):
-        if "--cram-input" in self.script:
+        if "--cram-input" in self:
             return CRAM_INPUT
-        if "--fastq-list" in self.script:
+        if "--fastq-list" in self:
             return FASTQ_LIST_INPUT
-        if "-1 " in self.script and "-2 " in self.script:
+        if "-1" in self and "-2" in self:
             return FASTQ_INPUT
 
     def get_output(self):
-        return get_parameter_value(self.script, "--output-directory")
+        return self.get("--output-directory")
 
     def get_sample_id(self):
-        return get_parameter_value(self.script, "--vc-sample-name")
+        return self.get("--vc-sample-name")
+
+
+def group_tokens(tokens: List[str]) -> List[List]:
+    """["-r", "ref", "--force", "x"] -> [["-r", ["ref"]], ["--force", []], [None, ["x"]]] (values follow options)"""
+    options = []
+    for token in tokens:
+        if OPTION_TOKEN.match(token):
+            options.append([token, []])
+        elif options and options[-1][0] is not None and not options[-1][1]:
+            options[-1][1].append(token)
+        else:
+            options.append([None, [token]])
+    return options
+
+
+def render(options: List[List]) -> List[str]:
+    words = []
+    for name, values in options:
+        if name is not None:
+            words.append(name)
+        words.extend(quote_word(value) for value in values)
+    return words
 
 
 def get_parameter_value(command: str, parameter_name: str):
-    if parameter_name in command:
-        try:
-            return command.split(parameter_name)[1].strip().split(" ")[0]
-        except Exception:
-            return ""
+    return DragenCommand(command).get(parameter_name)
+
+
+class OptionCatalog:
+    """DRAGEN options from the `dragen --help` output, with whether they take a value (None when unknown)."""
+
+    __slots__ = ["options"]
+
+    def __init__(self, options: Dict[str, Optional[bool]]):
+        self.options = options
+
+    @classmethod
+    def from_help(cls, lines: Iterable[str], extra_options: Iterable[str] = ()) -> "OptionCatalog":
+        options = {}
+        in_options = False
+        for line in lines:
+            if line.startswith("Options:"):
+                in_options = True
+                continue
+            match = HELP_OPTION.match(line) if in_options else None
+            if match:
+                short, long, arg = match.groups()
+                for name in filter(None, [short, long]):
+                    options[name] = bool(arg)
+        for name in extra_options:
+            options.setdefault(name, None)
+        return cls(options)
+
+    def check(self, command: DragenCommand) -> List[str]:
+        """Errors of the DRAGEN options of the command, empty when they are all valid."""
+        errors = []
+        for name, words in command.options:
+            if name is None:
+                continue
+            if name not in self.options:
+                suggestions = difflib.get_close_matches(name, self.options.keys(), n=1)
+                errors.append(f"unknown option {name}" + (f", did you mean {suggestions[0]}?" if suggestions else ""))
+            elif self.options[name] and not words:
+                errors.append(f"option {name} requires a value")
+            elif self.options[name] is False and words:
+                errors.append(f"option {name} does not take a value, got {' '.join(words)}")
+        return errors
+
+
+def find_help_file() -> Optional[str]:
+    """DRAGEN_HELP_PATH, the copy packaged with commonek, or data/dragen_help.txt of the repository."""
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    candidates = [DRAGEN_HELP_PATH, os.path.join(module_dir, "data", "dragen_help.txt"),
+                  os.path.join(module_dir, "..", "..", "..", "data", "dragen_help.txt")]
+    for path in candidates:
+        if path and os.path.isfile(path):
+            return path
+    return None
+
+
+_catalog = None
+
+
+def get_option_catalog() -> Optional[OptionCatalog]:
+    """Catalog built once per instance, None when the help file is not available."""
+    global _catalog
+    if _catalog is None:
+        path = find_help_file()
+        if path is None:
+            Logger.warning("get_option_catalog - dragen_help.txt not found, DRAGEN options are not validated")
+            _catalog = False
+        else:
+            extra = NEWER_DRAGEN_OPTIONS + [name.strip() for name in DRAGEN_EXTRA_OPTIONS.split(",") if name.strip()]
+            with open(path) as f:
+                _catalog = OptionCatalog.from_help(f, extra)
+            Logger.info(f"get_option_catalog - {len(_catalog.options)} DRAGEN options loaded from {path}")
+    return _catalog or None
+
+
+def validate_dragen_options(dragen_options: Dict[str, str]) -> List[str]:
+    """Errors of the dragen_options of a configuration (unknown options, missing or unexpected values)."""
+    try:
+        command = DragenCommand.from_options([], dragen_options.items())
+    except ValueError as exc:  # unbalanced quotes
+        return [f"could not parse dragen_options: {exc}"]
+    catalog = get_option_catalog()
+    return catalog.check(command) if catalog else []
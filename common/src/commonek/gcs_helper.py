@@ -14,13 +14,21 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from google.api_core.exceptions import NotFound
 from google.cloud import storage
 from commonek.helper import split_uri_2_bucket_prefix
 from commonek.logging import Logger
+from commonek.params import PREFLIGHT_MAX_WORKERS, PREFLIGHT_OUTLIER_FACTOR
+from commonek.tracing import traced
 
 storage_client = storage.Client()
 
 
+@traced("gcs.get_rows_from_file")
 def get_rows_from_file(file_uri: str, skip_header=True):
     Logger.info(f"get_rows_from_file - {file_uri}")
     bucket_name, file_name = split_uri_2_bucket_prefix(file_uri)
@@ -57,3 +65,141 @@ def write_gcs_blob(bucket_name, file_name, content_as_str, content_type="text/pl
     gcs_file = bucket.blob(file_name)
     gcs_file.upload_from_string(content_as_str, content_type=content_type)
     Logger.debug(f"Saving the file {file_name} to GCS bucket {bucket_name}")
+
+
+class PreflightResult:
+    """Outcome of the input pre-flight check.
+
+    `sizes` maps every input URI that was found to its size in bytes, so it can also be used
+    for size-based scheduling decisions. `hashes` maps them to the hash of their content (md5 or crc32c
+    from the object metadata), to find identical inputs. Inputs whose metadata could not be read (permission or
+    transient errors) are `unknown`: they are neither found nor missing, and are kept.
+    """
+
+    def __init__(self):
+        self.sizes: Dict[str, int] = {}
+        self.hashes: Dict[str, str] = {}
+        self.missing: List[str] = []
+        self.empty: List[str] = []
+        self.outliers: List[str] = []
+        self.unknown: List[str] = []
+
+    def is_ok(self, uri: str) -> bool:
+        """The input is not known to be missing or empty."""
+        return (uri in self.sizes and uri not in self.empty) or uri in self.unknown
+
+    def get_size(self, uri: str) -> Optional[int]:
+        return self.sizes.get(uri)
+
+    def get_hash(self, uri: str) -> Optional[str]:
+        return self.hashes.get(uri)
+
+    def __str__(self):
+        return (
+            f"checked={len(self.sizes) + len(self.missing) + len(self.unknown)}, missing={len(self.missing)}, "
+            f"empty={len(self.empty)}, outliers={len(self.outliers)}, unknown={len(self.unknown)}"
+        )
+
+
+def content_hash(size: Optional[int], md5_hash: Optional[str], crc32c: Optional[str]) -> Optional[str]:
+    """Key of the content of an object from its metadata: md5 (crc32c for composite objects, which have no md5)
+    and size, such as md5:1B2M2Y8AsgTpgAmY7PhCfg==:0"""
+    if size is None:
+        return None
+    if md5_hash:
+        return f"md5:{md5_hash}:{size}"
+    if crc32c:
+        return f"crc32c:{crc32c}:{size}"
+    return None
+
+
+def get_object_size(uri: str) -> Optional[int]:
+    """HEAD a gs:// or s3:// object (s3 URIs point to the same bucket through the interoperability API).
+
+    Returns:
+        Size in bytes, or None when the object does not exist. Other errors (such as permission denied) are raised.
+    """
+    blob = get_object_metadata(uri)
+    if blob is None:
+        return None
+    return blob.size or 0
+
+
+def get_object_metadata(uri: str) -> Optional[storage.Blob]:
+    """HEAD a gs:// or s3:// object, None when the object does not exist. Other errors (such as permission denied
+    or transient server errors) are raised."""
+    bucket_name, blob_name = split_uri_2_bucket_prefix(uri)
+    if not bucket_name or not blob_name:
+        Logger.warning(f"get_object_metadata - could not parse uri={uri}")
+        return None
+    try:
+        return storage_client.bucket(bucket_name).get_blob(blob_name)
+    except NotFound:
+        # the bucket does not exist
+        return None
+
+
+def _head_object(uri: str):
+    """(metadata or None when missing, error when the metadata could not be read)"""
+    try:
+        return get_object_metadata(uri), None
+    except Exception as exc:
+        return None, exc
+
+
+def preflight_check_inputs(
+    uris: List[str],
+    max_workers: int = PREFLIGHT_MAX_WORKERS,
+    outlier_factor: float = PREFLIGHT_OUTLIER_FACTOR,
+) -> PreflightResult:
+    """Concurrently HEAD all input URIs and report missing, zero-byte and size-outlier objects, with the sizes
+    and content hashes of the found ones. Inputs which could not be checked are reported as unknown.
+
+    An object is an outlier when its size is more than `outlier_factor` times larger or smaller
+    than the median size of the found (non-empty) inputs.
+    """
+    result = PreflightResult()
+    unique_uris = list(dict.fromkeys(uris))
+    if not unique_uris:
+        return result
+
+    workers = max(1, min(max_workers, len(unique_uris)))
+    Logger.info(
+        f"preflight_check_inputs - checking {len(unique_uris)} inputs using {workers} workers"
+    )
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        heads = list(executor.map(_head_object, unique_uris))
+
+    for uri, (blob, error) in zip(unique_uris, heads):
+        if error is not None:
+            Logger.warning(f"preflight_check_inputs - could not check input {uri}, keeping it - {error}")
+            result.unknown.append(uri)
+            continue
+        if blob is None:
+            result.missing.append(uri)
+            continue
+        size = blob.size or 0
+        result.sizes[uri] = size
+        key = content_hash(size, blob.md5_hash, blob.crc32c)
+        if key:
+            result.hashes[uri] = key
+        if size == 0:
+            result.empty.append(uri)
+
+    non_empty = [size for size in result.sizes.values() if size > 0]
+    if outlier_factor and len(non_empty) >= 3:
+        median = statistics.median(non_empty)
+        for uri, size in result.sizes.items():
+            if size > 0 and (size > median * outlier_factor or size * outlier_factor < median):
+                result.outliers.append(uri)
+
+    for uri in result.missing:
+        Logger.error(f"preflight_check_inputs - input not found: {uri}")
+    for uri in result.empty:
+        Logger.error(f"preflight_check_inputs - input is empty (0 bytes): {uri}")
+    for uri in result.outliers:
+        Logger.warning(
+            f"preflight_check_inputs - input size {result.sizes[uri]} is an outlier: {uri}"
+        )
+    Logger.info(f"preflight_check_inputs - {result}")
+    return result
@@ -17,6 +17,7 @@ limitations under the License.
 import re
 from google.cloud import secretmanager
 from commonek.logging import Logger
+from commonek.tracing import traced
 sm = None  # secret_manager
 from google.api_core.exceptions import NotFound
 
@@ -46,6 +47,7 @@ def split_uri_2_bucket_s3(uri: str):
     return bucket, prefix
 
 
+@traced("secretmanager.get_secret_value")
 def get_secret_value(secret_name, project_id):
     global sm
     if not sm:
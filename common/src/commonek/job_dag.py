@@ -0,0 +1,308 @@
+"""
+Copyright 2022 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Multi-stage pipelines: DAG of jobs with dependencies, evaluated on every job completion.
+
+Spec (jobs_dag.json, or jobs_dag.yaml when PyYAML is installed):
+    {
+        "name": "cohort-study",
+        "nodes": [
+            {"id": "cohort1", "config": "gs://bucket/cohort1/batch_config.json"},
+            {"id": "cohort2", "config": "gs://bucket/cohort2/batch_config.json"},
+            {"id": "aggregate", "config": "gs://bucket/aggregate/batch_config.json",
+             "depends_on": ["cohort1", {"node": "cohort2", "policy": "always"}]}
+        ]
+    }
+
+Edge policies:
+    - success (default): run only if the dependency succeeded,
+    - failure: run only if the dependency failed (such as a cleanup or notification job),
+    - always: run once the dependency completed, whatever the outcome.
+A node whose dependencies completed without satisfying the policies is skipped (and so are the nodes depending on
+it with the success policy). All the nodes whose dependencies are satisfied are released at the same time.
+
+The state of the DAGs is persisted in DAG_STATE_URI, so a DAG can be resumed by uploading the same spec again:
+succeeded and running nodes are kept, failed and skipped ones are run again.
+"""
+
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from google.cloud import storage
+
+from commonek.admission import DELAY, Capacity, check_admission
+from commonek.csv_helper import trigger_job
+from commonek.job_queue import JobEntry
+from commonek.logging import Logger
+from commonek.params import ADMISSION_QUOTA_BUDGETS, DAG_STATE_URI, SUCCEEDED, FAILED
+from commonek.scheduler_state import GcsStateStore
+
+try:
+    import yaml
+except ImportError:  # PyYAML is optional, json specs do not need it
+    yaml = None
+
+storage_client = storage.Client()
+
+PENDING = "PENDING"
+RUNNING = "RUNNING"
+SKIPPED = "SKIPPED"
+TERMINAL = [SUCCEEDED, FAILED, SKIPPED]
+
+POLICY_SUCCESS = "success"
+POLICY_FAILURE = "failure"
+POLICY_ALWAYS = "always"
+POLICIES = [POLICY_SUCCESS, POLICY_FAILURE, POLICY_ALWAYS]
+
+
+class DagSpecError(Exception):
+    pass
+
+
+def job_label(dag_name: str, node_id: str) -> str:
+    """Batch label value (lowercase letters, digits, - and _, up to 63 characters) of the node."""
+    label = re.sub(r"[^a-z0-9_-]", "-", f"{dag_name}-{node_id}".lower())
+    return label[:63]
+
+
+def parse_dag_spec(text: str, file_name: str = "jobs_dag.json") -> Dict:
+    """Parses and validates the DAG spec.
+
+    Returns:
+        {"name": ..., "nodes": {node_id: {"config": ..., "depends_on": [[dep_id, policy], ...]}}}
+    """
+    if file_name.endswith((".yaml", ".yml")):
+        if yaml is None:
+            raise DagSpecError(f"PyYAML is not installed, cannot parse {file_name} (use json instead)")
+        spec = yaml.safe_load(text)
+    else:
+        spec = json.loads(text)
+
+    if not isinstance(spec, dict) or not spec.get("name") or not isinstance(spec.get("nodes"), list):
+        raise DagSpecError("DAG spec must have a name and a list of nodes")
+
+    nodes = {}
+    for node in spec["nodes"]:
+        node_id = str(node.get("id", ""))
+        if not node_id or not node.get("config"):
+            raise DagSpecError(f"Node {node} must have an id and a config")
+        if node_id in nodes:
+            raise DagSpecError(f"Duplicate node {node_id}")
+        depends_on = []
+        for dep in node.get("depends_on", []) or []:
+            if isinstance(dep, dict):
+                dep_id, policy = str(dep.get("node", "")), dep.get("policy", POLICY_SUCCESS)
+            else:
+                dep_id, policy = str(dep), POLICY_SUCCESS
+            if policy not in POLICIES:
+                raise DagSpecError(f"Unknown policy {policy} of {node_id} -> {dep_id}, expected one of {POLICIES}")
+            depends_on.append([dep_id, policy])
+        nodes[node_id] = {"config": node["config"], "depends_on": depends_on}
+
+    for node_id, node in nodes.items():
+        for dep_id, _ in node["depends_on"]:
+            if dep_id not in nodes:
+                raise DagSpecError(f"Node {node_id} depends on unknown node {dep_id}")
+
+    # Kahn's algorithm, every node must be reachable in a topological order
+    indegree = {node_id: len(node["depends_on"]) for node_id, node in nodes.items()}
+    ready = [node_id for node_id, degree in indegree.items() if degree == 0]
+    visited = 0
+    while ready:
+        current = ready.pop()
+        visited += 1
+        for node_id, node in nodes.items():
+            for dep_id, _ in node["depends_on"]:
+                if dep_id == current:
+                    indegree[node_id] -= 1
+                    if indegree[node_id] == 0:
+                        ready.append(node_id)
+    if visited != len(nodes):
+        raise DagSpecError(f"DAG {spec['name']} has a cycle")
+
+    return {"name": str(spec["name"]), "nodes": nodes}
+
+
+class JobDags:
+    """Wraps the DAG state (updated in place):
+        {
+            "dags": {dag_name: {"status": ..., "spec_uri": ..., "updated": ...,
+                                "nodes": {node_id: {"config": ..., "depends_on": [[dep_id, policy]],
+                                                    "label": ..., "status": ...}}}},
+            "labels": {job_label: [dag_name, node_id]}
+        }
+    """
+
+    def __init__(self, state: Dict):
+        self.state = state
+        self.state.setdefault("dags", {})
+        self.state.setdefault("labels", {})
+
+    def start(self, spec: Dict, spec_uri: str, now: float) -> List[Tuple[str, Dict]]:
+        """Creates (or resumes) the DAG and returns the released nodes."""
+        name = spec["name"]
+        previous = self.state["dags"].get(name, {}).get("nodes", {})
+        nodes = {}
+        for node_id, node in spec["nodes"].items():
+            status = previous.get(node_id, {}).get("status", PENDING)
+            if status not in [SUCCEEDED, RUNNING]:
+                status = PENDING
+            label = job_label(name, node_id)
+            nodes[node_id] = dict(node, label=label, status=status)
+            self.state["labels"][label] = [name, node_id]
+        self.state["dags"][name] = {"status": RUNNING, "spec_uri": spec_uri, "updated": round(now, 1),
+                                    "nodes": nodes}
+        return self.evaluate(name, now)
+
+    def node_for_label(self, label: str) -> Optional[Tuple[str, str]]:
+        found = self.state["labels"].get(label)
+        return tuple(found) if found else None
+
+    def complete(self, label: str, status: str, now: float) -> List[Tuple[str, Dict]]:
+        """Records the outcome of the job of a node and returns the nodes released by it."""
+        dag_name, node_id = self.node_for_label(label)
+        node = self.state["dags"].get(dag_name, {}).get("nodes", {}).get(node_id)
+        if node is None or node["status"] != RUNNING:
+            # duplicate event, or the DAG was restarted in the meantime
+            return []
+        node["status"] = SUCCEEDED if status == SUCCEEDED else FAILED
+        return self.evaluate(dag_name, now)
+
+    def delayed(self, now: float) -> Dict[str, List[Tuple[str, Dict]]]:
+        """Releases again the pending nodes of the running DAGs whose dependencies completed (nodes put back to
+        pending by the admission control), {dag_name: released nodes} of the DAGs with such nodes."""
+        released = {}
+        for dag_name, dag in self.state["dags"].items():
+            nodes = dag["nodes"]
+            if dag["status"] == RUNNING and any(
+                    node["status"] == PENDING and all(nodes[dep_id]["status"] in TERMINAL
+                                                      for dep_id, _ in node["depends_on"])
+                    for node in nodes.values()):
+                released[dag_name] = self.evaluate(dag_name, now)
+        return released
+
+    def set_status(self, dag_name: str, node_id: str, status: str):
+        self.state["dags"][dag_name]["nodes"][node_id]["status"] = status
+
+    def evaluate(self, dag_name: str, now: float) -> List[Tuple[str, Dict]]:
+        """Releases (marks as RUNNING) every pending node with satisfied dependencies, skips the ones which can
+        no longer run, and updates the status of the DAG."""
+        dag = self.state["dags"][dag_name]
+        nodes = dag["nodes"]
+        released = []
+        changed = True
+        while changed:
+            changed = False
+            for node_id, node in nodes.items():
+                if node["status"] != PENDING:
+                    continue
+                statuses = [(nodes[dep_id]["status"], policy) for dep_id, policy in node["depends_on"]]
+                if any(status not in TERMINAL for status, _ in statuses):
+                    continue
+                satisfied = all(
+                    policy == POLICY_ALWAYS
+                    or (policy == POLICY_SUCCESS and status == SUCCEEDED)
+                    or (policy == POLICY_FAILURE and status == FAILED)
+                    for status, policy in statuses
+                )
+                node["status"] = RUNNING if satisfied else SKIPPED
+                if satisfied:
+                    released.append((node_id, node))
+                changed = True
+
+        if all(node["status"] in TERMINAL for node in nodes.values()):
+            dag["status"] = FAILED if any(node["status"] == FAILED for node in nodes.values()) else SUCCEEDED
+        else:
+            dag["status"] = RUNNING
+        dag["updated"] = round(now, 1)
+        return released
+
+
+def find_dag_spec(bucket_name: str, prefix: str) -> Optional[str]:
+    """Path of the DAG spec (jobs_dag.json, .yaml or .yml) in the directory, found with a single listing."""
+    names = {b.name for b in storage_client.list_blobs(bucket_name, prefix=f"{prefix}jobs_dag.", delimiter="/")}
+    for extension in [".json", ".yaml", ".yml"]:
+        if f"{prefix}jobs_dag{extension}" in names:
+            return f"{prefix}jobs_dag{extension}"
+    return None
+
+
+def release_nodes(store: GcsStateStore, dag_name: str, released: List[Tuple[str, Dict]]):
+    """Starts the jobs of the released nodes. Nodes not admitted (not enough quota) are put back to pending and
+    released again on the next completion of a pipeline job (see on_job_completed)."""
+    capacity = None
+    for node_id, node in released:
+        if ADMISSION_QUOTA_BUDGETS and capacity is None:
+            capacity = Capacity.from_batch()
+        decision = check_admission(node["config"], capacity)
+        if decision.action == DELAY:
+            Logger.info(f"job_dag - {dag_name}: not enough quota for {node_id}, delaying it - {decision.reason}")
+            store.update(lambda state: JobDags(state).set_status(dag_name, node_id, PENDING))
+            continue
+        try:
+            trigger_job(JobEntry(node["label"], node["config"]), decision.run_options)
+            Logger.info(f"job_dag - {dag_name}: released {node_id} ({node['label']})")
+        except Exception as exc:
+            Logger.error(f"job_dag - {dag_name}: failed to release {node_id} - {exc}")
+            store.update(lambda state: JobDags(state).set_status(dag_name, node_id, PENDING))
+
+
+def start_dag(bucket_name: str, spec_path: str) -> Optional[str]:
+    """Starts (or resumes) the DAG of the spec file and releases its first nodes."""
+    spec_uri = f"gs://{bucket_name}/{spec_path}"
+    text = storage_client.bucket(bucket_name).blob(spec_path).download_as_text()
+    try:
+        spec = parse_dag_spec(text, os.path.basename(spec_path))
+    except (DagSpecError, ValueError) as exc:
+        Logger.error(f"job_dag - invalid DAG spec {spec_uri}: {exc}")
+        return None
+
+    store = GcsStateStore(DAG_STATE_URI)
+    released = store.update(lambda state: JobDags(state).start(spec, spec_uri, time.time()))
+    Logger.info(f"job_dag - started {spec['name']} from {spec_uri}, releasing {[n for n, _ in released]}")
+    release_nodes(store, spec["name"], released)
+    return spec["name"]
+
+
+def on_job_completed(label: Optional[str], status: str) -> bool:
+    """Advances the DAG of the job, False when the job is not part of a DAG.
+
+    Any pipeline job completion frees quota, so the nodes of all the DAGs delayed by the admission control are
+    released again as well: a DAG with no running node would otherwise never be evaluated again.
+    """
+    store = GcsStateStore(DAG_STATE_URI)
+
+    def complete(state):
+        dags = JobDags(state)
+        now = time.time()
+        node = dags.node_for_label(label) if label else None
+        completed = dags.complete(label, status, now) if node else []
+        released = dags.delayed(now)
+        if node:
+            released[node[0]] = released.get(node[0], []) + completed
+        return node, released
+
+    node, released = store.update(complete)
+    if node:
+        Logger.info(f"job_dag - {node[0]}: {node[1]} {status}, releasing {[n for n, _ in released[node[0]]]}")
+    for dag_name, nodes in released.items():
+        if dag_name != (node or [None])[0]:
+            Logger.info(f"job_dag - {dag_name}: releasing delayed nodes {[n for n, _ in nodes]}")
+        release_nodes(store, dag_name, nodes)
+    return node is not None
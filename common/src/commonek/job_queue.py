@@ -0,0 +1,195 @@
+"""
+Copyright 2022 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Scheduler queue of the jobs listed in jobs.csv, with priorities, fair sharing across groups and aging.
+
+The next job is the one with:
+    1. the highest effective priority: its priority plus one level for every SCHEDULER_AGING_SECONDS it has been
+       waiting, so that low priority jobs are not starved by higher priority jobs queued after them (jobs.csv
+       uploads add to the queue, see JobQueue.reset),
+    2. then the lowest usage of its group divided by the group weight (SCHEDULER_GROUP_WEIGHTS). Usage counts the
+       jobs started for the group and decays with SCHEDULER_USAGE_HALF_LIFE_SECONDS,
+    3. then the order in jobs.csv.
+Without priorities and groups in jobs.csv, all jobs are equal and are started in the order of the file (FIFO).
+
+The queue is kept in the compact json scheduler state:
+    {
+        "jobs_list": "gs://.../jobs.csv",
+        "queue": [[job_label, config_uri, priority, group, enqueued_at], ...],
+        "dispatched": {job_label: [group, started_at]},
+        "usage": {group: [usage, updated_at]},
+        "delayed": true  (when the next job was not admitted yet),
+        "prefetched": {job_label: prefetched_at}  (jobs still running whose next job was already started)
+    }
+"""
+
+import math
+from typing import Dict, List, Optional
+
+from commonek.params import SCHEDULER_AGING_SECONDS
+from commonek.params import SCHEDULER_DEFAULT_GROUP
+from commonek.params import SCHEDULER_GROUP_WEIGHTS
+from commonek.params import SCHEDULER_USAGE_HALF_LIFE_SECONDS
+
+
+class JobEntry:
+    __slots__ = ["job_label", "config", "priority", "group", "enqueued_at"]
+
+    def __init__(self, job_label: str, config: str, priority: int = 0, group: Optional[str] = None,
+                 enqueued_at: float = 0.0):
+        self.job_label = job_label
+        self.config = config
+        self.priority = priority
+        self.group = group or SCHEDULER_DEFAULT_GROUP
+        self.enqueued_at = enqueued_at
+
+    def to_list(self) -> List:
+        return [self.job_label, self.config, self.priority, self.group, self.enqueued_at]
+
+    @classmethod
+    def from_list(cls, values: List) -> "JobEntry":
+        return cls(*values)
+
+    def __repr__(self):
+        return f"JobEntry({self.job_label}, priority={self.priority}, group={self.group})"
+
+
+def parse_group_weights(value: str) -> Dict[str, float]:
+    """clinical=4,research=1 -> {"clinical": 4.0, "research": 1.0}"""
+    weights = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            group, weight = item.split("=", 1)
+            weights[group.strip()] = float(weight)
+    return weights
+
+
+class JobQueue:
+    def __init__(self, state: Dict, group_weights: Optional[Dict[str, float]] = None,
+                 aging_seconds: float = SCHEDULER_AGING_SECONDS,
+                 usage_half_life_seconds: float = SCHEDULER_USAGE_HALF_LIFE_SECONDS):
+        """Wraps the scheduler state (updated in place)."""
+        self.state = state
+        self.state.setdefault("queue", [])
+        self.state.setdefault("dispatched", {})
+        self.state.setdefault("usage", {})
+        self.group_weights = group_weights if group_weights is not None else parse_group_weights(
+            SCHEDULER_GROUP_WEIGHTS)
+        self.aging_seconds = aging_seconds
+        self.usage_half_life_seconds = usage_half_life_seconds
+
+    @property
+    def entries(self) -> List[JobEntry]:
+        return [JobEntry.from_list(values) for values in self.state["queue"]]
+
+    @property
+    def jobs_list(self) -> Optional[str]:
+        return self.state.get("jobs_list")
+
+    def reset(self, entries: List[JobEntry], jobs_list: str, now: float):
+        """Adds the jobs of a newly uploaded jobs.csv to the queue (usage of the groups is kept).
+
+        Jobs still queued keep their place and waiting time, with the configuration, priority and group of the new
+        file, so that aging lets them overtake the higher priority jobs added later. New jobs are queued at the end.
+        """
+        queued = {entry.job_label: entry for entry in self.entries}
+        added = []
+        for entry in entries:
+            if entry.job_label in queued:
+                entry.enqueued_at = queued[entry.job_label].enqueued_at
+                queued[entry.job_label] = entry
+            else:
+                entry.enqueued_at = round(now, 1)
+                added.append(entry)
+        self.state["jobs_list"] = jobs_list
+        self.state["queue"] = [entry.to_list() for entry in list(queued.values()) + added]
+        self.state["dispatched"] = {}
+        self.state.pop("prefetched", None)
+
+    def is_dispatched(self, job_label: str) -> bool:
+        return job_label in self.state["dispatched"]
+
+    def complete(self, job_label: str) -> bool:
+        """Marks a started job as completed, False if it was not started by the scheduler."""
+        return self.state["dispatched"].pop(job_label, None) is not None
+
+    def prefetch(self, job_label: str, now: float) -> bool:
+        """Marks a started job as completed ahead of time, so that its next job can be started while its last tasks
+        are still running. False if it was not started by the scheduler or was already prefetched (the next job is
+        started only once)."""
+        if not self.complete(job_label):
+            return False
+        self.state.setdefault("prefetched", {})[job_label] = round(now, 1)
+        return True
+
+    def complete_prefetched(self, job_label: str) -> bool:
+        """Clears a prefetched job on its actual completion, False if it was not prefetched."""
+        prefetched = self.state.get("prefetched", {})
+        if job_label not in prefetched:
+            return False
+        prefetched.pop(job_label)
+        if not prefetched:
+            self.state.pop("prefetched")
+        return True
+
+    def requeue(self, entry: JobEntry, delayed: bool = False):
+        """Puts back a job which could not be started (keeping its place and waiting time).
+
+        A delayed job (not admitted, see admission.py) is started on the next job completion, even when the completed
+        job was not started from the queue.
+        """
+        self.state["dispatched"].pop(entry.job_label, None)
+        self.state["queue"].insert(0, entry.to_list())
+        if delayed:
+            self.state["delayed"] = True
+
+    @property
+    def delayed(self) -> bool:
+        return bool(self.state.get("delayed"))
+
+    def weight(self, group: str) -> float:
+        return max(self.group_weights.get(group, 1.0), 1e-6)
+
+    def group_usage(self, group: str, now: float) -> float:
+        usage, updated_at = self.state["usage"].get(group, [0.0, now])
+        if self.usage_half_life_seconds > 0:
+            usage *= math.pow(0.5, max(0.0, now - updated_at) / self.usage_half_life_seconds)
+        return usage
+
+    def effective_priority(self, entry: JobEntry, now: float) -> int:
+        if self.aging_seconds <= 0:
+            return entry.priority
+        return entry.priority + int(max(0.0, now - entry.enqueued_at) // self.aging_seconds)
+
+    def order(self, now: float) -> List[JobEntry]:
+        """Queued jobs in the order they would be started."""
+        entries = self.entries
+        position = {id(entry): index for index, entry in enumerate(entries)}
+        return sorted(entries, key=lambda e: (-self.effective_priority(e, now),
+                                              self.group_usage(e.group, now) / self.weight(e.group),
+                                              position[id(e)]))
+
+    def pick_next(self, now: float) -> Optional[JobEntry]:
+        """Removes the next job from the queue, marks it as started and charges its group."""
+        ordered = self.order(now)
+        if not ordered:
+            return None
+        entry = ordered[0]
+        self.state.pop("delayed", None)
+        self.state["queue"] = [values for values in self.state["queue"] if values[0] != entry.job_label]
+        self.state["dispatched"][entry.job_label] = [entry.group, round(now, 1)]
+        self.state["usage"][entry.group] = [round(self.group_usage(entry.group, now) + 1.0, 4), round(now, 1)]
+        return entry
@@ -13,49 +13,214 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import atexit
+import functools
 import os
+import queue
+import threading
 
-"""class and methods for logs handling."""
+"""class and methods for logs handling.
 
-import logging
-import google.cloud.logging_v2
+Messages accept %-style arguments, which are only formatted when the level is enabled. Arguments are summarized
+(long strings and collections are truncated) and the resulting message is bounded in size. Records are handed over
+to a background thread, which writes them to the configured handlers; `Logger.flush()` (or the `flush_logs`
+decorator on the Cloud Function entry points) waits until everything is written.
+"""
 
-logging_client = google.cloud.logging_v2.Client()
-logging_client.get_default_handler()
-logging_client.setup_logging()
+import logging
 
-logging.basicConfig(level=logging.INFO)
 # utility to get stdout when running locally utility testing scripts
 debug = os.environ.get("DEBUG", None)
 
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "8000"))
+LOG_MAX_ARG_CHARS = int(os.getenv("LOG_MAX_ARG_CHARS", "1000"))
+LOG_MAX_ITEMS = int(os.getenv("LOG_MAX_ITEMS", "20"))
+LOG_SAMPLE_FIRST = int(os.getenv("LOG_SAMPLE_FIRST", "10"))
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "100"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_FLUSH_TIMEOUT = float(os.getenv("LOG_FLUSH_TIMEOUT", "5"))
+
+_setup_lock = threading.Lock()
+_background_handler = None
+_sample_counts = {}
+
+
+class Summarized:
+    """Lazy, size-bounded string representation of a value."""
+
+    __slots__ = ["value"]
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return summarize(self.value)
+
+    __repr__ = __str__
+
+
+def summarize(value, max_items: int = LOG_MAX_ITEMS, max_chars: int = LOG_MAX_ARG_CHARS) -> str:
+    """String representation of value with collections limited to max_items and text limited to max_chars."""
+    if isinstance(value, (list, tuple, set)) and len(value) > max_items:
+        items = list(value)[:max_items]
+        text = f"{items}... ({len(value)} items)"
+    elif isinstance(value, dict) and len(value) > max_items:
+        items = dict(list(value.items())[:max_items])
+        text = f"{items}... ({len(value)} items)"
+    else:
+        text = str(value)
+    if len(text) > max_chars:
+        text = f"{text[:max_chars]}... ({len(text)} chars)"
+    return text
+
+
+class BackgroundHandler(logging.Handler):
+    """Formats records in the calling thread (bounded in size) and writes them to the target handlers
+    from a background thread, so that slow handlers do not block the hot path."""
+
+    def __init__(self, handlers):
+        super().__init__()
+        self.handlers = handlers
+        self.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, name="commonek-logging", daemon=True)
+        self.thread.start()
+
+    def emit(self, record):
+        try:
+            message = record.getMessage()
+            if len(message) > LOG_MAX_MESSAGE_CHARS:
+                message = f"{message[:LOG_MAX_MESSAGE_CHARS]}... (truncated {len(message)} chars)"
+            record.msg = message
+            record.args = None
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if isinstance(item, threading.Event):
+                item.set()
+            else:
+                for handler in self.handlers:
+                    if item.levelno >= handler.level:
+                        try:
+                            handler.handle(item)
+                        except Exception:
+                            handler.handleError(item)
+            self.queue.task_done()
+
+    def flush(self, timeout: float = LOG_FLUSH_TIMEOUT):
+        if not self.thread.is_alive():
+            return
+        if self.queue.unfinished_tasks:
+            done = threading.Event()
+            try:
+                self.queue.put(done, timeout=timeout)
+                done.wait(timeout)
+            except queue.Full:
+                pass
+        for handler in self.handlers:
+            handler.flush()
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            for handler in self.handlers:
+                handler.handle(logging.makeLogRecord({
+                    "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": f"commonek.logging - dropped {dropped} log records, queue was full",
+                }))
+
+
+def setup_logging():
+    """Configures Cloud Logging on the first use (not at import time) behind the background handler."""
+    global _background_handler
+    if _background_handler is not None:
+        return
+    with _setup_lock:
+        if _background_handler is not None:
+            return
+        try:
+            import google.cloud.logging_v2
+
+            logging_client = google.cloud.logging_v2.Client()
+            logging_client.setup_logging()
+        except Exception as exc:  # still log locally when Cloud Logging is not available
+            print(f"commonek.logging - Cloud Logging not configured: {exc}")
+
+        logging.basicConfig(level=logging.INFO)
+        root = logging.getLogger()
+        root.setLevel(logging.INFO)
+        _background_handler = BackgroundHandler(list(root.handlers))
+        root.handlers = [_background_handler]
+        atexit.register(_background_handler.flush)
+
+
+def _sampled_out(message) -> bool:
+    """Logs the first LOG_SAMPLE_FIRST occurrences of a message template, then one out of LOG_SAMPLE_EVERY."""
+    count = _sample_counts.get(message, 0) + 1
+    _sample_counts[message] = count
+    return count > LOG_SAMPLE_FIRST and count % LOG_SAMPLE_EVERY != 0
+
+
+def _log(level, message, args, sample):
+    setup_logging()
+    if not logging.getLogger().isEnabledFor(level):
+        return
+    if sample and _sampled_out(message):
+        return
+    args = tuple(Summarized(arg) for arg in args)
+    if sample and _sample_counts[message] > LOG_SAMPLE_FIRST:
+        message = f"{message} (sampled, occurrence {_sample_counts[message]})"
+    logging.log(level, message, *args)
+    if debug:
+        print(message % args if args else message)
+
 
 class Logger:
-    """class def handling logs."""
+    """class def handling logs.
+
+    Use %-style arguments for large values: `Logger.info("rows=%s", rows)`. Pass sample=True for messages
+    repeated per task, so that only a sample of them is written.
+    """
 
     @staticmethod
-    def info(message):
+    def info(message, *args, sample=False):
         """Display info logs."""
-        logging.info(message)
-        if debug:
-            print(message)
+        _log(logging.INFO, message, args, sample)
 
     @staticmethod
-    def warning(message):
+    def warning(message, *args, sample=False):
         """Display warning logs."""
-        logging.warning(message)
-        if debug:
-            print(message)
+        _log(logging.WARNING, message, args, sample)
 
     @staticmethod
-    def error(message):
+    def error(message, *args, sample=False):
         """Display error logs."""
-        logging.error(message)
-        if debug:
-            print(message)
+        _log(logging.ERROR, message, args, sample)
 
     @staticmethod
-    def debug(message):
+    def debug(message, *args, sample=False):
         """Display debug logs."""
-        logging.debug(message)
-        if debug:
-            print(message)
+        _log(logging.DEBUG, message, args, sample)
+
+    @staticmethod
+    def flush():
+        """Wait until all the log records are written."""
+        if _background_handler is not None:
+            _background_handler.flush()
+
+
+def flush_logs(fn):
+    """Decorator for the Cloud Function entry points, flushing the logs before the function returns."""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            Logger.flush()
+
+    return wrapper
@@ -20,8 +20,14 @@ PROJECT_ID = os.getenv("GCP_PROJECT", os.environ.get("PROJECT_ID", ""))
 assert PROJECT_ID, "PROJECT_ID is not set"
 
 REGION = os.getenv("GCLOUD_REGION", "us-central1")
+NETWORK = os.getenv("GCLOUD_NETWORK", "default")
+SUBNET = os.getenv("GCLOUD_SUBNET", "default")
 BIGQUERY_DB_TASKS = os.getenv("BIGQUERY_DB_TASKS", "dragen_illumina.tasks_status")
 BIGQUERY_DB_JOB_ARRAY = os.getenv("BIGQUERY_DB_JOB_ARRAY", "dragen_illumina.job_array")
+BIGQUERY_DB_TASK_METRICS = os.getenv("BIGQUERY_DB_TASK_METRICS", "dragen_illumina.task_metrics")
+BIGQUERY_DB_QC_METRICS = os.getenv("BIGQUERY_DB_QC_METRICS", "dragen_illumina.qc_metrics")
+BIGQUERY_DB_SPECULATION = os.getenv("BIGQUERY_DB_SPECULATION", "dragen_illumina.speculative_tasks")
+BIGQUERY_DB_INPUT_ALIASES = os.getenv("BIGQUERY_DB_INPUT_ALIASES", "dragen_illumina.input_aliases")
 
 # DRAGEN INPUT TYPE
 CRAM_INPUT = "cram"
@@ -30,15 +36,70 @@ FASTQ_INPUT = "fastq"
 ######
 
 JOB_LABEL_NAME = "dragen-job"
+SPECULATIVE_LABEL = "speculative-of"  # name of the job of the original task, on the side jobs (see speculation.py)
 
 # Scheduler
 JOBS_LIST_URI = os.getenv(
     "JOBS_LIST_URI", f"gs://{PROJECT_ID}-trigger/scheduler/jobs.csv"
 )
 JOB_LIST_FILE_NAME = os.path.basename(JOBS_LIST_URI)
+SCHEDULER_STATE_URI = os.getenv(
+    "SCHEDULER_STATE_URI", f"{os.path.dirname(JOBS_LIST_URI)}/scheduler_state.json"
+)
+DAG_STATE_URI = os.getenv("DAG_STATE_URI", f"{os.path.dirname(JOBS_LIST_URI)}/dag_state.json")
+SCHEDULER_DEFAULT_GROUP = "default"
+SCHEDULER_GROUP_WEIGHTS = os.getenv("SCHEDULER_GROUP_WEIGHTS", "")  # such as clinical=4,research=1
+SCHEDULER_AGING_SECONDS = float(os.getenv("SCHEDULER_AGING_SECONDS", "3600"))
+SCHEDULER_USAGE_HALF_LIFE_SECONDS = float(os.getenv("SCHEDULER_USAGE_HALF_LIFE_SECONDS", "86400"))
+
+# Resubmission of the transient failures (see recovery.py), attempts per sample are kept in RECOVERY_STATE_URI
+RECOVERY_STATE_URI = os.getenv("RECOVERY_STATE_URI", f"{os.path.dirname(JOBS_LIST_URI)}/recovery_state.json")
+RECOVERY_MAX_ATTEMPTS = int(os.getenv("RECOVERY_MAX_ATTEMPTS", "2"))
+RECOVERY_AUTO = os.getenv("RECOVERY_AUTO", "false").lower() in ["true", "1", "yes"]
 
 TRIGGER_FILE_NAME = os.getenv("TRIGGER_FILE_NAME", "START_PIPELINE")
 
+# Admission control: quota budgets in vCPUs per machine family, such as e2=96,n2=128 (empty - disabled)
+ADMISSION_QUOTA_BUDGETS = os.getenv("ADMISSION_QUOTA_BUDGETS", "")
+ADMISSION_MIN_PARALLELISM = int(os.getenv("ADMISSION_MIN_PARALLELISM", "1"))
+
+# Placement of the jobs across Batch regions (see placement.py): <region>[:<network>[:<subnet>[:<vCPU budget>]]],
+# comma separated, such as us-central1:default:default:96,us-east4:dragen:dragen-east4:64 (empty - REGION only).
+# Jobs of at least PLACEMENT_SHARD_MIN_TASKS tasks are split into one job per region (0 - never split)
+BATCH_REGIONS = os.getenv("BATCH_REGIONS", "")
+PLACEMENT_SHARD_MIN_TASKS = int(os.getenv("PLACEMENT_SHARD_MIN_TASKS", "0"))
+
+# Tail-overlap prefetch (see prefetch.py): the next job of jobs.csv is triggered once fewer than PREFETCH_ACTIVE_TASKS
+# tasks of the running job are pending or running, instead of on its completion (0 - disabled)
+PREFETCH_ACTIVE_TASKS = int(os.getenv("PREFETCH_ACTIVE_TASKS", "0"))
+
+# Speculative re-execution of the stragglers (see speculation.py): tasks running longer than the SPECULATION_PERCENTILE
+# of the durations predicted for their DRAGEN app and input size (and at least SPECULATION_MIN_SECONDS) get a duplicate
+# in a side job, up to SPECULATION_MAX_ACTIVE duplicates at a time (0 - disabled)
+SPECULATION_PERCENTILE = float(os.getenv("SPECULATION_PERCENTILE", "0"))
+SPECULATION_MIN_SECONDS = int(os.getenv("SPECULATION_MIN_SECONDS", "1800"))
+SPECULATION_MAX_ACTIVE = int(os.getenv("SPECULATION_MAX_ACTIVE", "10"))
+SPECULATION_STATE_URI = os.getenv("SPECULATION_STATE_URI",
+                                  f"{os.path.dirname(JOBS_LIST_URI)}/speculation_state.json")
+
+# Reconciliation of the task statuses (see reconciler.py): tasks of the jobs active or updated during the last
+# RECONCILE_LOOKBACK_HOURS are compared with tasks_status, listing the tasks of RECONCILE_MAX_WORKERS jobs at a time
+RECONCILE_LOOKBACK_HOURS = float(os.getenv("RECONCILE_LOOKBACK_HOURS", "24"))
+RECONCILE_MAX_WORKERS = int(os.getenv("RECONCILE_MAX_WORKERS", "16"))
+# transitions more recent than this are left to the Pub/Sub events still being delivered
+RECONCILE_SETTLE_SECONDS = float(os.getenv("RECONCILE_SETTLE_SECONDS", "600"))
+
+# Harvest of the DRAGEN QC metrics (see qc_metrics.py), run by the scheduler on job completion when enabled
+QC_HARVEST_AUTO = os.getenv("QC_HARVEST_AUTO", "false").lower() in ["true", "1", "yes"]
+QC_HARVEST_MAX_WORKERS = int(os.getenv("QC_HARVEST_MAX_WORKERS", "16"))
+
+# Inputs pre-flight check
+PREFLIGHT_MAX_WORKERS = int(os.getenv("PREFLIGHT_MAX_WORKERS", "32"))
+PREFLIGHT_OUTLIER_FACTOR = float(os.getenv("PREFLIGHT_OUTLIER_FACTOR", "5"))
+
+# Deduplication of the inputs by content (off, skip or alias), can be set per job in run_options.dedup
+DEDUP_MODE = os.getenv("DEDUP_MODE", "off").lower()
+
 # header for Jobs
 BATCH_TASK_INDEX = "BATCH_TASK_INDEX"
 INPUT_TYPE = "INPUT_TYPE"
@@ -58,10 +119,25 @@ DRAGEN_SUCCESS_ENTRIES = [
 
 # Task Job Status
 SCHEDULED = "SCHEDULED"
+RUNNING = "RUNNING"
 SUCCEEDED = "SUCCEEDED"
 FAILED = "FAILED"
 TASK_VERIFIED_OK = "VERIFIED_OK"
 TASK_VERIFIED_FAILED = "VERIFIED_FAILED"
+TASK_PREEMPTED = "PREEMPTED"  # Spot VM of the task was preempted (the task is retried or fails)
+
+# Task retry policy (see provisioning.py), exit codes retried in addition to the Batch VM failures,
+# and exit codes of deterministic DRAGEN errors (such as invalid options or inputs) failing the task without retries
+TASK_RETRY_EXIT_CODES = os.getenv("TASK_RETRY_EXIT_CODES", "")
+TASK_FAIL_EXIT_CODES = os.getenv("TASK_FAIL_EXIT_CODES", "")
+
+# DRAGEN options catalog (see dragen_command_helper.py): `dragen --help` output, defaults to data/dragen_help.txt,
+# and comma separated options to accept in addition (such as options of a newer DRAGEN version)
+DRAGEN_HELP_PATH = os.getenv("DRAGEN_HELP_PATH", "")
+DRAGEN_EXTRA_OPTIONS = os.getenv("DRAGEN_EXTRA_OPTIONS", "")
+
+# Tracing spans around cloud API calls
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() in ["true", "1", "yes"]
 
 # SLACK Integration
 SLACK_CHANNEL = os.getenv("SLACK_CHANNEL")
@@ -0,0 +1,158 @@
+"""
+Copyright 2022 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Runs the phases of a pipeline (such as the job creation) as a dependency graph.
+
+Every phase is a function receiving the results of the phases it depends on as keyword arguments. Phases whose
+dependencies are complete run concurrently on a thread pool. A phase raising an exception stops the pipeline:
+phases not started yet are skipped and the exception is raised by `run()`.
+
+After the run, `report()` lists for every phase its start offset, duration and critical-path time (the longest chain
+of dependencies ending with the phase), and the critical path of the whole pipeline.
+"""
+
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+from commonek.logging import Logger
+from commonek.tracing import span
+
+
+class PipelineAbort(Exception):
+    """Raised by a phase to stop the pipeline without it being an unexpected error."""
+
+
+class Phase:
+    __slots__ = ["name", "fn", "depends_on", "result", "start", "end", "error"]
+
+    def __init__(self, name: str, fn: Callable, depends_on: List[str]):
+        self.name = name
+        self.fn = fn
+        self.depends_on = depends_on
+        self.result = None
+        self.start: Optional[float] = None
+        self.end: Optional[float] = None
+        self.error: Optional[BaseException] = None
+
+    @property
+    def duration(self) -> float:
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.end - self.start
+
+
+class PhasePipeline:
+    def __init__(self, name: str, max_workers: int = 8):
+        self.name = name
+        self.max_workers = max_workers
+        self.phases: Dict[str, Phase] = {}
+        self.started_at = 0.0
+
+    def add(self, name: str, fn: Callable, depends_on: Optional[List[str]] = None):
+        depends_on = list(depends_on or [])
+        for dep in depends_on:
+            assert dep in self.phases, f"Phase {name} depends on unknown phase {dep} (add phases in order)"
+        self.phases[name] = Phase(name, fn, depends_on)
+        return self
+
+    def _run_phase(self, phase: Phase):
+        phase.start = time.perf_counter()
+        try:
+            with span(f"phase.{phase.name}", pipeline=self.name):
+                kwargs = {dep: self.phases[dep].result for dep in phase.depends_on}
+                phase.result = phase.fn(**kwargs)
+        finally:
+            phase.end = time.perf_counter()
+        return phase.result
+
+    def run(self) -> Dict:
+        """Runs all the phases, returns their results by phase name."""
+        self.started_at = time.perf_counter()
+        done, running = set(), {}
+        failed = None
+        with span(f"pipeline.{self.name}"), ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while len(done) < len(self.phases) and failed is None:
+                for name, phase in self.phases.items():
+                    if name in done or name in running.values():
+                        continue
+                    if all(dep in done for dep in phase.depends_on):
+                        # each phase gets a copy of the context, so that its spans nest under the pipeline span
+                        context = contextvars.copy_context()
+                        running[executor.submit(context.run, self._run_phase, phase)] = name
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        self.phases[name].error = error
+                        failed = failed or error
+                    else:
+                        done.add(name)
+            # after a failure, the executor still waits for the phases already running
+
+        self.log_report()
+        if failed is not None:
+            raise failed
+        return {name: phase.result for name, phase in self.phases.items()}
+
+    def critical_times(self) -> Dict[str, float]:
+        """Longest chain of phase durations ending with every phase (phases are added in dependency order)."""
+        times = {}
+        for name, phase in self.phases.items():
+            times[name] = phase.duration + max([times[dep] for dep in phase.depends_on], default=0.0)
+        return times
+
+    def critical_path(self) -> List[str]:
+        times = self.critical_times()
+        finished = [name for name, phase in self.phases.items() if phase.end is not None]
+        if not finished:
+            return []
+        path = [max(finished, key=lambda name: times[name])]
+        while self.phases[path[-1]].depends_on:
+            path.append(max(self.phases[path[-1]].depends_on, key=lambda name: times[name]))
+        return list(reversed(path))
+
+    def report(self) -> Dict:
+        times = self.critical_times()
+        phases = []
+        for name, phase in self.phases.items():
+            phases.append({
+                "phase": name,
+                "depends_on": phase.depends_on,
+                "start_ms": round((phase.start - self.started_at) * 1000, 3) if phase.start is not None else None,
+                "duration_ms": round(phase.duration * 1000, 3),
+                "critical_path_ms": round(times[name] * 1000, 3),
+                "status": "error" if phase.error else ("done" if phase.end is not None else "skipped"),
+            })
+        path = self.critical_path()
+        return {
+            "pipeline": self.name,
+            "critical_path": path,
+            "critical_path_ms": round(times[path[-1]] * 1000, 3) if path else 0.0,
+            "phases": phases,
+        }
+
+    def log_report(self):
+        report = self.report()
+        Logger.info(f"{self.name} - critical path {' -> '.join(report['critical_path'])} "
+                    f"in {report['critical_path_ms']} ms")
+        for phase in report["phases"]:
+            Logger.info(f"{self.name} - phase {phase['phase']} {phase['status']}: start {phase['start_ms']} ms, "
+                        f"duration {phase['duration_ms']} ms, critical path {phase['critical_path_ms']} ms")
@@ -0,0 +1,210 @@
+"""
+Copyright 2022 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Placement of the jobs across Batch regions.
+
+Regions are configured in BATCH_REGIONS with their network, subnet and a budget in vCPUs, such as
+us-central1:default:default:96,us-east4:dragen:dragen-east4:64. The vCPUs in use per region are counted from the
+active jobs as done by the admission control (every job commits min(parallelism, active tasks) VMs).
+
+    - A job is placed in the region with the most vCPUs left in its budget (regions without a budget have no limit,
+      the least loaded one is used between them).
+    - A job of at least PLACEMENT_SHARD_MIN_TASKS tasks is split into shards, one job per region: the parallelism of
+      the job is spread over the regions with room for at least one task (most room first, so that the requested
+      parallelism is never exceeded in total) and the tasks are split in proportion. What does not fit anywhere
+      goes to the region with the most room, where the tasks wait in the Batch queue.
+Without BATCH_REGIONS, all the jobs run in REGION with GCLOUD_NETWORK / GCLOUD_SUBNET and the Batch API is not called.
+"""
+
+import math
+from typing import Dict, List, Optional
+
+from google.cloud import batch_v1
+
+from commonek.admission import Capacity
+from commonek.batch_helper import get_job_by_name
+from commonek.batch_helper import list_active_jobs
+from commonek.logging import Logger
+from commonek.params import BATCH_REGIONS
+from commonek.params import JOB_LABEL_NAME
+from commonek.params import NETWORK
+from commonek.params import PLACEMENT_SHARD_MIN_TASKS
+from commonek.params import PROJECT_ID
+from commonek.params import REGION
+from commonek.params import SUBNET
+
+SHARD_LABEL = "dragen-shard"  # <shard>-of-<shards>, on the jobs of a job split across regions
+
+
+class BatchRegion:
+    __slots__ = ["name", "network", "subnet", "vcpu_budget"]
+
+    def __init__(self, name: str, network: str = NETWORK, subnet: str = SUBNET, vcpu_budget: Optional[float] = None):
+        self.name = name
+        self.network = network
+        self.subnet = subnet
+        self.vcpu_budget = vcpu_budget  # None - no limit
+
+    @property
+    def parent(self) -> str:
+        return f"projects/{PROJECT_ID}/locations/{self.name}"
+
+    @property
+    def network_id(self) -> str:
+        return f"projects/{PROJECT_ID}/global/networks/{self.network}"
+
+    @property
+    def subnetwork_id(self) -> str:
+        return f"projects/{PROJECT_ID}/regions/{self.name}/subnetworks/{self.subnet}"
+
+    def headroom(self, used_vcpus: float) -> float:
+        return math.inf if self.vcpu_budget is None else self.vcpu_budget - used_vcpus
+
+    def room(self, used_vcpus: float, vcpus_per_task: float) -> float:
+        """Number of tasks fitting into the budget."""
+        return math.inf if self.vcpu_budget is None else self.headroom(used_vcpus) // vcpus_per_task
+
+    def __repr__(self):
+        return f"BatchRegion({self.name}, network={self.network}, subnet={self.subnet}, budget={self.vcpu_budget})"
+
+
+class Shard:
+    """Tasks [start, stop) of the job, submitted as one job in the region."""
+    __slots__ = ["region", "start", "stop", "parallelism"]
+
+    def __init__(self, region: BatchRegion, start: int, stop: int, parallelism: int):
+        self.region = region
+        self.start = start
+        self.stop = stop
+        self.parallelism = parallelism
+
+    def __repr__(self):
+        return f"Shard({self.region.name}, tasks={self.start}:{self.stop}, parallelism={self.parallelism})"
+
+
+def parse_regions(value: str) -> List[BatchRegion]:
+    """us-central1:default:default:96,us-east4 -> [BatchRegion(us-central1, ..., 96), BatchRegion(us-east4, ...)]"""
+    regions = []
+    for item in (value or "").split(","):
+        fields = [field.strip() for field in item.split(":")]
+        if not fields[0]:
+            continue
+        network = fields[1] if len(fields) > 1 and fields[1] else NETWORK
+        subnet = fields[2] if len(fields) > 2 and fields[2] else SUBNET
+        budget = float(fields[3]) if len(fields) > 3 and fields[3] else None
+        regions.append(BatchRegion(fields[0], network, subnet, budget))
+    return regions
+
+
+def get_regions() -> List[BatchRegion]:
+    return parse_regions(BATCH_REGIONS) or [BatchRegion(REGION)]
+
+
+def get_region(name: str) -> BatchRegion:
+    """Configured region (with its network and subnet) of the name, such as the Region of a Pub/Sub message."""
+    for region in get_regions():
+        if region.name == name:
+            return region
+    return BatchRegion(name)
+
+
+def get_region_loads(regions: Optional[List[BatchRegion]] = None) -> Optional[Dict[str, float]]:
+    """vCPUs in use per region, None when there is a single region (nothing to choose from)."""
+    regions = regions if regions is not None else get_regions()
+    if len(regions) < 2:
+        return None
+    capacity = Capacity.from_batch([region.name for region in regions])
+    return {region.name: capacity.used_in_region(region.name) for region in regions}
+
+
+def place_job(vcpus: float, regions: Optional[List[BatchRegion]] = None,
+              loads: Optional[Dict[str, float]] = None) -> BatchRegion:
+    """Region with the most room left after the job (vCPUs it commits), then the least loaded one."""
+    regions = regions if regions is not None else get_regions()
+    if len(regions) == 1 or loads is None:
+        return regions[0]
+    return max(regions, key=lambda region: (region.headroom(loads.get(region.name, 0)) - vcpus,
+                                            -loads.get(region.name, 0)))
+
+
+def plan_shards(task_count: int, vcpus_per_task: float, parallelism: int,
+                regions: Optional[List[BatchRegion]] = None, loads: Optional[Dict[str, float]] = None,
+                min_tasks: int = PLACEMENT_SHARD_MIN_TASKS) -> List[Shard]:
+    """Shards of the job across the regions, a single shard unless the job has at least min_tasks tasks."""
+    regions = regions if regions is not None else get_regions()
+    parallelism = max(1, int(parallelism))
+    if loads is None or len(regions) == 1 or not min_tasks or task_count < max(min_tasks, 2):
+        region = place_job(min(parallelism, task_count) * vcpus_per_task, regions, loads)
+        return [Shard(region, 0, task_count, parallelism)]
+
+    # room in tasks of every region, most room first
+    room = sorted(((region, region.room(loads.get(region.name, 0), vcpus_per_task)) for region in regions),
+                  key=lambda item: (-item[1], loads.get(item[0].name, 0)))
+    slots = []
+    remaining = min(parallelism, task_count)
+    for region, tasks in room:
+        share = int(min(remaining, tasks))
+        if share >= 1:
+            slots.append([region, share])
+            remaining -= share
+    if not slots:
+        slots.append([room[0][0], 0])
+    slots[0][1] += remaining
+
+    # tasks in proportion of the parallelism of the shards (largest remainders)
+    total = sum(share for _, share in slots)
+    counts = [task_count * share // total for _, share in slots]
+    by_remainder = sorted(range(len(slots)), key=lambda i: -(task_count * slots[i][1] % total))
+    for i in by_remainder[:task_count - sum(counts)]:
+        counts[i] += 1
+
+    shards = []
+    start = 0
+    for (region, share), count in zip(slots, counts):
+        if count:
+            shards.append(Shard(region, start, start + count, min(share, count)))
+            start += count
+    Logger.info(f"plan_shards - {task_count} tasks, parallelism {parallelism}, loads {loads}: {shards}")
+    return shards
+
+
+def shard_label(index: int, count: int) -> str:
+    return f"{index + 1}-of-{count}"
+
+
+def other_active_shards(job: batch_v1.Job) -> List[batch_v1.Job]:
+    """Active jobs of the other shards of a sharded job (same label), in all the regions."""
+    labels = job.labels or {}
+    if SHARD_LABEL not in labels or JOB_LABEL_NAME not in labels:
+        return []
+    shards = []
+    for region in get_regions():
+        for active_job in list_active_jobs(region.name):
+            active_labels = active_job.labels or {}
+            if (active_job.name != job.name and SHARD_LABEL in active_labels
+                    and active_labels.get(JOB_LABEL_NAME) == labels[JOB_LABEL_NAME]):
+                shards.append(active_job)
+    return shards
+
+
+def find_job_by_name(job_name: str) -> Optional[batch_v1.Job]:
+    """Job of the short name in any of the regions (job_array only keeps the short name of the jobs)."""
+    for region in get_regions():
+        try:
+            return get_job_by_name(job_name, region.name)
+        except Exception as exc:
+            Logger.info(f"find_job_by_name - {job_name} not in {region.name}: {exc}")
+    return None
@@ -0,0 +1,89 @@
+"""
+Copyright 2022 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Tail-overlap prefetch of the next job of jobs.csv.
+
+At the end of a job only a few straggler tasks are running while most of the parallelism is idle, and the next job
+still waits for the VMs teardown and its own provisioning. With PREFETCH_ACTIVE_TASKS set, every task completion
+(handled by get_status) checks the task counts of the job: once fewer than PREFETCH_ACTIVE_TASKS tasks are pending or
+running (in all the shards of a job split across regions), the next job of the scheduler queue is triggered.
+
+The scheduler state records the prefetched job (see JobQueue.prefetch), so that the next job is triggered only once,
+whichever of the task events or the job completion comes first. Speculative side jobs (see commonek.speculation) carry
+the label of their original job but never trigger the next job. Admission control applies as for any other job: the
+tail of the running job only commits the VMs of its remaining tasks.
+"""
+
+from typing import Optional
+
+from commonek.admission import job_active_tasks
+from commonek.batch_helper import get_job_by_name
+from commonek.csv_helper import trigger_job_from_csv
+from commonek.helper import split_uri_2_bucket_prefix
+from commonek.job_queue import JobEntry
+from commonek.logging import Logger
+from commonek.params import JOB_LABEL_NAME
+from commonek.params import JOBS_LIST_URI
+from commonek.params import PREFETCH_ACTIVE_TASKS
+from commonek.params import REGION
+from commonek.params import RUNNING
+from commonek.placement import SHARD_LABEL
+from commonek.placement import other_active_shards
+from commonek.speculation import SPECULATIVE_LABEL
+
+
+def remaining_tasks(job) -> int:
+    """Tasks of the job still pending or running, with the ones of the other shards of a job split across regions."""
+    remaining = job_active_tasks(job)
+    if SHARD_LABEL in (job.labels or {}):
+        remaining += sum(job_active_tasks(shard) for shard in other_active_shards(job))
+    return remaining
+
+
+def prefetch_next_job(job_name: str, region: Optional[str] = REGION,
+                      threshold: int = PREFETCH_ACTIVE_TASKS) -> Optional[JobEntry]:
+    """Triggers the next job of the queue when fewer than `threshold` tasks of the job are left.
+
+    Args:
+        job_name: short name of the running job, such as job-dragen-ae0e459505.
+        region: Batch region of the job.
+        threshold: number of pending or running tasks below which the next job is started (0 - disabled).
+
+    Returns:
+        The triggered job, None when it is too early, or the next job was already triggered.
+    """
+    if threshold <= 0:
+        return None
+    job = get_job_by_name(job_name=job_name, region=region or REGION)
+    if job is None or JOB_LABEL_NAME not in (job.labels or {}):
+        return None
+    if SPECULATIVE_LABEL in job.labels:
+        # duplicate of a straggler (with the label of its original job), the original job drives the pipeline
+        return None
+    state = job.status.state
+    if getattr(state, "name", state) != RUNNING:  # JobStatus.State enum
+        # queued or scheduled jobs have no tasks done yet, completed jobs are handled by the scheduler
+        return None
+    remaining = remaining_tasks(job)
+    if remaining >= threshold:
+        return None
+
+    job_label = job.labels[JOB_LABEL_NAME]
+    Logger.info(f"prefetch_next_job - {remaining} tasks left in {job_name} ({job_label}), "
+                f"below {threshold}: triggering the next job")
+    bucket_name, file_path = split_uri_2_bucket_prefix(JOBS_LIST_URI)
+    return trigger_job_from_csv(bucket_name=bucket_name, file_path=file_path, previous_job_label=job_label,
+                                early=True)
@@ -0,0 +1,242 @@
+"""
+Copyright 2022 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Live progress of a job (or of all the jobs of a label) from the Batch task listings.
+
+The first poll lists all the tasks of a job, the next ones only the tasks still pending, assigned or running (paged,
+filtered by the Batch API): SUCCEEDED, FAILED and UNEXECUTED are final, so the finished tasks are never listed again.
+The tasks which left the active listing since the previous poll are read one by one for their final state, and the
+tasks of a deleted job become DELETED. Every poll returns the state changes since the previous one, the counts per
+state, the completions per hour over the last THROUGHPUT_WINDOW_SECONDS and the ETA of the remaining tasks at that rate.
+
+Jobs no longer in Batch (deleted, or past the retention) are only in the BigQuery tables: the history of a job or label
+is read from tasks_status, as by sql-scripts/run_query.sh -n count.
+"""
+
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from google.api_core.exceptions import NotFound
+from google.cloud import batch_v1
+
+from commonek.batch_helper import ACTIVE_TASK_STATES
+from commonek.batch_helper import get_job_by_name
+from commonek.batch_helper import get_task
+from commonek.batch_helper import label_filter
+from commonek.batch_helper import list_jobs
+from commonek.batch_helper import list_tasks
+from commonek.bq_helper import run_query
+from commonek.logging import Logger
+from commonek.params import BIGQUERY_DB_TASKS
+from commonek.params import FAILED
+from commonek.params import JOB_LABEL_NAME
+from commonek.params import PROJECT_ID
+from commonek.params import RUNNING
+from commonek.params import TASK_PREEMPTED
+from commonek.params import TASK_VERIFIED_FAILED
+from commonek.params import TASK_VERIFIED_OK
+from commonek.placement import find_job_by_name, get_regions
+
+FINAL_TASK_STATES = ["SUCCEEDED", "FAILED", "UNEXECUTED"]
+DELETED = "DELETED"  # tasks of a job deleted before they completed
+DELETED_JOB_STATES = ["DELETION_IN_PROGRESS"]
+THROUGHPUT_WINDOW_SECONDS = 900
+
+
+def state_name(state) -> str:
+    return getattr(state, "name", state)  # TaskStatus.State / JobStatus.State enum
+
+
+def job_region(job_name: str) -> str:
+    """projects/<project>/locations/<region>/jobs/<job> -> <region>"""
+    return job_name.split("/")[3]
+
+
+class TaskChange:
+    __slots__ = ["job_name", "task_name", "previous", "state"]
+
+    def __init__(self, job_name: str, task_name: str, previous: str, state: str):
+        self.job_name = job_name
+        self.task_name = task_name
+        self.previous = previous
+        self.state = state
+
+    @property
+    def task_index(self) -> str:
+        return self.task_name.split("/")[-1]
+
+    def __repr__(self):
+        return f"{self.job_name.split('/')[-1]}/{self.task_index}: {self.previous} -> {self.state}"
+
+
+class Progress:
+    __slots__ = ["timestamp", "jobs", "counts", "changes", "throughput", "eta_seconds"]
+
+    def __init__(self, timestamp: float, jobs: List[str], counts: Dict[str, int], changes: List[TaskChange],
+                 throughput: Optional[float], eta_seconds: Optional[float]):
+        self.timestamp = timestamp
+        self.jobs = jobs
+        self.counts = counts
+        self.changes = changes
+        self.throughput = throughput  # completed tasks per hour, None until two polls apart
+        self.eta_seconds = eta_seconds
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    @property
+    def done(self) -> int:
+        return sum(count for state, count in self.counts.items() if state in FINAL_TASK_STATES + [DELETED])
+
+    @property
+    def remaining(self) -> int:
+        return self.total - self.done
+
+    def to_dict(self) -> Dict:
+        return {"timestamp": self.timestamp, "jobs": self.jobs, "counts": self.counts, "total": self.total,
+                "remaining": self.remaining, "throughput": self.throughput, "eta_seconds": self.eta_seconds,
+                "changes": [repr(change) for change in self.changes]}
+
+
+class ProgressWatcher:
+    """Task states of the watched jobs, updated by every poll."""
+
+    def __init__(self, job_name: Optional[str] = None, job_label: Optional[str] = None,
+                 window: float = THROUGHPUT_WINDOW_SECONDS, page_size: int = 1000):
+        if bool(job_name) == bool(job_label):
+            raise ValueError("ProgressWatcher - one of job_name or job_label is required")
+        self.job_name = job_name  # short name or uid of the job
+        self.job_label = job_label
+        self.window = window
+        self.page_size = page_size
+        self.states: Dict[str, Dict[str, str]] = {}  # full job name -> {task name: state}
+        self.samples = deque()  # (timestamp, done)
+
+    def find_jobs(self) -> Dict[str, batch_v1.Job]:
+        """{full job name: job} of the watched jobs currently in Batch."""
+        jobs = {}
+        if self.job_label:
+            for region in get_regions():
+                for job in list_jobs(region.name, filter=label_filter(JOB_LABEL_NAME, self.job_label)):
+                    jobs[job.name] = job
+            return jobs
+        if self.states:  # resolved by the first poll
+            name = next(iter(self.states))
+            try:
+                jobs[name] = get_job_by_name(name.split("/")[-1], job_region(name))
+            except NotFound:
+                pass
+            return jobs
+        job = find_job_by_name(self.job_name)
+        if job is None:
+            for region in get_regions():
+                job = next((job for job in list_jobs(region.name) if job.uid == self.job_name), None)
+                if job is not None:
+                    break
+        if job is not None:
+            jobs[job.name] = job
+        return jobs
+
+    def poll_job(self, job: Optional[batch_v1.Job], job_name: str) -> List[TaskChange]:
+        known = self.states.get(job_name)
+        if known is None:
+            self.states[job_name] = {task.name: state_name(task.status.state)
+                                     for task in list_tasks(job_name, page_size=self.page_size)}
+            return []
+        pending = [name for name, state in known.items() if state not in FINAL_TASK_STATES + [DELETED]]
+        if not pending:
+            return []
+        if job is None or state_name(job.status.state) in DELETED_JOB_STATES:
+            active = {}
+            final = {name: DELETED for name in pending}
+        else:
+            active = {task.name: state_name(task.status.state)
+                      for task in list_tasks(job_name, ACTIVE_TASK_STATES, page_size=self.page_size)}
+            final = {}
+            for name in pending:
+                if name not in active:
+                    try:
+                        final[name] = state_name(get_task(name).status.state)
+                    except NotFound:
+                        final[name] = DELETED
+        changes = []
+        for name in pending:
+            state = active.get(name) or final.get(name)
+            if state and state != known[name]:
+                changes.append(TaskChange(job_name, name, known[name], state))
+                known[name] = state
+        return changes
+
+    def poll(self, now: Optional[float] = None) -> Progress:
+        now = time.time() if now is None else now
+        jobs = self.find_jobs()
+        changes = []
+        for job_name in list(dict.fromkeys(list(self.states) + list(jobs))):
+            try:
+                changes += self.poll_job(jobs.get(job_name), job_name)
+            except NotFound:
+                changes += self.poll_job(None, job_name)
+            except Exception as exc:
+                Logger.error(f"ProgressWatcher.poll - could not list the tasks of {job_name}: {exc}")
+
+        counts = {}
+        for states in self.states.values():
+            for state in states.values():
+                counts[state] = counts.get(state, 0) + 1
+        progress = Progress(now, list(self.states), counts, changes, None, None)
+
+        # completions over the window, from the last sample before the window on
+        self.samples.append((now, progress.done))
+        while len(self.samples) > 2 and self.samples[1][0] <= now - self.window:
+            self.samples.popleft()
+        start, done = self.samples[0]
+        if now > start:
+            progress.throughput = (progress.done - done) * 3600 / (now - start)
+            if progress.throughput > 0:
+                progress.eta_seconds = progress.remaining * 3600 / progress.throughput
+        return progress
+
+
+def load_history(job_name: Optional[str] = None, job_label: Optional[str] = None) -> Dict[str, int]:
+    """Counts of the tasks per latest status in tasks_status, for a job (short name or uid) or a label."""
+    if job_name:
+        where = f"job_name = '{job_name}' OR job_id = '{job_name}'"
+    else:
+        where = f"job_label = '{job_label}'"
+    sql = f"""
+    WITH latest AS (
+        SELECT task_id, status,
+            COUNTIF(status = '{TASK_PREEMPTED}') OVER (PARTITION BY task_id) AS preemptions
+        FROM `{PROJECT_ID}.{BIGQUERY_DB_TASKS}`
+        WHERE {where}
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY task_id ORDER BY timestamp DESC,
+                                   STARTS_WITH(status, 'VERIFIED') DESC) = 1
+    )
+    SELECT
+        COUNT(1) AS total,
+        COUNTIF(status = '{RUNNING}') AS running,
+        COUNTIF(status = '{FAILED}') AS failed,
+        COUNTIF(status = '{TASK_VERIFIED_OK}') AS verified_ok,
+        COUNTIF(status = '{TASK_VERIFIED_FAILED}') AS verified_failed,
+        SUM(preemptions) AS preemptions
+    FROM latest
+    """
+    results = run_query(sql)
+    for row in results or []:
+        return {key: int(value or 0) for key, value in row.items()}
+    return {}
@@ -0,0 +1,166 @@
+"""
+Copyright 2022 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Provisioning model of the job VMs (Spot or standard) and the retry policy of the tasks.
+
+run_options:
+    - provisioning_model: STANDARD (default), SPOT, or SPOT_WITH_FALLBACK. With the fallback, the tasks which still
+      failed because of a preemption once their retries are exhausted are submitted again as a new job on STANDARD VMs
+      (with the same job label, so the scheduler continues with the new job).
+    - retry_exit_codes: exit codes retried (up to max_retry_count) in addition to the Batch VM failure codes
+      (defaults to TASK_RETRY_EXIT_CODES).
+    - fail_exit_codes: exit codes failing the task at once, for deterministic DRAGEN errors which would fail the same
+      way on every attempt (defaults to TASK_FAIL_EXIT_CODES, empty - opt-in).
+"""
+
+import re
+import uuid
+from typing import Dict, List, Optional
+
+from google.cloud import batch_v1
+
+from commonek.batch_helper import create_job_from_template
+from commonek.batch_helper import state_filter
+from commonek.bq_helper import run_query
+from commonek.logging import Logger
+from commonek.params import BIGQUERY_DB_JOB_ARRAY
+from commonek.params import FAILED
+from commonek.params import PROJECT_ID
+from commonek.params import TASK_FAIL_EXIT_CODES
+from commonek.params import TASK_RETRY_EXIT_CODES
+
+STANDARD = "STANDARD"
+SPOT = "SPOT"
+SPOT_WITH_FALLBACK = "SPOT_WITH_FALLBACK"
+PROVISIONING_MODELS = [STANDARD, SPOT, SPOT_WITH_FALLBACK]
+PROVISIONING_LABEL = "provisioning"
+
+# Exit codes reserved by Batch: https://cloud.google.com/batch/docs/troubleshooting#reserved-exit-codes
+EXIT_CODE_PREEMPTED = 50001
+EXIT_CODE_VM_REPORTING_TIMEOUT = 50002
+EXIT_CODE_VM_REBOOTED = 50003
+EXIT_CODE_TASK_UNRESPONSIVE = 50004
+EXIT_CODE_VM_RECREATED = 50006
+VM_FAILURE_EXIT_CODES = [EXIT_CODE_PREEMPTED, EXIT_CODE_VM_REPORTING_TIMEOUT, EXIT_CODE_VM_REBOOTED,
+                         EXIT_CODE_TASK_UNRESPONSIVE, EXIT_CODE_VM_RECREATED]
+
+JOB_ARRAY_COLUMNS = ["variables", "job_id", "timestamp", "job_label", "command", "job_name", "input_type",
+                     "input_path", "output_path", "sample_id", "input_size", "input_hash", "config_hash"]
+
+
+def parse_exit_codes(value) -> List[int]:
+    """"1,2" or [1, 2] -> [1, 2]"""
+    if isinstance(value, (list, tuple)):
+        return [int(code) for code in value]
+    return [int(code) for code in str(value or "").split(",") if code.strip()]
+
+
+def get_provisioning_model(run_options: Dict) -> str:
+    model = str(run_options.get("provisioning_model", STANDARD)).upper()
+    assert model in PROVISIONING_MODELS, f"Unknown provisioning_model {model}, expected one of {PROVISIONING_MODELS}"
+    return model
+
+
+def provisioning_label(model: str) -> str:
+    """Value of the job label (lowercase letters and dashes): SPOT_WITH_FALLBACK -> spot-with-fallback"""
+    return model.lower().replace("_", "-")
+
+
+def set_provisioning_model(policy: batch_v1.AllocationPolicy.InstancePolicy, model: str):
+    policy.provisioning_model = (batch_v1.AllocationPolicy.ProvisioningModel.STANDARD if model == STANDARD
+                                 else batch_v1.AllocationPolicy.ProvisioningModel.SPOT)
+
+
+def get_lifecycle_policies(run_options: Dict) -> List[batch_v1.LifecyclePolicy]:
+    """Retry on VM failures (such as preemption) and transient exit codes, fail fast on deterministic errors.
+    STANDARD jobs without configured exit codes get no policies, so every failure is retried up to max_retry_count."""
+    configured_retry_codes = parse_exit_codes(run_options.get("retry_exit_codes", TASK_RETRY_EXIT_CODES))
+    configured_fail_codes = parse_exit_codes(run_options.get("fail_exit_codes", TASK_FAIL_EXIT_CODES))
+    if not configured_retry_codes and not configured_fail_codes and get_provisioning_model(run_options) == STANDARD:
+        return []
+
+    retry_codes = VM_FAILURE_EXIT_CODES + configured_retry_codes
+    fail_codes = [code for code in configured_fail_codes if code not in retry_codes]
+
+    policies = []
+    for action, codes in [(batch_v1.LifecyclePolicy.Action.RETRY_TASK, retry_codes),
+                          (batch_v1.LifecyclePolicy.Action.FAIL_TASK, fail_codes)]:
+        if codes:
+            policy = batch_v1.LifecyclePolicy()
+            policy.action = action
+            policy.action_condition = batch_v1.LifecyclePolicy.ActionCondition()
+            policy.action_condition.exit_codes = sorted(set(codes))
+            policies.append(policy)
+    return policies
+
+
+def task_exit_code(task) -> Optional[int]:
+    """Exit code of the last run of the task, from its status events."""
+    for event in reversed(list(task.status.status_events or [])):
+        execution = getattr(event, "task_execution", None)
+        if execution is not None and getattr(execution, "exit_code", 0):
+            return int(execution.exit_code)
+        match = re.search(r"exit code (\d+)", getattr(event, "description", "") or "")
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def is_preempted(task) -> bool:
+    return task_exit_code(task) == EXIT_CODE_PREEMPTED
+
+
+def copy_job_array_rows(job_uid: str, job_name: str, new_job_uid: str, new_job_name: str, indices: List[int]):
+    """Copies the job_array rows of the tasks to the new job, renumbering the tasks in order."""
+    table_id = f"`{PROJECT_ID}.{BIGQUERY_DB_JOB_ARRAY}`"
+    renumber = " ".join(f"WHEN {index} THEN {new_index}" for new_index, index in enumerate(indices))
+    columns = ", ".join(JOB_ARRAY_COLUMNS)
+    values = ", ".join(
+        f"'{new_job_uid}'" if column == "job_id" else f"'{new_job_name}'" if column == "job_name"
+        else "CURRENT_DATETIME()" if column == "timestamp" else column
+        for column in JOB_ARRAY_COLUMNS
+    )
+    sql = f"INSERT INTO {table_id} (batch_task_index, {columns}) " \
+          f"SELECT CASE batch_task_index {renumber} END, {values} FROM {table_id} " \
+          f"WHERE job_id='{job_uid}' AND batch_task_index IN ({', '.join(str(index) for index in indices)})"
+    return run_query(sql)
+
+
+def resubmit_preempted_tasks(job: batch_v1.Job) -> Optional[batch_v1.Job]:
+    """For a failed SPOT_WITH_FALLBACK job, submits the tasks which failed because of a preemption as a new job on
+    STANDARD VMs. Returns the new job, None when there is nothing to resubmit."""
+    if (job.labels or {}).get(PROVISIONING_LABEL) != provisioning_label(SPOT_WITH_FALLBACK):
+        return None
+
+    client = batch_v1.BatchServiceClient()
+    group = job.task_groups[0]
+    failed = client.list_tasks(request=batch_v1.ListTasksRequest(
+        parent=f"{job.name}/taskGroups/group0", filter=state_filter([FAILED])))
+    indices = sorted(int(task.name.split("/")[-1]) for task in failed if is_preempted(task))
+    if not indices:
+        return None
+
+    for instance in job.allocation_policy.instances:
+        set_provisioning_model(instance.policy, STANDARD)
+
+    job_id = f"{job.name.split('/')[-1][:50]}-std{uuid.uuid4().hex[:4]}"
+    created_job = create_job_from_template(
+        job, [group.task_environments[index] for index in indices], job_id,
+        dict(job.labels, **{PROVISIONING_LABEL: provisioning_label(STANDARD)}))
+    Logger.info(f"resubmit_preempted_tasks - {len(indices)} preempted tasks of {job.name} resubmitted on "
+                f"{STANDARD} VMs as {created_job.name}: {indices}")
+    copy_job_array_rows(job.uid, job.name.split("/")[-1], created_job.uid, job_id, indices)
+    return created_job
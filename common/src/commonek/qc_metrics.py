@@ -0,0 +1,179 @@
+"""
+Copyright 2022 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Harvest of the DRAGEN QC metrics (*.mapping_metrics.csv, *.vc_metrics.csv, coverage reports, ...) into BigQuery.
+
+The output directories of the verified tasks not harvested yet are listed from job_array (a single query), their
+metric files are listed (one match_glob listing per directory) and stream-parsed concurrently, and the typed rows are
+written with batched load jobs (no streaming buffer, free of charge). Re-runs only harvest the new samples.
+
+DRAGEN metric files are CSV lines of `section,group,metric,value[,percent]`, such as
+    MAPPING/ALIGNING SUMMARY,,Total input reads,2000000,100.00
+    VARIANT CALLER POSTFILTER,NA12878,Ti/Tv ratio,2.03
+"""
+
+import csv
+import datetime
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+from google.cloud import storage
+
+from commonek.bq_helper import load_rows_to_bigquery, run_query
+from commonek.helper import split_uri_2_bucket_prefix
+from commonek.logging import Logger
+from commonek.params import BIGQUERY_DB_JOB_ARRAY
+from commonek.params import BIGQUERY_DB_QC_METRICS
+from commonek.params import BIGQUERY_DB_TASKS
+from commonek.params import PROJECT_ID
+from commonek.params import QC_HARVEST_MAX_WORKERS
+from commonek.params import TASK_VERIFIED_OK
+from commonek.tracing import traced
+
+storage_client = storage.Client()
+
+METRICS_GLOB = "**metrics.csv"
+LOAD_BATCH_ROWS = 50000  # rows per load job
+
+
+class HarvestTask:
+    __slots__ = ["job_id", "job_label", "batch_task_index", "sample_id", "output_path"]
+
+    def __init__(self, row):
+        for field in self.__slots__:
+            setattr(self, field, getattr(row, field, None))
+
+
+def to_number(value: str) -> Optional[float]:
+    try:
+        return float(value.replace(",", "")) if value not in ("", "NA", "inf", "nan") else None
+    except ValueError:
+        return None
+
+
+def metric_type(file_name: str) -> str:
+    """NA12878.mapping_metrics.csv -> mapping, NA12878.qc-coverage-region-1_coverage_metrics.csv
+    -> qc-coverage-region-1_coverage"""
+    base = os.path.basename(file_name)
+    base = base[:-len("metrics.csv")].rstrip("._")
+    return base.rsplit(".", 1)[-1]
+
+
+def parse_metrics(lines, task: HarvestTask, file_name: str, timestamp: str) -> Iterator[Dict]:
+    """Typed rows of a DRAGEN metrics file (lines are parsed as they are read)."""
+    file_type = metric_type(file_name)
+    for fields in csv.reader(lines):
+        if len(fields) < 4 or not fields[2]:
+            continue
+        value = fields[3].strip()
+        yield {
+            "job_id": task.job_id,
+            "job_label": task.job_label,
+            "batch_task_index": task.batch_task_index,
+            "sample_id": task.sample_id,
+            "file_name": file_name,
+            "metric_type": file_type,
+            "section": fields[0].strip(),
+            "metric_group": fields[1].strip() or None,
+            "metric": fields[2].strip(),
+            "value": to_number(value),
+            "value_string": value,
+            "percent": to_number(fields[4].strip()) if len(fields) > 4 else None,
+            "timestamp": timestamp,
+        }
+
+
+def load_pending_tasks(job_id: Optional[str] = None, job_label: Optional[str] = None) -> List[HarvestTask]:
+    """Verified tasks (of the job or label, or all of them) whose metrics were not harvested yet."""
+    filters = ["Q.job_id IS NULL"]
+    if job_id:
+        filters.append(f"J.job_id = '{job_id}'")
+    if job_label:
+        filters.append(f"J.job_label = '{job_label}'")
+    sql = f"""
+    SELECT DISTINCT J.job_id, J.job_label, J.batch_task_index, J.sample_id, J.output_path
+    FROM `{PROJECT_ID}.{BIGQUERY_DB_JOB_ARRAY}` J
+    JOIN `{PROJECT_ID}.{BIGQUERY_DB_TASKS}` T
+    ON T.job_id = J.job_id AND T.batch_task_index = J.batch_task_index
+        AND T.status = '{TASK_VERIFIED_OK}'
+    LEFT JOIN (SELECT DISTINCT job_id, batch_task_index FROM `{PROJECT_ID}.{BIGQUERY_DB_QC_METRICS}`) Q
+    ON Q.job_id = J.job_id AND Q.batch_task_index = J.batch_task_index
+    WHERE {" AND ".join(filters)}
+    """
+    results = run_query(sql)
+    tasks = [HarvestTask(row) for row in results] if results else []
+    Logger.info(f"load_pending_tasks - {len(tasks)} samples to harvest for job_id={job_id}, job_label={job_label}")
+    return tasks
+
+
+@traced("gcs.harvest_task")
+def harvest_task(task: HarvestTask, timestamp: str) -> List[Dict]:
+    """Rows of all the metric files in the output directory of the task."""
+    if not task.output_path:
+        return []
+    # outputs are written through the S3 interoperability API of Cloud Storage
+    bucket_name, prefix = split_uri_2_bucket_prefix(task.output_path.replace("s3://", "gs://", 1))
+    prefix = prefix.rstrip("/") + "/"
+    rows = []
+    for blob in storage_client.list_blobs(bucket_name, prefix=prefix, match_glob=f"{prefix}{METRICS_GLOB}"):
+        with blob.open("rt") as lines:
+            rows.extend(parse_metrics(lines, task, blob.name[len(prefix):], timestamp))
+    return rows
+
+
+def harvest(job_id: Optional[str] = None, job_label: Optional[str] = None,
+            max_workers: int = QC_HARVEST_MAX_WORKERS) -> Dict:
+    """Harvests the QC metrics of the samples not harvested yet.
+
+    Returns:
+        {"samples": harvested samples, "empty": samples without metric files, "rows": loaded rows}
+    """
+    tasks = load_pending_tasks(job_id=job_id, job_label=job_label)
+    timestamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    table_id = f"{PROJECT_ID}.{BIGQUERY_DB_QC_METRICS}"
+    summary = {"samples": 0, "empty": 0, "rows": 0}
+    pending: List[Dict] = []
+
+    def flush():
+        if pending:
+            errors = load_rows_to_bigquery(pending, table_id)
+            if errors:
+                Logger.error(f"harvest - errors while loading {len(pending)} rows into {table_id}: {errors}")
+            else:
+                summary["rows"] += len(pending)
+            pending.clear()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for task, rows in zip(tasks, executor.map(lambda t: safe_harvest_task(t, timestamp), tasks)):
+            if rows:
+                summary["samples"] += 1
+                pending.extend(rows)
+            else:
+                summary["empty"] += 1
+            if len(pending) >= LOAD_BATCH_ROWS:
+                flush()
+    flush()
+    Logger.info(f"harvest - job_id={job_id}, job_label={job_label}: {summary}")
+    return summary
+
+
+def safe_harvest_task(task: HarvestTask, timestamp: str) -> List[Dict]:
+    try:
+        return harvest_task(task, timestamp)
+    except Exception as exc:
+        Logger.error(f"harvest_task - could not harvest {task.output_path} of {task.job_id}: {exc}")
+        return []
@@ -0,0 +1,237 @@
+"""
+Copyright 2022 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Reconciliation of tasks_status with the task states of Batch.
+
+When a get_status invocation fails or a task event is lost, the task stays at its last recorded status, without
+verification or Slack message. The reconciler lists the tasks of the pipeline jobs active or updated during the last
+RECONCILE_LOOKBACK_HOURS (RECONCILE_MAX_WORKERS jobs at a time, paged and filtered by the Batch API to the running and
+completed tasks), reads the statuses recorded for all these jobs with a single query, and builds the task events of the
+missing transitions only:
+    - RUNNING, for the tasks running or completed after running,
+    - SUCCEEDED or FAILED, for the completed tasks,
+    - the verification of the succeeded tasks recorded without one.
+The events carry the time of the transition from the status events of the task, and are replayed by the caller through
+the same path as the Pub/Sub events (see process_task_events of get_status). Transitions of the last
+RECONCILE_SETTLE_SECONDS are left out, their events may still be on their way.
+"""
+
+import datetime
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set
+
+from google.cloud import batch_v1
+
+from commonek.batch_helper import ACTIVE_JOB_STATES
+from commonek.batch_helper import label_filter
+from commonek.batch_helper import list_jobs
+from commonek.batch_helper import list_tasks
+from commonek.bq_helper import run_query
+from commonek.logging import Logger
+from commonek.params import BIGQUERY_DB_TASKS
+from commonek.params import FAILED
+from commonek.params import JOB_LABEL_NAME
+from commonek.params import PROJECT_ID
+from commonek.params import RECONCILE_LOOKBACK_HOURS
+from commonek.params import RECONCILE_MAX_WORKERS
+from commonek.params import RECONCILE_SETTLE_SECONDS
+from commonek.params import RUNNING
+from commonek.params import SUCCEEDED
+from commonek.params import TASK_VERIFIED_FAILED
+from commonek.params import TASK_VERIFIED_OK
+from commonek.placement import get_regions
+
+JOB_NAME = os.getenv("JOB_NAME_SHORT", "job-dragen")  # prefix of the pipeline jobs (retry and side jobs included)
+RECONCILED_STATES = [RUNNING, SUCCEEDED, FAILED]
+JOB_UIDS_PER_QUERY = 500
+
+
+def state_name(state) -> str:
+    return getattr(state, "name", state)  # TaskStatus.State / JobStatus.State enum
+
+
+def to_datetime(value) -> Optional[datetime.datetime]:
+    """Timestamp of the Batch API (datetime, or epoch seconds) in UTC."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value, datetime.timezone.utc)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+class TaskSnapshot:
+    """State of a task in Batch, with the time it last entered every state."""
+    __slots__ = ["job_uid", "region", "task_name", "task_id", "state", "transitions"]
+
+    def __init__(self, job: batch_v1.Job, task: batch_v1.Task):
+        self.job_uid = job.uid
+        self.region = job.name.split("/")[3]
+        self.task_name = task.name
+        # TaskUID of the Pub/Sub events: <job uid>-<group>-<index>
+        self.task_id = f"{job.uid}-{task.name.split('/')[-3]}-{task.name.split('/')[-1]}"
+        self.state = state_name(task.status.state)
+        self.transitions: Dict[str, datetime.datetime] = {}
+        for event in task.status.status_events or []:
+            state = state_name(getattr(event, "task_state", None))
+            if not state or state == "STATE_UNSPECIFIED":
+                # such as: Task state is updated from ASSIGNED to RUNNING on zones/us-central1-a/instances/...
+                match = re.search(r"\bto ([A-Z_]+)", getattr(event, "description", "") or "")
+                state = match.group(1) if match else None
+            event_time = to_datetime(getattr(event, "event_time", None))
+            if state and event_time:
+                self.transitions[state] = event_time
+
+    @property
+    def ran(self) -> bool:
+        return self.state != FAILED or RUNNING in self.transitions
+
+
+class Transition:
+    """Missing transition of a task, as the task event Batch would have published."""
+    __slots__ = ["task", "state", "recorded"]
+
+    def __init__(self, task: TaskSnapshot, state: str, recorded: bool = False):
+        self.task = task
+        self.state = state
+        self.recorded = recorded  # the status is recorded, only its verification is missing
+
+    @property
+    def timestamp(self) -> datetime.datetime:
+        return self.task.transitions.get(self.state) or datetime.datetime.now(datetime.timezone.utc)
+
+    @property
+    def attributes(self) -> Dict[str, str]:
+        return {"JobUID": self.task.job_uid, "NewTaskState": self.state, "TaskName": self.task.task_name,
+                "Region": self.task.region, "TaskUID": self.task.task_id, "Type": "TASK_STATE_CHANGED"}
+
+    @property
+    def data(self) -> str:
+        previous = RUNNING if self.state != RUNNING and self.task.ran else "PENDING"
+        return (f"Task state was updated: taskUID={self.task.task_id}, previousState={previous}, "
+                f"currentState={self.state}, timestamp={self.timestamp.isoformat()}")
+
+    def __repr__(self):
+        return f"{self.task.task_id}: {self.state}{' (verification)' if self.recorded else ''}"
+
+
+def is_recent(job: batch_v1.Job, since: datetime.datetime) -> bool:
+    if state_name(job.status.state) in ACTIVE_JOB_STATES:
+        return True
+    updated = to_datetime(getattr(job, "update_time", None) or getattr(job, "create_time", None))
+    return updated is None or updated >= since
+
+
+def recent_jobs(since: datetime.datetime, job_label: Optional[str] = None) -> List[batch_v1.Job]:
+    """Pipeline jobs of all the regions, active or updated since the time."""
+    jobs = []
+    for region in get_regions():
+        for job in list_jobs(region.name, filter=label_filter(JOB_LABEL_NAME, job_label) if job_label else None):
+            if not job.name.split("/")[-1].startswith(JOB_NAME):
+                continue
+            if is_recent(job, since):
+                jobs.append(job)
+    return jobs
+
+
+def list_task_snapshots(job: batch_v1.Job) -> List[TaskSnapshot]:
+    """Running and completed tasks of the job (pending ones have nothing to record yet)."""
+    return [TaskSnapshot(job, task) for task in list_tasks(job.name, RECONCILED_STATES)]
+
+
+def load_recorded_states(job_uids: List[str]) -> Dict[str, Set[str]]:
+    """{task_id: recorded statuses} of the tasks of the jobs in tasks_status."""
+    recorded = {}
+    for start in range(0, len(job_uids), JOB_UIDS_PER_QUERY):
+        uids = ", ".join(f"'{uid}'" for uid in job_uids[start:start + JOB_UIDS_PER_QUERY])
+        sql = f"""
+        SELECT task_id, ARRAY_AGG(DISTINCT status) AS statuses
+        FROM `{PROJECT_ID}.{BIGQUERY_DB_TASKS}`
+        WHERE job_id IN ({uids})
+        GROUP BY task_id
+        """
+        results = run_query(sql)
+        if results is None:
+            raise RuntimeError("load_recorded_states - could not query the recorded statuses")
+        for row in results:
+            recorded[row.task_id] = set(row.statuses or [])
+    return recorded
+
+
+def missing_transitions(task: TaskSnapshot, recorded: Set[str], settled_before: datetime.datetime) -> List[Transition]:
+    """Transitions of the task in Batch without their tasks_status row, in order."""
+    expected = []
+    if task.ran:
+        expected.append(RUNNING)
+    if task.state in [SUCCEEDED, FAILED]:
+        expected.append(task.state)
+    missing = []
+    for state in expected:
+        if state in recorded or task.transitions.get(state, settled_before) > settled_before:
+            continue
+        if state == SUCCEEDED and (TASK_VERIFIED_OK in recorded or TASK_VERIFIED_FAILED in recorded):
+            continue
+        missing.append(Transition(task, state))
+    if (task.state == SUCCEEDED and SUCCEEDED in recorded
+            and TASK_VERIFIED_OK not in recorded and TASK_VERIFIED_FAILED not in recorded):
+        missing.append(Transition(task, SUCCEEDED, recorded=True))
+    return missing
+
+
+def reconcile(job_label: Optional[str] = None, lookback_hours: float = RECONCILE_LOOKBACK_HOURS,
+              max_workers: int = RECONCILE_MAX_WORKERS, settle_seconds: float = RECONCILE_SETTLE_SECONDS,
+              replay: Optional[Callable[[List[Transition]], int]] = None, dry_run: bool = False) -> Dict:
+    """Finds the missing transitions of the tasks of the recent jobs and replays them.
+
+    Args:
+        job_label: only the jobs of this label.
+        lookback_hours: jobs active, or updated during these last hours.
+        max_workers: jobs whose tasks are listed at a time.
+        settle_seconds: transitions more recent than this are left to their events.
+        replay: writes the statuses of the transitions, returns the number of rows written.
+        dry_run: only report the missing transitions.
+
+    Returns:
+        Summary with the numbers of jobs, tasks, missing transitions per state and rows written, and the transitions.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    jobs = recent_jobs(now - datetime.timedelta(hours=lookback_hours), job_label)
+    summary = {"jobs": len(jobs), "tasks": 0, "missing": {}, "rows": 0, "transitions": []}
+    if not jobs:
+        return summary
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs) + 1))) as executor:
+        recorded_future = executor.submit(load_recorded_states, [job.uid for job in jobs])
+        snapshots = [task for tasks in executor.map(list_task_snapshots, jobs) for task in tasks]
+        recorded = recorded_future.result()
+
+    settled_before = now - datetime.timedelta(seconds=settle_seconds)
+    transitions = []
+    for task in snapshots:
+        transitions += missing_transitions(task, recorded.get(task.task_id, set()), settled_before)
+    summary["tasks"] = len(snapshots)
+    for transition in transitions:
+        state = "VERIFICATION" if transition.recorded else transition.state
+        summary["missing"][state] = summary["missing"].get(state, 0) + 1
+    summary["transitions"] = [repr(transition) for transition in transitions]
+    Logger.info(f"reconcile - {len(jobs)} jobs, {len(snapshots)} tasks, missing transitions {summary['missing']}")
+
+    if transitions and replay is not None and not dry_run:
+        summary["rows"] = replay(transitions)
+    return summary
@@ -0,0 +1,314 @@
+"""
+Copyright 2022 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Resubmission of the failed samples of a job (or of all the jobs of a label).
+
+The tasks whose latest status is FAILED or VERIFIED_FAILED are classified from the signature of their logs:
+    - transient: license server timeout, S3 authentication, out of memory, preemption,
+    - permanent: DRAGEN input error, or no known signature.
+The transient failures are resubmitted together as one retry job, with the task spec of the last job of the
+failed tasks (same label, so the retries show up with the original samples). Attempts are counted per sample in
+RECOVERY_STATE_URI and samples are not resubmitted more than RECOVERY_MAX_ATTEMPTS times.
+"""
+
+import datetime
+import itertools
+import json
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from google.cloud import batch_v1
+from google.cloud.logging_v2.services.logging_service_v2 import LoggingServiceV2Client
+
+from commonek.batch_helper import create_job_from_template
+from commonek.bq_helper import run_query, stream_data_to_bigquery
+from commonek.logging import Logger
+from commonek.params import BIGQUERY_DB_JOB_ARRAY
+from commonek.params import BIGQUERY_DB_TASKS
+from commonek.params import FAILED
+from commonek.params import PROJECT_ID
+from commonek.params import RECOVERY_MAX_ATTEMPTS
+from commonek.params import RECOVERY_STATE_URI
+from commonek.params import SPECULATIVE_LABEL
+from commonek.params import TASK_PREEMPTED
+from commonek.params import TASK_VERIFIED_FAILED
+from commonek.placement import SHARD_LABEL, find_job_by_name, get_regions
+from commonek.scheduler_state import GcsStateStore
+from commonek.tracing import traced
+
+LICENSE_TIMEOUT = "license_timeout"
+S3_AUTH = "s3_auth"
+OUT_OF_MEMORY = "out_of_memory"
+PREEMPTION = "preemption"
+INPUT_ERROR = "input_error"
+UNKNOWN = "unknown"
+
+# Log signatures (RE2, also used as the Cloud Logging filter), checked in this order
+FAILURE_SIGNATURES = [
+    (PREEMPTION, r"[Pp]reempt|exit code 50001"),
+    (LICENSE_TIMEOUT, r"[Ll]icen[cs]e.*([Tt]imed? ?out|[Uu]nreachable|[Cc]ould not (connect|contact|reach))"),
+    (S3_AUTH, r"AccessDenied|InvalidAccessKeyId|SignatureDoesNotMatch|ExpiredToken|InvalidToken"),
+    (OUT_OF_MEMORY, r"[Oo]ut of memory|OOM|MemoryError|std::bad_alloc|Killed process"),
+    (INPUT_ERROR, r"ERROR.*([Ii]nput|[Nn]o such file|[Nn]ot found|[Ii]nvalid|[Cc]orrupt|[Tt]runcated|[Mm]alformed)"),
+]
+TRANSIENT_FAILURES = [LICENSE_TIMEOUT, S3_AUTH, OUT_OF_MEMORY, PREEMPTION]
+
+LOG_ENTRIES_LIMIT = 50  # matching log lines read per task
+LOG_QUERY_WORKERS = 16
+RECOVERY_ATTEMPT_LABEL = "recovery-attempt"
+RETRY_JOB_NAME = "job-dragen-retry"
+
+logging_client = None
+
+
+class FailedTask:
+    __slots__ = ["job_id", "task_id", "status", "batch_task_index", "sample_id", "job_label", "job_name",
+                 "variables", "input_type", "input_path", "output_path", "input_size", "command", "input_hash",
+                 "config_hash", "timestamp", "preempted", "failure"]
+
+    def __init__(self, row):
+        for field in self.__slots__[:-2]:
+            setattr(self, field, getattr(row, field, None))
+        self.preempted = bool(getattr(row, "preemptions", 0))
+        self.failure = UNKNOWN
+
+    @property
+    def transient(self) -> bool:
+        return self.failure in TRANSIENT_FAILURES
+
+    @property
+    def sample_key(self) -> str:
+        return f"{self.job_label or self.job_id}/{self.sample_id}"
+
+    def __repr__(self):
+        return f"FailedTask({self.task_id}, sample={self.sample_id}, status={self.status}, failure={self.failure})"
+
+
+def load_failed_tasks(job_id: Optional[str] = None, job_label: Optional[str] = None) -> List[FailedTask]:
+    """Tasks of the job (or of the jobs with the label) whose latest status is FAILED or VERIFIED_FAILED."""
+    assert job_id or job_label, "job_id or job_label is required"
+    filters = [f"J.job_id = '{job_id}'"] if job_id else [f"J.job_label = '{job_label}'"]
+    # the window functions only run over the statuses of the jobs
+    status_filter = (f"job_id = '{job_id}'" if job_id else
+                     f"job_id IN (SELECT job_id FROM `{PROJECT_ID}.{BIGQUERY_DB_JOB_ARRAY}` "
+                     f"WHERE job_label = '{job_label}')")
+    sql = f"""
+    WITH statuses AS (
+        SELECT job_id, task_id, batch_task_index, status, timestamp,
+            COUNTIF(status = '{TASK_PREEMPTED}') OVER (PARTITION BY task_id) AS preemptions
+        FROM `{PROJECT_ID}.{BIGQUERY_DB_TASKS}`
+        WHERE {status_filter}
+        QUALIFY ROW_NUMBER() OVER (
+            PARTITION BY task_id ORDER BY timestamp DESC, STARTS_WITH(status, 'VERIFIED') DESC) = 1
+    )
+    SELECT T.job_id, T.task_id, T.status, T.preemptions, J.batch_task_index, J.sample_id, J.job_label, J.job_name,
+        J.variables, J.input_type, J.input_path, J.output_path, J.input_size, J.command, J.input_hash, J.config_hash,
+        J.timestamp
+    FROM statuses T
+    JOIN `{PROJECT_ID}.{BIGQUERY_DB_JOB_ARRAY}` J
+    ON T.job_id = J.job_id AND T.batch_task_index = J.batch_task_index
+    WHERE T.status IN ('{FAILED}', '{TASK_VERIFIED_FAILED}') AND {" AND ".join(filters)}
+    """
+    results = run_query(sql)
+    tasks = [FailedTask(row) for row in results] if results else []
+    Logger.info(f"load_failed_tasks - {len(tasks)} failed tasks for job_id={job_id}, job_label={job_label}")
+    return tasks
+
+
+def classify_log_lines(lines: List[str]) -> Optional[str]:
+    for failure, pattern in FAILURE_SIGNATURES:
+        if any(re.search(pattern, line or "") for line in lines):
+            return failure
+    return None
+
+
+@traced("logging.get_failure_log_lines")
+def get_failure_log_lines(job_uid: str, task_id: str) -> List[str]:
+    """Log lines of the task matching any of the failure signatures (filtered by Cloud Logging)."""
+    global logging_client
+    if not logging_client:
+        logging_client = LoggingServiceV2Client()
+
+    signatures = "|".join(f"({pattern})" for _, pattern in FAILURE_SIGNATURES)
+    filters = (
+        f"logName=projects/{PROJECT_ID}/logs/batch_task_logs "
+        f"AND resource.labels.task_id=task/{task_id}/0/0 AND resource.labels.job={job_uid} "
+        f"AND textPayload=~\"{signatures}\""
+    )
+    iterator = logging_client.list_log_entries(
+        {"resource_names": [f"projects/{PROJECT_ID}"], "filter": filters, "order_by": "timestamp desc",
+         "page_size": LOG_ENTRIES_LIMIT}
+    )
+    return [entry.text_payload for entry in itertools.islice(iterator, LOG_ENTRIES_LIMIT)]
+
+
+def classify_failures(tasks: List[FailedTask]) -> List[FailedTask]:
+    """Sets the failure of every task, from its logs (queried in parallel) or its recorded preemptions."""
+    def classify(task: FailedTask):
+        try:
+            failure = classify_log_lines(get_failure_log_lines(task.job_id, task.task_id))
+        except Exception as exc:
+            Logger.warning(f"classify_failures - could not read the logs of {task.task_id}: {exc}")
+            failure = None
+        if failure is None and task.preempted and task.status == FAILED:
+            failure = PREEMPTION
+        task.failure = failure or UNKNOWN
+
+    with ThreadPoolExecutor(max_workers=LOG_QUERY_WORKERS) as executor:
+        list(executor.map(classify, tasks))
+    return tasks
+
+
+class RecoveryAttempts:
+    """Wraps the recovery state (updated in place):
+        {
+            "attempts": {job_label/sample_id: attempts},
+            "recovered": {task_id: retry_job_name}
+        }
+    """
+
+    def __init__(self, state: Dict, max_attempts: int = RECOVERY_MAX_ATTEMPTS):
+        self.state = state
+        self.state.setdefault("attempts", {})
+        self.state.setdefault("recovered", {})
+        self.max_attempts = max_attempts
+
+    def is_recovered(self, task: FailedTask) -> bool:
+        return task.task_id in self.state["recovered"]
+
+    def attempts(self, task: FailedTask) -> int:
+        return self.state["attempts"].get(task.sample_key, 0)
+
+    def reserve(self, tasks: List[FailedTask], retry_job_name: str) -> Dict[str, List[FailedTask]]:
+        """Counts an attempt for the transient failures which can still be retried.
+
+        Returns:
+            {"retry": [...], "exhausted": [...], "permanent": [...], "recovered": [...]}
+        """
+        plan = {"retry": [], "exhausted": [], "permanent": [], "recovered": []}
+        samples = set()
+        for task in tasks:
+            if self.is_recovered(task):
+                plan["recovered"].append(task)
+            elif not task.transient:
+                plan["permanent"].append(task)
+            elif self.attempts(task) >= self.max_attempts:
+                plan["exhausted"].append(task)
+            elif task.sample_key not in samples:
+                samples.add(task.sample_key)
+                plan["retry"].append(task)
+                self.state["attempts"][task.sample_key] = self.attempts(task) + 1
+                self.state["recovered"][task.task_id] = retry_job_name
+        return plan
+
+    def release(self, tasks: List[FailedTask]):
+        """Gives back the attempts reserved for a retry job which could not be submitted."""
+        for task in tasks:
+            self.state["attempts"][task.sample_key] = max(0, self.attempts(task) - 1)
+            self.state["recovered"].pop(task.task_id, None)
+
+
+def save_retry_job_array(created_job: batch_v1.Job, tasks: List[FailedTask]):
+    now = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    rows = []
+    for index, task in enumerate(tasks):
+        rows.append({
+            "batch_task_index": index,
+            "variables": task.variables,
+            "job_id": created_job.uid,
+            "timestamp": now,
+            "job_label": task.job_label,
+            "command": task.command,
+            "job_name": created_job.name.split("/")[-1],
+            "input_type": task.input_type,
+            "input_path": task.input_path,
+            "output_path": task.output_path,
+            "sample_id": task.sample_id,
+            "input_size": task.input_size,
+        })
+        if task.input_hash:  # keeps the retries in the index of the processed inputs (see dedup.py)
+            rows[-1]["input_hash"] = task.input_hash
+            rows[-1]["config_hash"] = task.config_hash
+    errors = stream_data_to_bigquery(rows, f"{PROJECT_ID}.{BIGQUERY_DB_JOB_ARRAY}")
+    if errors:
+        Logger.error(f"save_retry_job_array - errors while inserting rows for {created_job.uid}: {errors}")
+
+
+def submit_retry_job(tasks: List[FailedTask], job_id: str, attempt: int) -> batch_v1.Job:
+    """Submits the tasks as one job, using the last job of the failed tasks as the template (in its region)."""
+    last_task = max(tasks, key=lambda t: (t.timestamp is not None, t.timestamp or datetime.datetime.min))
+    template_name = last_task.job_name
+    template = find_job_by_name(template_name)
+    if template is None:
+        raise ValueError(f"template job {template_name} not found in {[r.name for r in get_regions()]}")
+    environments = [batch_v1.Environment(variables=json.loads(task.variables)) for task in tasks]
+    # a shard or a speculative side job of the label is only a template, the retry job is neither
+    labels = {key: value for key, value in (template.labels or {}).items()
+              if key not in [SHARD_LABEL, SPECULATIVE_LABEL]}
+    labels[RECOVERY_ATTEMPT_LABEL] = str(attempt)
+    created_job = create_job_from_template(template, environments, job_id, labels)
+    save_retry_job_array(created_job, tasks)
+    return created_job
+
+
+def recover(job_id: Optional[str] = None, job_label: Optional[str] = None, dry_run: bool = False,
+            max_attempts: int = RECOVERY_MAX_ATTEMPTS) -> Dict:
+    """Resubmits the transient failures of the job (or label) as one retry job.
+
+    Returns:
+        Summary with the task ids per outcome (retry, exhausted, permanent, recovered), the failure of every
+        task and the name of the retry job.
+    """
+    tasks = classify_failures(load_failed_tasks(job_id=job_id, job_label=job_label))
+    store = GcsStateStore(RECOVERY_STATE_URI)
+    retry_job_id = f"{RETRY_JOB_NAME}-{uuid.uuid4().hex[:10]}"
+
+    def reserve(state):
+        attempts = RecoveryAttempts(state, max_attempts)
+        reserved = attempts.reserve(tasks, retry_job_id)
+        return reserved, max([attempts.attempts(task) for task in reserved["retry"]], default=0)
+
+    if dry_run:
+        plan, attempt = reserve(store.read()[0])
+    else:
+        plan, attempt = store.update(reserve)
+
+    retry_job = None
+    if plan["retry"] and not dry_run:
+        try:
+            retry_job = submit_retry_job(plan["retry"], retry_job_id, attempt).name
+        except Exception as exc:
+            Logger.error(f"recover - could not submit retry job {retry_job_id}: {exc}")
+            store.update(lambda state: RecoveryAttempts(state, max_attempts).release(plan["retry"]))
+
+    summary = {outcome: [task.task_id for task in outcome_tasks] for outcome, outcome_tasks in plan.items()}
+    summary["failures"] = {task.task_id: task.failure for task in tasks}
+    summary["retry_job"] = retry_job
+    Logger.info(f"recover - job_id={job_id}, job_label={job_label}: {len(plan['retry'])} to retry as "
+                f"{retry_job or retry_job_id}, {len(plan['exhausted'])} exhausted, {len(plan['permanent'])} permanent"
+                f"{' (dry run)' if dry_run else ''}")
+    return summary
+
+
+def recover_completed_job(job: batch_v1.Job) -> Optional[str]:
+    """Recovery of the failed tasks of a completed job, returns the name of the retry job (if any)."""
+    try:
+        return recover(job_id=job.uid)["retry_job"]
+    except Exception as exc:
+        Logger.error(f"recover_completed_job - recovery of {job.name} failed: {exc}")
+        return None
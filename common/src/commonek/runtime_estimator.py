@@ -0,0 +1,183 @@
+"""
+Copyright 2022 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Estimates task run time from the historical RUNNING -> SUCCEEDED transitions recorded in BigQuery."""
+
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+
+from commonek.bq_helper import run_query
+from commonek.logging import Logger
+from commonek.params import (
+    PROJECT_ID,
+    BIGQUERY_DB_TASKS,
+    BIGQUERY_DB_JOB_ARRAY,
+    RUNNING,
+    SUCCEEDED,
+)
+
+AUTO = "auto"
+DEFAULT_MAX_RUN_DURATION = "7200s"
+DEFAULT_PARALLELISM = 3
+DEFAULT_PERCENTILE = 95
+DEFAULT_TARGET_COMPLETION_HOURS = 24
+DEFAULT_MAX_PARALLELISM = 100
+DURATION_SAFETY_FACTOR = 1.2
+MIN_RUN_DURATION_SECONDS = 600
+MIN_HISTORY_SAMPLES = 5
+HISTORY_LIMIT = 5000
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Linear-interpolated percentile of `values` (pct in 0..100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * min(max(pct, 0), 100) / 100.0
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return float(ordered[int(rank)])
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class RuntimeModel:
+    """Least-squares fit of duration = intercept + slope * input_size, with percentiles taken over residuals.
+
+    When input sizes are unknown (or all equal) the model degrades to the plain duration distribution.
+    """
+
+    def __init__(self, history: List[Tuple[Optional[int], float]]):
+        self.count = len(history)
+        sized = [(size, duration) for size, duration in history if size]
+        self.intercept = 0.0
+        self.slope = 0.0
+        self.max_size = max([size for size, _ in sized], default=0)
+        if len(sized) >= MIN_HISTORY_SAMPLES and len({size for size, _ in sized}) > 1:
+            mean_x = sum(size for size, _ in sized) / len(sized)
+            mean_y = sum(duration for _, duration in sized) / len(sized)
+            var_x = sum((size - mean_x) ** 2 for size, _ in sized)
+            cov_xy = sum((size - mean_x) * (duration - mean_y) for size, duration in sized)
+            self.slope = max(cov_xy / var_x, 0.0)
+            self.intercept = mean_y - self.slope * mean_x
+            self.residuals = [
+                duration - (self.intercept + self.slope * size) for size, duration in sized
+            ]
+        else:
+            self.residuals = [duration for _, duration in history]
+
+    def predict(self, input_size: Optional[int], pct: float) -> float:
+        if not input_size:
+            # Size unknown for this input - assume the largest size seen, to stay on the safe side
+            input_size = self.max_size
+        base = self.intercept + self.slope * input_size
+        return max(base + percentile(self.residuals, pct), 0.0)
+
+
+def get_duration_history(dragen_app: Optional[str], limit: int = HISTORY_LIMIT) -> List[Tuple[Optional[int], float]]:
+    """Loads (input_size, duration_seconds) of successfully completed tasks, newest first."""
+    app_filter = ""
+    if dragen_app:
+        if not re.match(r"^[\w.\-]+$", dragen_app):
+            Logger.warning(f"get_duration_history - ignoring unexpected dragen_app={dragen_app}")
+            return []
+        app_filter = f"AND REGEXP_EXTRACT(J.command, r'--dragen-app\\s+(\\S+)') = '{dragen_app}'"
+
+    sql = f"""
+    WITH transitions AS (
+        SELECT job_id, task_id, ANY_VALUE(batch_task_index) AS batch_task_index,
+            MAX(IF(status = '{RUNNING}', timestamp, NULL)) AS running_time,
+            MAX(IF(status = '{SUCCEEDED}', timestamp, NULL)) AS succeeded_time
+        FROM `{PROJECT_ID}.{BIGQUERY_DB_TASKS}`
+        GROUP BY job_id, task_id
+    )
+    SELECT J.input_size AS input_size,
+        DATETIME_DIFF(T.succeeded_time, T.running_time, SECOND) AS duration
+    FROM transitions T
+    JOIN `{PROJECT_ID}.{BIGQUERY_DB_JOB_ARRAY}` J
+    ON T.job_id = J.job_id AND T.batch_task_index = J.batch_task_index
+    WHERE T.succeeded_time > T.running_time {app_filter}
+    ORDER BY T.succeeded_time DESC
+    LIMIT {int(limit)}
+    """
+    results = run_query(sql)
+    if not results:
+        return []
+    return [(row.input_size, float(row.duration)) for row in results]
+
+
+def needs_estimate(run_options: Dict) -> bool:
+    """True when max_run_duration or parallelism is set to "auto" (and the duration history is needed)."""
+    return any(str(run_options.get(key, "")).lower() == AUTO for key in ["max_run_duration", "parallelism"])
+
+
+def estimate_run_options(
+    run_options: Dict,
+    input_sizes: List[Optional[int]],
+    dragen_app: Optional[str],
+    history: Optional[List[Tuple[Optional[int], float]]] = None,
+) -> Dict:
+    """Resolves `"max_run_duration": "auto"` and `"parallelism": "auto"` inside run_options.
+
+    Optional tuning run_options:
+        - runtime_percentile: percentile of the historical durations used for max_run_duration (default 95)
+        - target_completion_hours: time in which all tasks of the job should complete (default 24)
+        - max_parallelism: upper bound for the estimated parallelism (default 100)
+
+    Returns:
+        A copy of run_options with the estimated values (or the defaults if there is not enough history).
+    """
+    resolved = dict(run_options)
+    duration_auto = str(run_options.get("max_run_duration", "")).lower() == AUTO
+    parallelism_auto = str(run_options.get("parallelism", "")).lower() == AUTO
+    if not needs_estimate(run_options):
+        return resolved
+
+    if history is None:
+        history = get_duration_history(dragen_app)
+    if len(history) < MIN_HISTORY_SAMPLES:
+        Logger.warning(
+            f"estimate_run_options - only {len(history)} historical tasks found for dragen_app={dragen_app}, "
+            f"using defaults max_run_duration={DEFAULT_MAX_RUN_DURATION}, parallelism={DEFAULT_PARALLELISM}"
+        )
+        if duration_auto:
+            resolved["max_run_duration"] = DEFAULT_MAX_RUN_DURATION
+        if parallelism_auto:
+            resolved["parallelism"] = DEFAULT_PARALLELISM
+        return resolved
+
+    model = RuntimeModel(history)
+    sizes = input_sizes or [None]
+
+    if duration_auto:
+        pct = float(run_options.get("runtime_percentile", DEFAULT_PERCENTILE))
+        longest = max(model.predict(size, pct) for size in sizes)
+        seconds = max(int(math.ceil(longest * DURATION_SAFETY_FACTOR)), MIN_RUN_DURATION_SECONDS)
+        resolved["max_run_duration"] = f"{seconds}s"
+
+    if parallelism_auto:
+        target_seconds = float(run_options.get("target_completion_hours", DEFAULT_TARGET_COMPLETION_HOURS)) * 3600
+        max_parallelism = int(run_options.get("max_parallelism", DEFAULT_MAX_PARALLELISM))
+        total_work = sum(model.predict(size, 50) for size in sizes)
+        parallelism = int(math.ceil(total_work / target_seconds)) if target_seconds > 0 else max_parallelism
+        resolved["parallelism"] = max(1, min(parallelism, max_parallelism, len(sizes)))
+
+    Logger.info(
+        f"estimate_run_options - fitted on {model.count} tasks (dragen_app={dragen_app}): "
+        f"max_run_duration={resolved.get('max_run_duration')}, parallelism={resolved.get('parallelism')}"
+    )
+    return resolved
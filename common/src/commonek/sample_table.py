@@ -0,0 +1,105 @@
+"""
+Copyright 2022 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Columnar table of the samples of a job, used from the discovery of the inputs to the Batch task environments
+and the job_array rows.
+
+Columns are named after the task environment variables (SAMPLE_ID, INPUT_PATH, OUTPUT_PATH), so that a row is the
+environment of a task: discovery fills SAMPLE_ID and INPUT_PATH, pre-flight filters the rows in place and records
+the input sizes and content hashes, task_info rewrites INPUT_PATH and adds OUTPUT_PATH. The strings are shared between the stages
+instead of being copied into new lists of lists and dicts at every stage.
+"""
+
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from google.cloud import batch_v1
+
+from commonek.logging import Logger
+from commonek.params import INPUT_PATH
+from commonek.params import SAMPLE_ID
+
+
+class SampleTable:
+    __slots__ = ["columns", "input_sizes", "input_hashes"]
+
+    def __init__(self, columns: Optional[Dict[str, List[str]]] = None,
+                 input_sizes: Optional[List[Optional[int]]] = None,
+                 input_hashes: Optional[List[Optional[str]]] = None):
+        self.columns = columns if columns is not None else {SAMPLE_ID: [], INPUT_PATH: []}
+        # size in bytes of the inputs of every row, None when unknown
+        self.input_sizes = input_sizes if input_sizes is not None else [None] * len(self)
+        # content hash of the input of every row (see gcs_helper.content_hash), None when unknown
+        self.input_hashes = input_hashes if input_hashes is not None else [None] * len(self)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Sequence[str]]) -> "SampleTable":
+        """[[sample_id, uri], ...] (such as the lines of an input list) -> SampleTable"""
+        table = cls()
+        for row in rows:
+            if len(row) >= 2:
+                table.append(row[0], row[1])
+            else:
+                Logger.warning(f"Loaded samples were not in the expected format {row}")
+        return table
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()), []))
+
+    def append(self, sample_id: str, input_uri: str, input_size: Optional[int] = None,
+               input_hash: Optional[str] = None):
+        self.columns[SAMPLE_ID].append(sample_id)
+        self.columns[INPUT_PATH].append(input_uri)
+        self.input_sizes.append(input_size)
+        self.input_hashes.append(input_hash)
+
+    def extend(self, other: "SampleTable"):
+        for name in self.columns:
+            self.columns[name].extend(other.columns[name])
+        self.input_sizes.extend(other.input_sizes)
+        self.input_hashes.extend(other.input_hashes)
+
+    def keep(self, indices: List[int]):
+        """Keeps only the rows at the indices (in place)."""
+        for name, values in self.columns.items():
+            self.columns[name] = [values[index] for index in indices]
+        self.input_sizes = [self.input_sizes[index] for index in indices]
+        self.input_hashes = [self.input_hashes[index] for index in indices]
+
+    def slice(self, start: int, stop: int) -> "SampleTable":
+        """Rows [start, stop) as a new table, such as the tasks of a shard of the job."""
+        return SampleTable({name: values[start:stop] for name, values in self.columns.items()},
+                           self.input_sizes[start:stop], self.input_hashes[start:stop])
+
+    def set_column(self, name: str, values: List[str]):
+        assert len(values) == len(self), f"Column {name} has {len(values)} values for {len(self)} rows"
+        self.columns[name] = values
+
+    def column(self, name: str) -> List[str]:
+        return self.columns.get(name, [])
+
+    def row(self, index: int) -> Dict[str, str]:
+        """Environment variables of the task of the row."""
+        return {name: values[index] for name, values in self.columns.items()}
+
+    def rows(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Dict[str, str]]:
+        for index in range(start, len(self) if stop is None else min(stop, len(self))):
+            yield self.row(index)
+
+    def task_environments(self) -> List[batch_v1.Environment]:
+        return [batch_v1.Environment(variables=variables) for variables in self.rows()]
+
+    def __repr__(self):
+        return f"SampleTable({len(self)} rows, columns={list(self.columns)})"
@@ -0,0 +1,91 @@
+"""
+Copyright 2022 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Small json state objects kept in GCS, shared between Cloud Function invocations.
+
+Updates are read-modify-write cycles guarded by the object generation (if_generation_match), so concurrent
+invocations never overwrite each other's changes: on a conflict the update is retried on the fresh state.
+"""
+
+import json
+import random
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from google.cloud import storage
+
+from commonek.helper import split_uri_2_bucket_prefix
+from commonek.logging import Logger
+
+storage_client = storage.Client()
+
+
+class StateConflict(Exception):
+    """The state could not be updated after all the retries, because of concurrent updates."""
+
+
+class GcsStateStore:
+    def __init__(self, uri: str, max_retries: int = 10):
+        self.uri = uri
+        self.bucket_name, self.path = split_uri_2_bucket_prefix(uri)
+        self.max_retries = max_retries
+
+    def _blob(self):
+        return storage_client.bucket(self.bucket_name).blob(self.path)
+
+    def read(self) -> Tuple[Dict, int]:
+        """Current state and its generation, ({}, 0) when the state does not exist yet."""
+        blob = self._blob()
+        try:
+            data = blob.download_as_bytes()
+        except NotFound:
+            return {}, 0
+        return json.loads(data.decode("utf-8")), int(blob.generation or 0)
+
+    def write(self, state: Dict, generation: int) -> int:
+        """Writes the state if it was not changed since `generation` (0 - if it does not exist).
+
+        Raises:
+            PreconditionFailed when the state was changed in the meantime.
+        """
+        blob = self._blob()
+        blob.upload_from_string(json.dumps(state, separators=(",", ":")), content_type="application/json",
+                                if_generation_match=generation)
+        return int(blob.generation or 0)
+
+    def update(self, fn: Callable[[Dict], Optional[Dict]]):
+        """Applies fn to the current state and writes the result, retrying on concurrent updates.
+
+        fn receives a (mutable) copy of the state and returns the value to pass back to the caller; it must not have
+        any side effects, since it is called again on a conflict. When the state is left unchanged, nothing is written.
+
+        Returns:
+            The value returned by fn.
+        """
+        for attempt in range(self.max_retries):
+            state, generation = self.read()
+            before = json.dumps(state, sort_keys=True)
+            result = fn(state)
+            if json.dumps(state, sort_keys=True) == before:
+                return result
+            try:
+                self.write(state, generation)
+                return result
+            except PreconditionFailed:
+                Logger.info(f"GcsStateStore - {self.uri} was updated concurrently, retrying (attempt {attempt + 1})")
+                time.sleep(random.uniform(0.05, 0.2) * (attempt + 1))
+        raise StateConflict(f"Could not update {self.uri} after {self.max_retries} attempts")
@@ -69,21 +69,21 @@ def get_output_path_url(output_path: str):
     return f" See the <{path_link}|output directory> for the generated results."
 
 
-def get_job_url(job_name: str):
-    job_url = f"https://console.cloud.google.com/batch/jobsDetail/regions/{REGION}/jobs/" \
+def get_job_url(job_name: str, region: Optional[str] = None):
+    job_url = f"https://console.cloud.google.com/batch/jobsDetail/regions/{region or REGION}/jobs/" \
               f"{job_name}/details?project={PROJECT_ID}"
     return f"<{job_url}|{job_name}>"
 
 
 def send_task_message(job_name: str, job_uid: str, task_id: str, status: str, output_path:  Optional[str] = None,
-                      sample_id: Optional[str] = None):
+                      sample_id: Optional[str] = None, region: Optional[str] = None):
     if not SLACK_CHANNEL:
         return
 
     output_path_url = ""
     if output_path:
         output_path_url = get_output_path_url(output_path)
-    slack_text = f"_Task_ execution *{status}* for sample_id={sample_id} within {get_job_url(job_name)}." \
+    slack_text = f"_Task_ execution *{status}* for sample_id={sample_id} within {get_job_url(job_name, region)}." \
                  f"{get_log_url(job_uid, task_id)}{output_path_url}"
     try:
         slack_client = Slack()  # since token can change
@@ -94,11 +94,11 @@ def send_task_message(job_name: str, job_uid: str, task_id: str, status: str, ou
         Logger.error(f"send_task_message text={slack_text} channel={SLACK_CHANNEL}- failed on {exc}")
 
 
-def send_job_message(job_name: str, job_uid: str, status: str):
+def send_job_message(job_name: str, job_uid: str, status: str, region: Optional[str] = None):
     if not SLACK_CHANNEL:
         return
 
-    slack_text = f"_Job_ execution *{status}* for {get_job_url(job_name)}." \
+    slack_text = f"_Job_ execution *{status}* for {get_job_url(job_name, region)}." \
                  f" {get_log_url(job_uid)}"
     try:
         slack_client = Slack()
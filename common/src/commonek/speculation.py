@@ -0,0 +1,407 @@
+"""
+Copyright 2022 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Speculative re-execution of the straggler tasks.
+
+A few samples run much longer than the others (slow Jarvice node, license contention) and determine when their job
+completes. The monitor (run periodically) compares the elapsed time of every running task with the durations
+predicted for its DRAGEN app and input size (RuntimeModel of runtime_estimator.py, from the task history): a task
+running longer than the SPECULATION_PERCENTILE (and at least SPECULATION_MIN_SECONDS) gets a duplicate, submitted
+as a side job of a single task with the task spec of its job.
+
+The first attempt to be verified wins (get_status calls on_task_completed):
+    - the original: the side job is deleted,
+    - the duplicate: the original task is cancelled by deleting its job, once the superseded tasks are the only ones
+      left in it, and the pipeline continues as on the completion of the job (the deleted job sends no completion).
+      Until then (Batch has no cancellation of single tasks) the original task keeps running.
+Compute of the losing attempts (run time times vCPUs of the machine) is recorded in BIGQUERY_DB_SPECULATION, apart
+from the task statuses. Both attempts run the same command and write the same output files.
+
+Speculations in flight are kept in the json state SPECULATION_STATE_URI:
+    {
+        "speculating": {task_id: {"job_name", "duplicate", "started", "submitted", ...}},
+        "duplicates": {duplicate_job_name: task_id},
+        "superseded": {task_id: {...}},  (original tasks still running after their duplicate won)
+        "settled": {task_id: settled_at}  (not speculated again, the statuses of a cancelled task stay RUNNING)
+    }
+"""
+
+import datetime
+import json
+import re
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from google.cloud import batch_v1
+
+from commonek.admission import job_active_tasks, job_machine_type, machine_vcpus
+from commonek.batch_helper import create_job_from_template, delete_job, get_job_by_name
+from commonek.bq_helper import run_query, stream_data_to_bigquery
+from commonek.csv_helper import trigger_job_from_csv
+from commonek.helper import split_uri_2_bucket_prefix
+from commonek.job_dag import on_job_completed
+from commonek.logging import Logger
+from commonek.params import BIGQUERY_DB_JOB_ARRAY
+from commonek.params import BIGQUERY_DB_SPECULATION
+from commonek.params import BIGQUERY_DB_TASKS
+from commonek.params import JOB_LABEL_NAME
+from commonek.params import JOBS_LIST_URI
+from commonek.params import PROJECT_ID
+from commonek.params import RUNNING
+from commonek.params import SPECULATION_MAX_ACTIVE
+from commonek.params import SPECULATION_MIN_SECONDS
+from commonek.params import SPECULATION_PERCENTILE
+from commonek.params import SPECULATION_STATE_URI
+from commonek.params import SPECULATIVE_LABEL
+from commonek.params import SUCCEEDED
+from commonek.placement import SHARD_LABEL, find_job_by_name, other_active_shards
+from commonek.recovery import save_retry_job_array
+from commonek.runtime_estimator import MIN_HISTORY_SAMPLES, RuntimeModel, get_duration_history
+from commonek.scheduler_state import GcsStateStore
+
+SPECULATIVE_JOB_NAME = "job-dragen-spec"
+RUNNING_LOOKBACK_HOURS = 72  # statuses older than this are not scanned for running tasks
+
+ORIGINAL_VERIFIED = "original_verified"
+DUPLICATE_VERIFIED = "duplicate_verified"
+DUPLICATE_FAILED = "duplicate_failed"
+
+
+class RunningTask:
+    __slots__ = ["job_id", "task_id", "batch_task_index", "sample_id", "job_label", "job_name", "elapsed",
+                 "variables", "input_type", "input_path", "output_path", "input_size", "command", "input_hash",
+                 "config_hash"]
+
+    def __init__(self, row):
+        for field in self.__slots__:
+            setattr(self, field, getattr(row, field, None))
+
+    @property
+    def dragen_app(self) -> Optional[str]:
+        match = re.search(r"--dragen-app\s+(\S+)", self.command or "")
+        return match.group(1) if match else None
+
+    def __repr__(self):
+        return f"RunningTask({self.task_id}, sample={self.sample_id}, elapsed={self.elapsed}s)"
+
+
+def load_running_tasks(job_id: Optional[str] = None, job_label: Optional[str] = None) -> List[RunningTask]:
+    """Tasks whose latest status is RUNNING, with the seconds since they started (side jobs excluded)."""
+    filters = [f"NOT STARTS_WITH(J.job_name, '{SPECULATIVE_JOB_NAME}')"]
+    if job_id:
+        filters.append(f"T.job_id = '{job_id}'")
+    if job_label:
+        filters.append(f"J.job_label = '{job_label}'")
+    sql = f"""
+    WITH latest AS (
+        SELECT job_id, task_id, batch_task_index, status,
+            MAX(IF(status = '{RUNNING}', timestamp, NULL)) OVER (PARTITION BY task_id) AS running_time
+        FROM `{PROJECT_ID}.{BIGQUERY_DB_TASKS}`
+        WHERE timestamp > DATETIME_SUB(CURRENT_DATETIME(), INTERVAL {RUNNING_LOOKBACK_HOURS} HOUR)
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY task_id ORDER BY timestamp DESC) = 1
+    )
+    SELECT T.job_id, T.task_id, J.batch_task_index, J.sample_id, J.job_label, J.job_name,
+        DATETIME_DIFF(CURRENT_DATETIME(), T.running_time, SECOND) AS elapsed,
+        J.variables, J.input_type, J.input_path, J.output_path, J.input_size, J.command, J.input_hash, J.config_hash
+    FROM latest T
+    JOIN `{PROJECT_ID}.{BIGQUERY_DB_JOB_ARRAY}` J
+    ON T.job_id = J.job_id AND T.batch_task_index = J.batch_task_index
+    WHERE T.status = '{RUNNING}' AND {" AND ".join(filters)}
+    """
+    results = run_query(sql)
+    tasks = {}
+    for row in results or []:
+        tasks.setdefault(row.task_id, RunningTask(row))  # job_array rows may be duplicated
+    return list(tasks.values())
+
+
+def find_stragglers(tasks: List[RunningTask], percentile: float, min_seconds: int = SPECULATION_MIN_SECONDS,
+                    models: Optional[Dict[str, RuntimeModel]] = None) -> Dict[str, float]:
+    """{task_id: threshold in seconds} of the tasks running longer than the percentile of their predicted duration.
+
+    models: RuntimeModel per DRAGEN app, loaded from the task history when not given.
+    """
+    models = {} if models is None else models
+    stragglers = {}
+    for task in tasks:
+        app = task.dragen_app
+        if app not in models:
+            history = get_duration_history(app)
+            models[app] = RuntimeModel(history) if len(history) >= MIN_HISTORY_SAMPLES else None
+        if models[app] is None or task.elapsed is None:
+            continue
+        threshold = max(models[app].predict(task.input_size, percentile), min_seconds)
+        if task.elapsed > threshold:
+            stragglers[task.task_id] = round(threshold, 1)
+    return stragglers
+
+
+class Speculations:
+    """Wraps the speculation state (updated in place)."""
+
+    def __init__(self, state: Dict):
+        self.state = state
+        for key in ["speculating", "duplicates", "superseded", "settled"]:
+            self.state.setdefault(key, {})
+
+    @property
+    def active(self) -> int:
+        return len(self.state["speculating"])
+
+    def is_known(self, task_id: str) -> bool:
+        return any(task_id in self.state[key] for key in ["speculating", "superseded", "settled"])
+
+    def reserve(self, tasks: List[RunningTask], thresholds: Dict[str, float], max_active: int,
+                now: float) -> List[List]:
+        """Registers the duplicates of the stragglers not speculated yet, up to max_active in flight.
+
+        Returns:
+            [[task, duplicate job name], ...]
+        """
+        expired = now - RUNNING_LOOKBACK_HOURS * 3600
+        self.state["settled"] = {task_id: at for task_id, at in self.state["settled"].items() if at > expired}
+        reserved = []
+        for task in sorted(tasks, key=lambda t: -t.elapsed):
+            if self.active >= max_active:
+                break
+            if self.is_known(task.task_id):
+                continue
+            duplicate = f"{SPECULATIVE_JOB_NAME}-{uuid.uuid4().hex[:10]}"
+            self.state["speculating"][task.task_id] = {
+                "job_id": task.job_id, "job_name": task.job_name, "job_label": task.job_label,
+                "sample_id": task.sample_id, "duplicate": duplicate, "threshold": thresholds[task.task_id],
+                "started": round(now - task.elapsed, 1), "submitted": round(now, 1),
+            }
+            self.state["duplicates"][duplicate] = task.task_id
+            reserved.append([task, duplicate])
+        return reserved
+
+    def set_fields(self, task_id: str, **fields):
+        if task_id in self.state["speculating"]:
+            self.state["speculating"][task_id].update(fields)
+
+    def release(self, task_id: str) -> Optional[Dict]:
+        entry = self.state["speculating"].pop(task_id, None)
+        if entry:
+            self.state["duplicates"].pop(entry["duplicate"], None)
+        return entry
+
+    def supersede(self, task_id: str, entry: Dict):
+        self.state["superseded"][task_id] = entry
+
+    def superseded_in_job(self, job_name: str) -> List[str]:
+        return [task_id for task_id, entry in self.state["superseded"].items() if entry["job_name"] == job_name]
+
+
+def submit_duplicate(task: RunningTask, duplicate: str) -> batch_v1.Job:
+    """Submits the task again as a side job of one task, with the task spec of its job (in its region)."""
+    template = find_job_by_name(task.job_name)
+    if template is None:
+        raise ValueError(f"job {task.job_name} of {task.task_id} not found")
+    labels = {key: value for key, value in (template.labels or {}).items() if key != SHARD_LABEL}
+    labels[SPECULATIVE_LABEL] = task.job_name
+    created_job = create_job_from_template(
+        template, [batch_v1.Environment(variables=json.loads(task.variables))], duplicate, labels)
+    save_retry_job_array(created_job, [task])
+    return created_job
+
+
+def monitor(job_id: Optional[str] = None, job_label: Optional[str] = None,
+            percentile: float = SPECULATION_PERCENTILE, max_active: int = SPECULATION_MAX_ACTIVE,
+            dry_run: bool = False) -> Dict:
+    """Launches the duplicates of the stragglers and cancels the jobs left with superseded tasks only.
+
+    Returns:
+        Summary with the stragglers (task id: threshold in seconds), the duplicate job per task and the cancelled
+        jobs.
+    """
+    store = GcsStateStore(SPECULATION_STATE_URI)
+    tasks = load_running_tasks(job_id=job_id, job_label=job_label)
+    thresholds = find_stragglers(tasks, percentile)
+    stragglers = [task for task in tasks if task.task_id in thresholds]
+    summary = {"running": len(tasks), "stragglers": thresholds, "duplicates": {}, "cancelled": []}
+    now = time.time()
+
+    if dry_run:
+        reserved = Speculations(store.read()[0]).reserve(stragglers, thresholds, max_active, now)
+    else:
+        reserved = store.update(lambda state: Speculations(state).reserve(stragglers, thresholds, max_active, now))
+        summary["cancelled"] = cancel_superseded(store)
+
+    for task, duplicate in reserved:
+        summary["duplicates"][task.task_id] = duplicate
+        if dry_run:
+            continue
+        try:
+            created_job = submit_duplicate(task, duplicate)
+            template_region = created_job.name.split("/")[3]
+            vcpus = machine_vcpus(job_machine_type(created_job))
+            store.update(lambda state: Speculations(state).set_fields(task.task_id, region=template_region,
+                                                                      vcpus=vcpus))
+            Logger.info(f"monitor - {task} is a straggler (threshold {thresholds[task.task_id]}s), duplicate "
+                        f"submitted as {created_job.name}")
+        except Exception as exc:
+            Logger.error(f"monitor - could not submit the duplicate {duplicate} of {task}: {exc}")
+            store.update(lambda state: Speculations(state).release(task.task_id))
+            summary["duplicates"][task.task_id] = None
+
+    Logger.info(f"monitor - {len(tasks)} running tasks, {len(stragglers)} stragglers, "
+                f"{len(reserved)} duplicates{' (dry run)' if dry_run else ''}")
+    return summary
+
+
+def on_task_completed(job_name: str, task_id: str, verified: bool) -> Optional[str]:
+    """Settles the speculation of a task (original or duplicate) which completed, returns its outcome if any.
+
+    Args:
+        job_name: short name of the job of the task.
+        task_id: uid of the task.
+        verified: True when the task succeeded and its DRAGEN run was verified.
+    """
+    store = GcsStateStore(SPECULATION_STATE_URI)
+
+    def settle(state):
+        if not state:
+            return None, None, None  # no speculation yet
+        speculations = Speculations(state)
+        if task_id in state["superseded"]:
+            return DUPLICATE_VERIFIED, state["superseded"].pop(task_id), task_id
+        original_task_id = state["duplicates"].get(job_name, task_id)
+        entry = state["speculating"].get(original_task_id)
+        if entry is None:
+            return None, None, None
+        if original_task_id == task_id and not verified:
+            return None, None, None  # the original failed, the duplicate can still succeed
+        speculations.release(original_task_id)
+        state["settled"][original_task_id] = round(time.time(), 1)
+        if original_task_id == task_id:
+            return ORIGINAL_VERIFIED, entry, original_task_id
+        if not verified:
+            return DUPLICATE_FAILED, entry, original_task_id
+        speculations.supersede(original_task_id, entry)
+        return DUPLICATE_VERIFIED, entry, original_task_id
+
+    outcome, entry, original_task_id = store.update(settle)
+    if outcome is None:
+        return None
+    now = time.time()
+    Logger.info(f"on_task_completed - speculation of {original_task_id} (sample {entry.get('sample_id')}): "
+                f"{outcome}")
+
+    if outcome == ORIGINAL_VERIFIED:
+        cancelled = cancel_job(entry["duplicate"], entry.get("region"))
+        record_waste(original_task_id, entry, outcome, now - entry["submitted"], cancelled)
+    elif outcome == DUPLICATE_FAILED:
+        record_waste(original_task_id, entry, outcome, now - entry["submitted"], None)
+    elif original_task_id == task_id:
+        # superseded original task completed before its job could be cancelled
+        record_waste(original_task_id, entry, outcome, now - entry["started"], None)
+    else:
+        cancel_superseded(store, entry["job_name"])
+    return outcome
+
+
+def settle_completed(completed: List[List]) -> Dict[str, str]:
+    """on_task_completed for the [job name, task id, verified] of completed tasks which are part of a speculation,
+    with a single read of the state for the others. Returns {task_id: outcome}."""
+    state = GcsStateStore(SPECULATION_STATE_URI).read()[0]
+    if not state:
+        return {}
+    outcomes = {}
+    for job_name, task_id, verified in completed:
+        if (task_id in state.get("speculating", {}) or task_id in state.get("superseded", {})
+                or job_name in state.get("duplicates", {})):
+            outcomes[task_id] = on_task_completed(job_name, task_id, verified)
+    return outcomes
+
+
+def cancel_job(job_name: str, region: Optional[str] = None) -> Optional[str]:
+    """Deletes the job (short name), returns its name if it was deleted."""
+    try:
+        job = get_job_by_name(job_name, region) if region else find_job_by_name(job_name)
+        if job is None:
+            return None
+        delete_job(job.name)
+        return job_name
+    except Exception as exc:
+        Logger.error(f"cancel_job - could not delete {job_name}: {exc}")
+        return None
+
+
+def cancel_superseded(store: GcsStateStore, job_name: Optional[str] = None) -> List[str]:
+    """Deletes the jobs whose remaining tasks are all superseded by verified duplicates, and continues the
+    pipeline as the scheduler does on the completion of a job."""
+    state = store.read()[0]
+    speculations = Speculations(state)
+    job_names = sorted({entry["job_name"] for entry in state["superseded"].values()})
+    cancelled = []
+    for name in job_names:
+        if job_name and name != job_name:
+            continue
+        job = find_job_by_name(name)
+        task_ids = speculations.superseded_in_job(name)
+        if job is not None and job_active_tasks(job) > len(task_ids):
+            continue
+        if job is not None:
+            try:
+                delete_job(job.name)
+            except Exception as exc:
+                Logger.error(f"cancel_superseded - could not delete {job.name}: {exc}")
+                continue
+        entries = store.update(lambda s: {task_id: s.get("superseded", {}).pop(task_id, None) for task_id in task_ids})
+        now = time.time()
+        for task_id, entry in entries.items():
+            if entry:
+                record_waste(task_id, entry, DUPLICATE_VERIFIED, now - entry["started"],
+                             name if job is not None else None)
+        if job is not None:
+            cancelled.append(name)
+            Logger.info(f"cancel_superseded - {name} deleted, its tasks {task_ids} were superseded")
+            continue_pipeline(job)
+    return cancelled
+
+
+def continue_pipeline(job: batch_v1.Job):
+    """Next job of the DAG or of jobs.csv, for a job deleted once its duplicates completed."""
+    label = (job.labels or {}).get(JOB_LABEL_NAME)
+    if not label or other_active_shards(job):
+        return
+    on_job_completed(label, SUCCEEDED)
+    bucket_name, file_path = split_uri_2_bucket_prefix(JOBS_LIST_URI)
+    trigger_job_from_csv(bucket_name=bucket_name, file_path=file_path, previous_job_label=label)
+
+
+def record_waste(task_id: str, entry: Dict, outcome: str, wasted_seconds: float, cancelled_job: Optional[str]):
+    """Row of the speculation table with the compute of the losing attempt."""
+    wasted_seconds = round(max(wasted_seconds, 0.0), 1)
+    row = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        "job_id": entry.get("job_id"),
+        "job_label": entry.get("job_label"),
+        "job_name": entry.get("job_name"),
+        "task_id": task_id,
+        "sample_id": entry.get("sample_id"),
+        "duplicate_job_name": entry.get("duplicate"),
+        "outcome": outcome,
+        "threshold_seconds": entry.get("threshold"),
+        "cancelled_job_name": cancelled_job,
+        "wasted_seconds": wasted_seconds,
+        "wasted_vcpu_seconds": round(wasted_seconds * entry.get("vcpus", 0), 1),
+    }
+    errors = stream_data_to_bigquery([row], f"{PROJECT_ID}.{BIGQUERY_DB_SPECULATION}")
+    if errors:
+        Logger.error(f"record_waste - errors while inserting the speculation of {task_id}: {errors}")
@@ -0,0 +1,290 @@
+"""
+Copyright 2022 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Throughput and latency metrics derived from the task status transitions.
+
+    - queue wait: from the submission of the job (time of its first job_array row) to the last RUNNING status of the
+      task. For jobs without job_array rows, from the first SCHEDULED, PENDING or ASSIGNED status of the task.
+    - run time: from the last RUNNING status to SUCCEEDED or FAILED.
+    - verification lag: from SUCCEEDED to VERIFIED_OK or VERIFIED_FAILED.
+    - retry rate: share of the started tasks with more than one run (RUNNING statuses separated by FAILED,
+      PREEMPTED or a queued status).
+"""
+
+import datetime
+import json
+from typing import Dict, List, Optional
+
+from commonek.bq_helper import run_query, stream_data_to_bigquery
+from commonek.logging import Logger
+from commonek.params import (
+    PROJECT_ID,
+    BIGQUERY_DB_TASKS,
+    BIGQUERY_DB_JOB_ARRAY,
+    BIGQUERY_DB_TASK_METRICS,
+    SCHEDULED,
+    RUNNING,
+    SUCCEEDED,
+    FAILED,
+    TASK_VERIFIED_OK,
+    TASK_VERIFIED_FAILED,
+    TASK_PREEMPTED,
+)
+from commonek.runtime_estimator import percentile
+
+QUEUED_STATES = [SCHEDULED, "PENDING", "ASSIGNED"]
+VERIFIED_STATES = [TASK_VERIFIED_OK, TASK_VERIFIED_FAILED]
+# statuses between two RUNNING rows of a task retried by Batch
+INTERRUPTED_STATES = QUEUED_STATES + [FAILED, TASK_PREEMPTED]
+
+QUEUE_WAIT = "queue_wait_seconds"
+RUN_TIME = "run_time_seconds"
+VERIFICATION_LAG = "verification_lag_seconds"
+SAMPLES_PER_HOUR = "samples_per_hour"
+RETRY_RATE = "retry_rate"
+
+PERCENTILES = [50, 90, 95, 99]
+# Upper bounds (seconds) of the histogram buckets, last bucket is open-ended
+HISTOGRAM_BOUNDS = [60, 300, 600, 1800, 3600, 7200, 14400, 28800, 57600]
+
+
+def to_datetime(value) -> datetime.datetime:
+    if isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.fromisoformat(str(value).replace("T", " "))
+
+
+def histogram(values: List[float], bounds: List[float] = HISTOGRAM_BOUNDS) -> Dict[str, int]:
+    buckets = {f"le_{bound}": 0 for bound in bounds}
+    buckets[f"gt_{bounds[-1]}"] = 0
+    for value in values:
+        for bound in bounds:
+            if value <= bound:
+                buckets[f"le_{bound}"] += 1
+                break
+        else:
+            buckets[f"gt_{bounds[-1]}"] += 1
+    return buckets
+
+
+def summarize(values: List[float]) -> Dict:
+    summary = {"count": len(values)}
+    if values:
+        summary["mean"] = sum(values) / len(values)
+        summary["max"] = max(values)
+        for pct in PERCENTILES:
+            summary[f"p{pct}"] = percentile(values, pct)
+        summary["histogram"] = histogram(values)
+    return summary
+
+
+class TaskTimeline:
+    """Timestamps of the state changes of a single task."""
+
+    __slots__ = ["queued", "running", "completed", "succeeded", "verified", "running_times", "interruptions"]
+
+    def __init__(self):
+        self.queued = None
+        self.running = None
+        self.completed = None
+        self.succeeded = None
+        self.verified = None
+        self.running_times = set()
+        self.interruptions = set()
+
+    @property
+    def run_count(self) -> int:
+        """Runs of the task: RUNNING rows separated by a failure, preemption or requeue. Duplicate RUNNING rows
+        (Pub/Sub redeliveries, replays of the reconciler) do not count as retries."""
+        if not self.running_times:
+            return 0
+        running_times = sorted(self.running_times)
+        return 1 + sum(1 for start, end in zip(running_times, running_times[1:])
+                       if any(start < interruption <= end for interruption in self.interruptions))
+
+    def add(self, status: str, timestamp: datetime.datetime):
+        if status in INTERRUPTED_STATES:
+            self.interruptions.add(timestamp)
+        if status in QUEUED_STATES:
+            if self.queued is None or timestamp < self.queued:
+                self.queued = timestamp
+        elif status == RUNNING:
+            self.running_times.add(timestamp)
+            # Last RUNNING (after retries) is the one that counts for the run time
+            if self.running is None or timestamp > self.running:
+                self.running = timestamp
+        elif status in [SUCCEEDED, FAILED]:
+            self.completed = timestamp
+            if status == SUCCEEDED:
+                self.succeeded = timestamp
+        elif status in VERIFIED_STATES:
+            self.verified = timestamp
+
+
+class TaskMetrics:
+    """Accumulates status events (incrementally or in bulk) and computes metrics per job, label and DRAGEN app."""
+
+    def __init__(self):
+        self.tasks: Dict[str, TaskTimeline] = {}
+        self.task_groups: Dict[str, Dict[str, str]] = {}
+        self.job_queued: Dict[str, datetime.datetime] = {}
+
+    def add_event(self, job_id: str, task_id: Optional[str], status: str, timestamp,
+                  job_label: Optional[str] = None, dragen_app: Optional[str] = None):
+        timestamp = to_datetime(timestamp)
+        if not task_id:
+            # Job level event, such as SCHEDULED when the job was submitted
+            if status in QUEUED_STATES and (job_id not in self.job_queued or timestamp < self.job_queued[job_id]):
+                self.job_queued[job_id] = timestamp
+            return
+        if task_id not in self.tasks:
+            self.tasks[task_id] = TaskTimeline()
+            self.task_groups[task_id] = {"job_id": job_id}
+        groups = self.task_groups[task_id]
+        if job_label:
+            groups["job_label"] = job_label
+        if dragen_app:
+            groups["dragen_app"] = dragen_app
+        self.tasks[task_id].add(status, timestamp)
+
+    def compute(self, group_by: str = "job_id") -> Dict[str, Dict]:
+        """Computes metrics grouped by `job_id`, `job_label` or `dragen_app`."""
+        grouped: Dict[str, List[str]] = {}
+        for task_id, groups in self.task_groups.items():
+            grouped.setdefault(groups.get(group_by) or "", []).append(task_id)
+
+        result = {}
+        for key, task_ids in grouped.items():
+            queue_wait, run_time, verification_lag = [], [], []
+            started, retried = 0, 0
+            first_running, last_succeeded, succeeded = None, None, 0
+            for task_id in task_ids:
+                task = self.tasks[task_id]
+                queued = self.job_queued.get(self.task_groups[task_id]["job_id"]) or task.queued
+                if queued and task.running and task.running >= queued:
+                    queue_wait.append((task.running - queued).total_seconds())
+                if task.running and task.completed and task.completed >= task.running:
+                    run_time.append((task.completed - task.running).total_seconds())
+                if task.succeeded and task.verified and task.verified >= task.succeeded:
+                    verification_lag.append((task.verified - task.succeeded).total_seconds())
+                if task.run_count > 0:
+                    started += 1
+                    if task.run_count > 1:
+                        retried += 1
+                    if first_running is None or task.running < first_running:
+                        first_running = task.running
+                if task.succeeded:
+                    succeeded += 1
+                    if last_succeeded is None or task.succeeded > last_succeeded:
+                        last_succeeded = task.succeeded
+
+            samples_per_hour = None
+            if succeeded and first_running and last_succeeded and last_succeeded > first_running:
+                samples_per_hour = succeeded / ((last_succeeded - first_running).total_seconds() / 3600)
+            result[key] = {
+                "tasks": len(task_ids),
+                QUEUE_WAIT: summarize(queue_wait),
+                RUN_TIME: summarize(run_time),
+                VERIFICATION_LAG: summarize(verification_lag),
+                SAMPLES_PER_HOUR: samples_per_hour,
+                RETRY_RATE: retried / started if started else None,
+            }
+        return result
+
+    def to_json(self, group_by: str = "job_id") -> str:
+        return json.dumps({"group_by": group_by, "metrics": self.compute(group_by)}, indent=2, default=str)
+
+    def to_bq_rows(self, group_by: str = "job_id") -> List[Dict]:
+        now = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        rows = []
+        for key, metrics in self.compute(group_by).items():
+            for metric in [QUEUE_WAIT, RUN_TIME, VERIFICATION_LAG]:
+                summary = metrics[metric]
+                rows.append({
+                    "group_by": group_by,
+                    "group_key": key,
+                    "metric": metric,
+                    "count": summary["count"],
+                    "mean": summary.get("mean"),
+                    "max": summary.get("max"),
+                    **{f"p{pct}": summary.get(f"p{pct}") for pct in PERCENTILES},
+                    "histogram": json.dumps(summary.get("histogram", {})),
+                    "timestamp": now,
+                })
+            for metric in [SAMPLES_PER_HOUR, RETRY_RATE]:
+                rows.append({
+                    "group_by": group_by,
+                    "group_key": key,
+                    "metric": metric,
+                    "count": metrics["tasks"],
+                    "mean": metrics[metric],
+                    "timestamp": now,
+                })
+        return rows
+
+
+def load_task_metrics(job_id: Optional[str] = None, job_label: Optional[str] = None,
+                      after_time: Optional[str] = None) -> TaskMetrics:
+    """Loads the status transitions from BigQuery (in batch) into TaskMetrics, with the submission time of the jobs
+    (first job_array row) as their SCHEDULED time."""
+    filters = ["TRUE"]
+    if job_id:
+        filters.append(f"T.job_id = '{job_id}'")
+    if job_label:
+        filters.append(f"T.job_label = '{job_label}'")
+    if after_time:
+        filters.append(f"T.timestamp >= CAST('{after_time}' AS DATETIME)")
+
+    sql = f"""
+    SELECT T.job_id, T.task_id, T.status, T.timestamp, T.job_label,
+        REGEXP_EXTRACT(J.command, r'--dragen-app\\s+(\\S+)') AS dragen_app
+    FROM `{PROJECT_ID}.{BIGQUERY_DB_TASKS}` T
+    LEFT JOIN `{PROJECT_ID}.{BIGQUERY_DB_JOB_ARRAY}` J
+    ON T.job_id = J.job_id AND T.batch_task_index = J.batch_task_index
+    WHERE {" AND ".join(filters)}
+    """
+    metrics = TaskMetrics()
+    results = run_query(sql)
+    if results:
+        for row in results:
+            metrics.add_event(row.job_id, row.task_id, row.status, row.timestamp,
+                              job_label=row.job_label, dragen_app=row.dragen_app)
+
+    sql = f"""
+    SELECT job_id, MIN(timestamp) AS submitted
+    FROM `{PROJECT_ID}.{BIGQUERY_DB_JOB_ARRAY}`
+    WHERE job_id IN (SELECT DISTINCT T.job_id FROM `{PROJECT_ID}.{BIGQUERY_DB_TASKS}` T
+        WHERE {" AND ".join(filters)})
+    GROUP BY job_id
+    """
+    results = run_query(sql)
+    if results:
+        for row in results:
+            metrics.add_event(row.job_id, None, SCHEDULED, row.submitted)
+    Logger.info(f"load_task_metrics - loaded {len(metrics.tasks)} tasks of {len(metrics.job_queued)} submitted jobs")
+    return metrics
+
+
+def save_task_metrics_to_bq(metrics: TaskMetrics, group_by: str = "job_id"):
+    rows = metrics.to_bq_rows(group_by)
+    if not rows:
+        return
+    table_id = f"{PROJECT_ID}.{BIGQUERY_DB_TASK_METRICS}"
+    errors = stream_data_to_bigquery(rows, table_id)
+    if errors:
+        Logger.error(f"save_task_metrics_to_bq - Encountered errors while inserting rows into {table_id}: {errors}")
+    else:
+        Logger.info(f"save_task_metrics_to_bq - {len(rows)} rows added into {table_id}")
@@ -0,0 +1,116 @@
+"""
+Copyright 2022 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Columns of job_array carried by the tasks_status rows (batch_task_index, sample_id, job_label, job_name), so that
+the reports filter and group the statuses of the tasks without joining job_array on the index in the task id.
+
+Rows written before the columns existed are filled in with backfill(): a single UPDATE joining job_array on
+REGEXP_EXTRACT(task_id, ...), the last place where that join is needed.
+"""
+
+import re
+from typing import Dict, List, Optional
+
+from commonek.bq_helper import run_query
+from commonek.logging import Logger
+from commonek.params import BIGQUERY_DB_JOB_ARRAY
+from commonek.params import BIGQUERY_DB_TASKS
+from commonek.params import PROJECT_ID
+
+# (name, type, description) of the job_array columns added to tasks_status, as in setup/bq_task_status_schema.json
+DENORMALIZED_COLUMNS = [
+    ("batch_task_index", "INT64", "Index of the task in the Batch job (batch_task_index of job_array)"),
+    ("sample_id", "STRING", "Sample ID processed by the task"),
+    ("job_label", "STRING", "Label of the job"),
+    ("job_name", "STRING", "Name of the Batch job"),
+]
+
+TASK_INDEX = re.compile(r"group0-(\d+)")
+
+# Rows streamed within the last 30 minutes can not be updated by DML statements
+BACKFILL_MIN_AGE_MINUTES = 90
+
+
+def get_task_index(task_id: str) -> Optional[int]:
+    """job-dragen-...-group0-12 -> 12"""
+    match = TASK_INDEX.search(task_id or "")
+    return int(match.group(1)) if match else None
+
+
+def task_details(batch_task_index: Optional[int], sample_id: Optional[str], job_label: Optional[str],
+                 job_name: Optional[str]) -> Dict:
+    """Denormalized columns of a tasks_status row."""
+    return {"batch_task_index": batch_task_index, "sample_id": sample_id, "job_label": job_label,
+            "job_name": job_name}
+
+
+def migrate_schema() -> bool:
+    """Adds the denormalized columns to an existing tasks_status table (NULL in the rows already written)."""
+    columns = ", ".join(f"ADD COLUMN IF NOT EXISTS {name} {column_type} OPTIONS(description=\"{description}\")"
+                        for name, column_type, description in DENORMALIZED_COLUMNS)
+    result = run_query(f"ALTER TABLE `{PROJECT_ID}.{BIGQUERY_DB_TASKS}` {columns}")
+    return result is not None
+
+
+def backfill_filters(job_id: Optional[str], job_label: Optional[str], min_age_minutes: int) -> List[str]:
+    filters = ["T.batch_task_index IS NULL",
+               f"T.timestamp < DATETIME_SUB(CURRENT_DATETIME(), INTERVAL {int(min_age_minutes)} MINUTE)"]
+    if job_id:
+        filters.append(f"T.job_id = '{job_id}'")
+    if job_label:
+        filters.append(f"T.job_id IN (SELECT job_id FROM `{PROJECT_ID}.{BIGQUERY_DB_JOB_ARRAY}` "
+                       f"WHERE job_label = '{job_label}')")
+    return filters
+
+
+def count_pending_rows(job_id: Optional[str] = None, job_label: Optional[str] = None,
+                       min_age_minutes: int = BACKFILL_MIN_AGE_MINUTES) -> Optional[int]:
+    """Number of tasks_status rows without the denormalized columns, None when the query failed."""
+    sql = f"""
+    SELECT COUNT(1) AS pending
+    FROM `{PROJECT_ID}.{BIGQUERY_DB_TASKS}` T
+    WHERE {" AND ".join(backfill_filters(job_id, job_label, min_age_minutes))}
+    """
+    results = run_query(sql)
+    if results is None:
+        return None
+    return next((row.pending for row in results), 0)
+
+
+def backfill(job_id: Optional[str] = None, job_label: Optional[str] = None,
+             min_age_minutes: int = BACKFILL_MIN_AGE_MINUTES) -> bool:
+    """Fills in the denormalized columns of the historical rows with one UPDATE ... FROM job_array statement (set
+    based, the rows are not read back). job_array is deduplicated on (job_id, batch_task_index) first, since an
+    UPDATE fails when a row matches more than one source row."""
+    sql = f"""
+    UPDATE `{PROJECT_ID}.{BIGQUERY_DB_TASKS}` T
+    SET batch_task_index = J.batch_task_index, sample_id = J.sample_id, job_label = J.job_label,
+        job_name = J.job_name
+    FROM (
+        SELECT job_id, batch_task_index, ANY_VALUE(sample_id) AS sample_id, ANY_VALUE(job_label) AS job_label,
+            ANY_VALUE(job_name) AS job_name
+        FROM `{PROJECT_ID}.{BIGQUERY_DB_JOB_ARRAY}`
+        GROUP BY job_id, batch_task_index
+    ) J
+    WHERE T.job_id = J.job_id AND REGEXP_EXTRACT(T.task_id, r'group0-(\\d+)') = CAST(J.batch_task_index AS STRING)
+        AND {" AND ".join(backfill_filters(job_id, job_label, min_age_minutes))}
+    """
+    result = run_query(sql)
+    if result is None:
+        Logger.error(f"backfill - could not update the tasks_status rows of job_id={job_id}, job_label={job_label}")
+        return False
+    Logger.info(f"backfill - tasks_status rows updated for job_id={job_id}, job_label={job_label}")
+    return True
@@ -0,0 +1,253 @@
+"""
+Copyright 2022 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Tracing spans around the cloud API calls.
+
+Enabled with TRACING_ENABLED=true (read once at import time). When disabled, `traced` returns the decorated function
+unchanged and `span` returns a shared no-op context manager, so there is no overhead on the hot path.
+When enabled, every span records duration, payload size and outcome. If the OpenTelemetry API is installed, spans are
+also started through its tracer (so any configured OpenTelemetry exporter receives them); otherwise they are written
+as structured log entries and can be exported in the OTLP/JSON format using `export_otlp_json`.
+"""
+
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from commonek.params import TRACING_ENABLED
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # OpenTelemetry is optional
+    otel_trace = None
+
+SERVICE_NAME = os.getenv("K_SERVICE", os.getenv("FUNCTION_TARGET", "commonek"))
+MAX_FINISHED_SPANS = 10000
+
+_current_span = contextvars.ContextVar("commonek_current_span", default=None)
+_finished_spans: List[Dict] = []
+_finished_lock = threading.Lock()
+_tracer = otel_trace.get_tracer("commonek") if (otel_trace and TRACING_ENABLED) else None
+
+
+def payload_size(value) -> Dict[str, int]:
+    """Size attributes of a payload: bytes for str/bytes, items for collections."""
+    if value is None:
+        return {}
+    if isinstance(value, (bytes, bytearray)):
+        return {"payload.bytes": len(value)}
+    if isinstance(value, str):
+        return {"payload.bytes": len(value.encode("utf-8"))}
+    try:
+        return {"payload.items": len(value)}
+    except TypeError:
+        return {}
+
+
+class Span:
+    __slots__ = ["name", "trace_id", "span_id", "parent_span_id", "start_ns", "end_ns", "attributes",
+                 "outcome", "_token", "_otel"]
+
+    def __init__(self, name: str, attributes: Dict):
+        parent = _current_span.get()
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes = dict(attributes)
+        self.outcome = "ok"
+        self.start_ns = 0
+        self.end_ns = 0
+        self._token = None
+        self._otel = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+        if self._otel is not None:
+            self._otel.set_attribute(key, value)
+
+    def set_payload(self, value):
+        for key, size in payload_size(value).items():
+            self.set_attribute(key, size)
+
+    def set_error(self, error: str):
+        self.outcome = "error"
+        self.set_attribute("error", error)
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self._token = _current_span.set(self)
+        if _tracer is not None:
+            # child of the enclosing span (phase, job), as for the parent_span_id of the exported spans
+            context = (otel_trace.set_span_in_context(parent._otel)
+                       if parent is not None and parent._otel is not None else None)
+            self._otel = _tracer.start_span(self.name, context=context, attributes=self.attributes)
+        self.start_ns = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        if exc is not None:
+            self.set_error(f"{exc_type.__name__}: {exc}")
+        _current_span.reset(self._token)
+        if self._otel is not None:
+            if self.outcome == "error" and otel_trace is not None:
+                self._otel.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR))
+            self._otel.end()
+        _record(self)
+        return False
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "outcome": self.outcome,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    __slots__ = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_payload(self, value):
+        pass
+
+    def set_error(self, error):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _record(span: Span):
+    record = span.to_dict()
+    with _finished_lock:
+        _finished_spans.append(record)
+        if len(_finished_spans) > MAX_FINISHED_SPANS:
+            del _finished_spans[: len(_finished_spans) - MAX_FINISHED_SPANS]
+    logging.info(
+        f"span {span.name} {span.outcome} in {record['duration_ms']} ms {json.dumps(span.attributes, default=str)}",
+        extra={"json_fields": {"span": record}},
+    )
+
+
+def span(name: str, **attributes):
+    """Context manager recording a span, such as `with span("batch.create_job", tasks=10) as s:`."""
+    if not TRACING_ENABLED:
+        return _NOOP_SPAN
+    return Span(name, attributes)
+
+
+def traced(name: Optional[str] = None, payload_arg: Optional[str] = None,
+           is_error: Optional[Callable] = None):
+    """Decorator recording a span for every call of the function.
+
+    Args:
+        name: span name, defaults to the qualified function name.
+        payload_arg: argument to measure as the payload, otherwise the returned value is measured.
+        is_error: callable(result) -> bool, for functions reporting failures through their result.
+    """
+
+    def decorator(fn):
+        if not TRACING_ENABLED:
+            return fn
+
+        span_name = name or f"{fn.__module__}.{fn.__qualname__}"
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with Span(span_name, {}) as current:
+                if payload_arg:
+                    bound = signature.bind_partial(*args, **kwargs)
+                    current.set_payload(bound.arguments.get(payload_arg))
+                result = fn(*args, **kwargs)
+                if not payload_arg:
+                    current.set_payload(result)
+                if is_error and is_error(result):
+                    current.set_error("failed")
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def get_finished_spans() -> List[Dict]:
+    with _finished_lock:
+        return list(_finished_spans)
+
+
+def clear_finished_spans():
+    with _finished_lock:
+        _finished_spans.clear()
+
+
+def export_otlp_json() -> Dict:
+    """Finished spans in the OpenTelemetry OTLP/JSON format (ExportTraceServiceRequest)."""
+
+    def attribute(key, value):
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    spans = []
+    for record in get_finished_spans():
+        spans.append({
+            "traceId": record["trace_id"],
+            "spanId": record["span_id"],
+            "parentSpanId": record["parent_span_id"] or "",
+            "name": record["name"],
+            "kind": 3,  # SPAN_KIND_CLIENT
+            "startTimeUnixNano": str(record["start_time_unix_nano"]),
+            "endTimeUnixNano": str(record["end_time_unix_nano"]),
+            "attributes": [attribute(key, value) for key, value in record["attributes"].items()],
+            "status": {"code": 2 if record["outcome"] == "error" else 1},
+        })
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": "commonek"}, "spans": spans}],
+        }]
+    }
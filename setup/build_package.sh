@@ -62,7 +62,11 @@ function build_common_package(){
     pip install twine
     PWD=$(pwd)
     cd "${CDIR}"/../common || exit
+    # DRAGEN options catalog used to validate the configurations before the jobs are submitted
+    mkdir -p src/commonek/data
+    cp "${CDIR}"/../data/dragen_help.txt src/commonek/data/
     python3 -m build
+    rm -rf src/commonek/data
 
     pip install keyring
     pip install keyrings.google-artifactregistry-auth
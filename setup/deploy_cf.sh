@@ -71,8 +71,20 @@ function deploy_run_batch_cf(){
       --set-env-vars BIGQUERY_DB_JOB_ARRAY=$BIGQUERY_DB_JOB_ARRAY \
       --set-env-vars PROJECT_ID=$PROJECT_ID \
       --set-env-vars JOBS_LIST_URI=$JOBS_LIST_URI \
+      --set-env-vars "^@^SCHEDULER_GROUP_WEIGHTS=${SCHEDULER_GROUP_WEIGHTS}" \
+      --set-env-vars SCHEDULER_AGING_SECONDS=$SCHEDULER_AGING_SECONDS \
+      --set-env-vars "^@^ADMISSION_QUOTA_BUDGETS=${ADMISSION_QUOTA_BUDGETS}" \
+      --set-env-vars ADMISSION_MIN_PARALLELISM=$ADMISSION_MIN_PARALLELISM \
+      --set-env-vars "^@^BATCH_REGIONS=${BATCH_REGIONS}" \
+      --set-env-vars PLACEMENT_SHARD_MIN_TASKS=$PLACEMENT_SHARD_MIN_TASKS \
+      --set-env-vars "^@^TASK_RETRY_EXIT_CODES=${TASK_RETRY_EXIT_CODES}" \
+      --set-env-vars "^@^TASK_FAIL_EXIT_CODES=${TASK_FAIL_EXIT_CODES}" \
+      --set-env-vars "^@^DRAGEN_EXTRA_OPTIONS=${DRAGEN_EXTRA_OPTIONS}" \
+      --set-env-vars DEDUP_MODE=$DEDUP_MODE \
+      --set-env-vars BIGQUERY_DB_INPUT_ALIASES=$BIGQUERY_DB_INPUT_ALIASES \
       --set-env-vars PUBSUB_TOPIC_BATCH_TASK_STATE_CHANGE=${PUBSUB_TOPIC_BATCH_TASK_STATE_CHANGE} \
       --set-env-vars PUBSUB_TOPIC_BATCH_JOB_STATE_CHANGE=${PUBSUB_TOPIC_BATCH_JOB_STATE_CHANGE} \
+      --set-env-vars TRACING_ENABLED=${TRACING_ENABLED} \
       --trigger-resource=gs://"${INPUT_BUCKET_NAME}" \
       --trigger-event=google.storage.object.finalize \
       --docker-registry=artifact-registry
@@ -91,12 +103,181 @@ function deploy_get_status_cf(){
       --entry-point=${SOURCE_ENTRY_POINT_GET_STATUS} \
       --service-account=$JOB_SERVICE_ACCOUNT \
       --ingress-settings=${INGRESS_SETTINGS} \
+      --set-env-vars GCLOUD_REGION=$GCLOUD_REGION \
+      --set-env-vars JOBS_LIST_URI=$JOBS_LIST_URI \
+      --set-env-vars "^@^SCHEDULER_GROUP_WEIGHTS=${SCHEDULER_GROUP_WEIGHTS}" \
+      --set-env-vars SCHEDULER_AGING_SECONDS=$SCHEDULER_AGING_SECONDS \
+      --set-env-vars "^@^ADMISSION_QUOTA_BUDGETS=${ADMISSION_QUOTA_BUDGETS}" \
+      --set-env-vars ADMISSION_MIN_PARALLELISM=$ADMISSION_MIN_PARALLELISM \
+      --set-env-vars "^@^BATCH_REGIONS=${BATCH_REGIONS}" \
+      --set-env-vars PREFETCH_ACTIVE_TASKS=$PREFETCH_ACTIVE_TASKS \
+      --set-env-vars SPECULATION_PERCENTILE=$SPECULATION_PERCENTILE \
+      --set-env-vars BIGQUERY_DB_SPECULATION=$BIGQUERY_DB_SPECULATION \
       --set-env-vars BIGQUERY_DB_TASKS=$BIGQUERY_DB_TASKS \
       --set-env-vars BIGQUERY_DB_JOB_ARRAY=$BIGQUERY_DB_JOB_ARRAY \
       --set-env-vars PROJECT_ID=$PROJECT_ID \
       --set-env-vars SLACK_API_TOKEN_SECRET_NAME=$SLACK_API_TOKEN_SECRET_NAME \
       --set-env-vars SLACK_CHANNEL=$SLACK_CHANNEL  \
+      --set-env-vars TRACING_ENABLED=${TRACING_ENABLED} \
+      --docker-registry=artifact-registry
+}
+
+function deploy_get_status_batch_cf(){
+  sed 's|__GCLOUD_REGION__|'"$GCLOUD_REGION"'|g;
+      s|__PROJECT_ID__|'"$PROJECT_ID"'|g;
+      s|__COMMON_PACKAGE_VERSION__|'"$COMMON_PACKAGE_VERSION"'|g;
+      ' "${SOURCE_DIR_GET_STATUS}/requirements.sample.txt" > "${SOURCE_DIR_GET_STATUS}/requirements.txt"
+  exists=$(gcloud pubsub subscriptions describe "${STATUS_SUBSCRIPTION}" 2> /dev/null)
+  if [ -z "$exists" ]; then
+    $printf "Creating pull subscription ${STATUS_SUBSCRIPTION} ..."
+    gcloud pubsub subscriptions create "${STATUS_SUBSCRIPTION}" \
+      --topic "${PUBSUB_TOPIC_BATCH_TASK_STATE_CHANGE}" --ack-deadline=300
+  fi
+  # the events are kept by the subscription from now on, the per-event consumer would write them a second time
+  exists=$(gcloud functions describe ${CLOUD_FUNCTION_NAME_GET_STATUS} --region=$GCLOUD_REGION 2> /dev/null)
+  if [ -n "$exists" ]; then
+    $printf "Deleting per-event consumer Cloud Function=[$CLOUD_FUNCTION_NAME_GET_STATUS]..."
+    gcloud functions delete ${CLOUD_FUNCTION_NAME_GET_STATUS} --region=$GCLOUD_REGION --quiet
+  fi
+  $printf "Deploying Cloud Function=[$CLOUD_FUNCTION_NAME_GET_STATUS_BATCH]..."
+  gcloud functions deploy ${CLOUD_FUNCTION_NAME_GET_STATUS_BATCH} \
+      --region=$GCLOUD_REGION \
+      --trigger-http --no-allow-unauthenticated \
+      --runtime $RUNTIME --source="${SOURCE_DIR_GET_STATUS}" \
+      --entry-point=get_status_batch \
+      --service-account=$JOB_SERVICE_ACCOUNT \
+      --timeout=300 \
+      --ingress-settings=${INGRESS_SETTINGS} \
+      --set-env-vars GCLOUD_REGION=$GCLOUD_REGION \
+      --set-env-vars JOBS_LIST_URI=$JOBS_LIST_URI \
+      --set-env-vars "^@^SCHEDULER_GROUP_WEIGHTS=${SCHEDULER_GROUP_WEIGHTS}" \
+      --set-env-vars SCHEDULER_AGING_SECONDS=$SCHEDULER_AGING_SECONDS \
+      --set-env-vars "^@^ADMISSION_QUOTA_BUDGETS=${ADMISSION_QUOTA_BUDGETS}" \
+      --set-env-vars ADMISSION_MIN_PARALLELISM=$ADMISSION_MIN_PARALLELISM \
+      --set-env-vars "^@^BATCH_REGIONS=${BATCH_REGIONS}" \
+      --set-env-vars PREFETCH_ACTIVE_TASKS=$PREFETCH_ACTIVE_TASKS \
+      --set-env-vars SPECULATION_PERCENTILE=$SPECULATION_PERCENTILE \
+      --set-env-vars BIGQUERY_DB_SPECULATION=$BIGQUERY_DB_SPECULATION \
+      --set-env-vars BIGQUERY_DB_TASKS=$BIGQUERY_DB_TASKS \
+      --set-env-vars BIGQUERY_DB_JOB_ARRAY=$BIGQUERY_DB_JOB_ARRAY \
+      --set-env-vars PROJECT_ID=$PROJECT_ID \
+      --set-env-vars STATUS_SUBSCRIPTION=$STATUS_SUBSCRIPTION \
+      --set-env-vars STATUS_BATCH_MAX_MESSAGES=$STATUS_BATCH_MAX_MESSAGES \
+      --set-env-vars STATUS_BATCH_MAX_SECONDS=$STATUS_BATCH_MAX_SECONDS \
+      --set-env-vars SLACK_API_TOKEN_SECRET_NAME=$SLACK_API_TOKEN_SECRET_NAME \
+      --set-env-vars SLACK_CHANNEL=$SLACK_CHANNEL  \
+      --set-env-vars TRACING_ENABLED=${TRACING_ENABLED} \
+      --docker-registry=artifact-registry
+  url=$(gcloud functions describe ${CLOUD_FUNCTION_NAME_GET_STATUS_BATCH} --region=$GCLOUD_REGION \
+    --format='value(httpsTrigger.url)')
+  gcloud scheduler jobs delete "${CLOUD_FUNCTION_NAME_GET_STATUS_BATCH}" --location=$GCLOUD_REGION --quiet 2> /dev/null
+  gcloud scheduler jobs create http "${CLOUD_FUNCTION_NAME_GET_STATUS_BATCH}" \
+      --location=$GCLOUD_REGION \
+      --schedule="${STATUS_BATCH_SCHEDULE}" \
+      --uri="${url}" --http-method=POST \
+      --oidc-service-account-email=$JOB_SERVICE_ACCOUNT
+}
+
+function stop_get_status_batch_cf(){
+  # switching back to the per-event consumer, the batch consumer would write every event a second time
+  gcloud scheduler jobs delete "${CLOUD_FUNCTION_NAME_GET_STATUS_BATCH}" --location=$GCLOUD_REGION --quiet 2> /dev/null
+}
+
+function delete_get_status_batch_cf(){
+  exists=$(gcloud functions describe ${CLOUD_FUNCTION_NAME_GET_STATUS_BATCH} --region=$GCLOUD_REGION 2> /dev/null)
+  if [ -n "$exists" ]; then
+    $printf "Deleting batch consumer Cloud Function=[$CLOUD_FUNCTION_NAME_GET_STATUS_BATCH]..."
+    gcloud functions delete ${CLOUD_FUNCTION_NAME_GET_STATUS_BATCH} --region=$GCLOUD_REGION --quiet
+  fi
+  exists=$(gcloud pubsub subscriptions describe "${STATUS_SUBSCRIPTION}" 2> /dev/null)
+  if [ -n "$exists" ]; then
+    $printf "Deleting pull subscription ${STATUS_SUBSCRIPTION} ..."
+    gcloud pubsub subscriptions delete "${STATUS_SUBSCRIPTION}" --quiet
+  fi
+}
+
+function deploy_straggler_monitor_cf(){
+  sed 's|__GCLOUD_REGION__|'"$GCLOUD_REGION"'|g;
+      s|__PROJECT_ID__|'"$PROJECT_ID"'|g;
+      s|__COMMON_PACKAGE_VERSION__|'"$COMMON_PACKAGE_VERSION"'|g;
+      ' "${SOURCE_DIR_GET_STATUS}/requirements.sample.txt" > "${SOURCE_DIR_GET_STATUS}/requirements.txt"
+  $printf "Deploying Cloud Function=[$CLOUD_FUNCTION_NAME_STRAGGLER_MONITOR]..."
+  gcloud functions deploy ${CLOUD_FUNCTION_NAME_STRAGGLER_MONITOR} \
+      --region=$GCLOUD_REGION \
+      --trigger-http --no-allow-unauthenticated \
+      --runtime $RUNTIME --source="${SOURCE_DIR_GET_STATUS}" \
+      --entry-point=monitor_stragglers \
+      --service-account=$JOB_SERVICE_ACCOUNT \
+      --timeout=300 \
+      --ingress-settings=${INGRESS_SETTINGS} \
+      --set-env-vars GCLOUD_REGION=$GCLOUD_REGION \
+      --set-env-vars JOBS_LIST_URI=$JOBS_LIST_URI \
+      --set-env-vars "^@^SCHEDULER_GROUP_WEIGHTS=${SCHEDULER_GROUP_WEIGHTS}" \
+      --set-env-vars SCHEDULER_AGING_SECONDS=$SCHEDULER_AGING_SECONDS \
+      --set-env-vars "^@^ADMISSION_QUOTA_BUDGETS=${ADMISSION_QUOTA_BUDGETS}" \
+      --set-env-vars ADMISSION_MIN_PARALLELISM=$ADMISSION_MIN_PARALLELISM \
+      --set-env-vars "^@^BATCH_REGIONS=${BATCH_REGIONS}" \
+      --set-env-vars SPECULATION_PERCENTILE=$SPECULATION_PERCENTILE \
+      --set-env-vars SPECULATION_MIN_SECONDS=$SPECULATION_MIN_SECONDS \
+      --set-env-vars SPECULATION_MAX_ACTIVE=$SPECULATION_MAX_ACTIVE \
+      --set-env-vars BIGQUERY_DB_TASKS=$BIGQUERY_DB_TASKS \
+      --set-env-vars BIGQUERY_DB_JOB_ARRAY=$BIGQUERY_DB_JOB_ARRAY \
+      --set-env-vars BIGQUERY_DB_SPECULATION=$BIGQUERY_DB_SPECULATION \
+      --set-env-vars PROJECT_ID=$PROJECT_ID \
+      --set-env-vars TRACING_ENABLED=${TRACING_ENABLED} \
       --docker-registry=artifact-registry
+  url=$(gcloud functions describe ${CLOUD_FUNCTION_NAME_STRAGGLER_MONITOR} --region=$GCLOUD_REGION \
+    --format='value(httpsTrigger.url)')
+  gcloud scheduler jobs delete "${CLOUD_FUNCTION_NAME_STRAGGLER_MONITOR}" --location=$GCLOUD_REGION --quiet 2> /dev/null
+  gcloud scheduler jobs create http "${CLOUD_FUNCTION_NAME_STRAGGLER_MONITOR}" \
+      --location=$GCLOUD_REGION \
+      --schedule="${SPECULATION_SCHEDULE}" \
+      --uri="${url}" --http-method=POST \
+      --oidc-service-account-email=$JOB_SERVICE_ACCOUNT
+}
+
+function deploy_reconciler_cf(){
+  sed 's|__GCLOUD_REGION__|'"$GCLOUD_REGION"'|g;
+      s|__PROJECT_ID__|'"$PROJECT_ID"'|g;
+      s|__COMMON_PACKAGE_VERSION__|'"$COMMON_PACKAGE_VERSION"'|g;
+      ' "${SOURCE_DIR_GET_STATUS}/requirements.sample.txt" > "${SOURCE_DIR_GET_STATUS}/requirements.txt"
+  $printf "Deploying Cloud Function=[$CLOUD_FUNCTION_NAME_RECONCILER]..."
+  gcloud functions deploy ${CLOUD_FUNCTION_NAME_RECONCILER} \
+      --region=$GCLOUD_REGION \
+      --trigger-http --no-allow-unauthenticated \
+      --runtime $RUNTIME --source="${SOURCE_DIR_GET_STATUS}" \
+      --entry-point=reconcile_task_states \
+      --service-account=$JOB_SERVICE_ACCOUNT \
+      --timeout=540 \
+      --ingress-settings=${INGRESS_SETTINGS} \
+      --set-env-vars GCLOUD_REGION=$GCLOUD_REGION \
+      --set-env-vars JOBS_LIST_URI=$JOBS_LIST_URI \
+      --set-env-vars "^@^SCHEDULER_GROUP_WEIGHTS=${SCHEDULER_GROUP_WEIGHTS}" \
+      --set-env-vars SCHEDULER_AGING_SECONDS=$SCHEDULER_AGING_SECONDS \
+      --set-env-vars "^@^ADMISSION_QUOTA_BUDGETS=${ADMISSION_QUOTA_BUDGETS}" \
+      --set-env-vars ADMISSION_MIN_PARALLELISM=$ADMISSION_MIN_PARALLELISM \
+      --set-env-vars "^@^BATCH_REGIONS=${BATCH_REGIONS}" \
+      --set-env-vars SPECULATION_PERCENTILE=$SPECULATION_PERCENTILE \
+      --set-env-vars PREFETCH_ACTIVE_TASKS=$PREFETCH_ACTIVE_TASKS \
+      --set-env-vars RECONCILE_LOOKBACK_HOURS=$RECONCILE_LOOKBACK_HOURS \
+      --set-env-vars RECONCILE_MAX_WORKERS=$RECONCILE_MAX_WORKERS \
+      --set-env-vars JOB_NAME_SHORT=$JOB_NAME_SHORT \
+      --set-env-vars BIGQUERY_DB_TASKS=$BIGQUERY_DB_TASKS \
+      --set-env-vars BIGQUERY_DB_JOB_ARRAY=$BIGQUERY_DB_JOB_ARRAY \
+      --set-env-vars BIGQUERY_DB_SPECULATION=$BIGQUERY_DB_SPECULATION \
+      --set-env-vars PROJECT_ID=$PROJECT_ID \
+      --set-env-vars SLACK_API_TOKEN_SECRET_NAME=$SLACK_API_TOKEN_SECRET_NAME \
+      --set-env-vars SLACK_CHANNEL=$SLACK_CHANNEL \
+      --set-env-vars TRACING_ENABLED=${TRACING_ENABLED} \
+      --docker-registry=artifact-registry
+  url=$(gcloud functions describe ${CLOUD_FUNCTION_NAME_RECONCILER} --region=$GCLOUD_REGION \
+    --format='value(httpsTrigger.url)')
+  gcloud scheduler jobs delete "${CLOUD_FUNCTION_NAME_RECONCILER}" --location=$GCLOUD_REGION --quiet 2> /dev/null
+  gcloud scheduler jobs create http "${CLOUD_FUNCTION_NAME_RECONCILER}" \
+      --location=$GCLOUD_REGION \
+      --schedule="${RECONCILE_SCHEDULE}" \
+      --uri="${url}" --http-method=POST \
+      --oidc-service-account-email=$JOB_SERVICE_ACCOUNT
 }
 
 function deploy_scheduler_cf(){
@@ -111,11 +292,23 @@ function deploy_scheduler_cf(){
       --runtime $RUNTIME --source="${SOURCE_DIR_SCHEDULER}" \
       --entry-point=${SOURCE_ENTRY_POINT_SCHEDULER} \
       --service-account=$JOB_SERVICE_ACCOUNT \
+      --timeout=540 \
       --ingress-settings=${INGRESS_SETTINGS} \
+      --set-env-vars GCLOUD_REGION=$GCLOUD_REGION \
       --set-env-vars JOBS_LIST_URI=$JOBS_LIST_URI \
+      --set-env-vars "^@^SCHEDULER_GROUP_WEIGHTS=${SCHEDULER_GROUP_WEIGHTS}" \
+      --set-env-vars SCHEDULER_AGING_SECONDS=$SCHEDULER_AGING_SECONDS \
+      --set-env-vars "^@^ADMISSION_QUOTA_BUDGETS=${ADMISSION_QUOTA_BUDGETS}" \
+      --set-env-vars ADMISSION_MIN_PARALLELISM=$ADMISSION_MIN_PARALLELISM \
+      --set-env-vars "^@^BATCH_REGIONS=${BATCH_REGIONS}" \
+      --set-env-vars RECOVERY_AUTO=$RECOVERY_AUTO \
+      --set-env-vars RECOVERY_MAX_ATTEMPTS=$RECOVERY_MAX_ATTEMPTS \
+      --set-env-vars QC_HARVEST_AUTO=$QC_HARVEST_AUTO \
+      --set-env-vars BIGQUERY_DB_QC_METRICS=$BIGQUERY_DB_QC_METRICS \
       --set-env-vars PROJECT_ID=$PROJECT_ID \
       --set-env-vars SLACK_API_TOKEN_SECRET_NAME=$SLACK_API_TOKEN_SECRET_NAME \
       --set-env-vars SLACK_CHANNEL=$SLACK_CHANNEL \
+      --set-env-vars TRACING_ENABLED=${TRACING_ENABLED} \
       --docker-registry=artifact-registry
 }
 
@@ -125,9 +318,23 @@ build_common_package
 
 deploy_run_batch_cf
 
-deploy_get_status_cf
+if [ "$STATUS_CONSUMER" = "batch" ]; then
+  deploy_get_status_batch_cf
+else
+  stop_get_status_batch_cf
+  deploy_get_status_cf
+  delete_get_status_batch_cf
+fi
 
 deploy_scheduler_cf
 
+if [ "$SPECULATION_PERCENTILE" != "0" ]; then
+  deploy_straggler_monitor_cf
+fi
+
+if [ -n "$RECONCILE_SCHEDULE" ]; then
+  deploy_reconciler_cf
+fi
+
 $printf "Success! Infrastructure deployed and ready!"
 
@@ -91,6 +91,21 @@ export CLOUD_FUNCTION_NAME_GET_STATUS='get_status'
 export SOURCE_DIR_GET_STATUS="${CLOUD_FUNCTIONS_DIR}/get_status"  # Cloud Function Directory - relative (main.py)
 export SOURCE_ENTRY_POINT_GET_STATUS='get_status'
 export PUBSUB_TOPIC_BATCH_TASK_STATE_CHANGE="job-dragen-task-state-change-topic"
+export STATUS_CONSUMER="per-event"  # per-event (get_status on every event) or batch (get_status_batch pulling events)
+export CLOUD_FUNCTION_NAME_GET_STATUS_BATCH='get_status_batch'
+export STATUS_SUBSCRIPTION="job-dragen-task-state-change-pull"  # Pull subscription of the batch consumer
+export STATUS_BATCH_SCHEDULE="* * * * *"  # How often the batch consumer drains the subscription
+export STATUS_BATCH_MAX_MESSAGES="500"  # Task events per pull (up to 1000)
+export STATUS_BATCH_MAX_SECONDS="150"  # No new pull after this time, leaving the last batch time to finish within the 300s timeout
+export CLOUD_FUNCTION_NAME_STRAGGLER_MONITOR='straggler_monitor'
+export SPECULATION_PERCENTILE="0"  # Tasks running longer than this percentile of the predicted duration get a speculative duplicate (0 - disabled)
+export SPECULATION_MIN_SECONDS="1800"  # Tasks running for less than this are never duplicated
+export SPECULATION_MAX_ACTIVE="10"  # Speculative duplicates running at a time
+export SPECULATION_SCHEDULE="*/10 * * * *"  # How often the straggler monitor runs
+export CLOUD_FUNCTION_NAME_RECONCILER='task_state_reconciler'
+export RECONCILE_SCHEDULE="0 * * * *"  # How often the task statuses are reconciled with Batch (empty - not deployed)
+export RECONCILE_LOOKBACK_HOURS="24"  # Jobs active or updated during these last hours are reconciled
+export RECONCILE_MAX_WORKERS="16"  # Jobs whose tasks are listed at a time
 
 # Cloud Function Scheduler
 export CLOUD_FUNCTION_NAME_SCHEDULER='job_scheduler'
@@ -100,6 +115,23 @@ export TRIGGER_JOB_LIST_FILE_NAME="jobs.csv"
 export TRIGGER_JOB_LIST_FILE="${ROOT_DIR}/tests/${TRIGGER_JOB_LIST_FILE_NAME}"
 export JOBS_LIST_URI="gs://${INPUT_BUCKET_NAME}/scheduler/${TRIGGER_JOB_LIST_FILE_NAME}" #Copies the job execution schedule used by scheuler
 export PUBSUB_TOPIC_BATCH_JOB_STATE_CHANGE="job-dragen-job-state-change-topic"
+export SCHEDULER_GROUP_WEIGHTS=""  # Fair share between groups of jobs.csv, such as clinical=4,research=1
+export SCHEDULER_AGING_SECONDS="3600"  # Queued jobs gain one priority level per this waiting time
+export ADMISSION_QUOTA_BUDGETS=""  # vCPU budget per machine family for admission control, such as e2=96,n2=128
+export ADMISSION_MIN_PARALLELISM="1"  # Smallest parallelism a job is shrunk to before being delayed
+export BATCH_REGIONS=""  # Batch regions of the jobs as <region>:<network>:<subnet>:<vCPU budget>, comma separated (empty - GCLOUD_REGION only)
+export PLACEMENT_SHARD_MIN_TASKS="0"  # Jobs with at least this number of tasks are split across BATCH_REGIONS (0 - never)
+export PREFETCH_ACTIVE_TASKS="0"  # Next job of jobs.csv is triggered once fewer tasks than this are left in the running job (0 - on its completion)
+export TASK_RETRY_EXIT_CODES=""  # Transient task exit codes retried, in addition to the VM failures such as preemption
+export TASK_FAIL_EXIT_CODES=""  # Exit codes of deterministic DRAGEN errors, failing the task without retries, such as 2 (empty - none)
+export DRAGEN_EXTRA_OPTIONS=""  # Comma separated DRAGEN options accepted in addition to data/dragen_help.txt
+export DEDUP_MODE="off"  # Inputs with the content of an input already processed (or listed twice): off, skip or alias
+export RECOVERY_AUTO="false"  # Resubmit the transient failures of every completed job as one retry job
+export RECOVERY_MAX_ATTEMPTS="2"  # Resubmissions per sample
+export QC_HARVEST_AUTO="false"  # Harvest the DRAGEN QC metrics of every completed job into BigQuery
+
+# Tracing spans around the cloud API calls (duration, payload size, outcome)
+export TRACING_ENABLED="false"
 
 # TESTS
 export TEST_RUN_DIR="gs://${INPUT_BUCKET_NAME}/test"
@@ -108,8 +140,16 @@ export TEST_RUN_DIR="gs://${INPUT_BUCKET_NAME}/test"
 export DATASET="dragen_illumina"
 export TASK_STATUS_TABLE_ID="tasks_status"
 export JOB_ARRAY_TABLE_ID="job_array"
+export TASK_METRICS_TABLE_ID="task_metrics"
+export QC_METRICS_TABLE_ID="qc_metrics"
+export SPECULATION_TABLE_ID="speculative_tasks"
+export INPUT_ALIASES_TABLE_ID="input_aliases"
 export BIGQUERY_DB_TASKS="${DATASET}.${TASK_STATUS_TABLE_ID}"
 export BIGQUERY_DB_JOB_ARRAY="${DATASET}.${JOB_ARRAY_TABLE_ID}"
+export BIGQUERY_DB_TASK_METRICS="${DATASET}.${TASK_METRICS_TABLE_ID}"
+export BIGQUERY_DB_QC_METRICS="${DATASET}.${QC_METRICS_TABLE_ID}"
+export BIGQUERY_DB_SPECULATION="${DATASET}.${SPECULATION_TABLE_ID}"
+export BIGQUERY_DB_INPUT_ALIASES="${DATASET}.${INPUT_ALIASES_TABLE_ID}"
 
 
 # Terraform
@@ -128,6 +168,10 @@ export TF_VAR_output_bucket=${OUTPUT_BUCKET_NAME}
 export TF_VAR_data_bucket=${DATA_BUCKET_NAME}
 export TF_VAR_tasks_status_table_id=${TASK_STATUS_TABLE_ID}
 export TF_VAR_job_array_table_id=${JOB_ARRAY_TABLE_ID}
+export TF_VAR_task_metrics_table_id=${TASK_METRICS_TABLE_ID}
+export TF_VAR_qc_metrics_table_id=${QC_METRICS_TABLE_ID}
+export TF_VAR_speculation_table_id=${SPECULATION_TABLE_ID}
+export TF_VAR_input_aliases_table_id=${INPUT_ALIASES_TABLE_ID}
 export TF_VAR_dataset_id=${DATASET}
 export TF_VAR_pubsub_topic_batch_job_state_change=$PUBSUB_TOPIC_BATCH_JOB_STATE_CHANGE
 export TF_VAR_pubsub_topic_batch_task_state_change=$PUBSUB_TOPIC_BATCH_TASK_STATE_CHANGE
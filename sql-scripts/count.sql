@@ -1,26 +1,21 @@
 WITH
     latest AS (
         SELECT
-            J.timestamp AS timestamp,
-            J.job_label AS job_label,
-            J.sample_id AS sample_id,
-            T.task_id AS task_id,
-            T.status AS status
+            job_label,
+            sample_id,
+            task_id,
+            status,
+            MIN(timestamp) OVER (PARTITION BY task_id) AS first_status_time,
+            COUNTIF(status = "PREEMPTED") OVER (PARTITION BY task_id) AS preemptions
         FROM
-            `dragen_illumina.tasks_status` T
-                JOIN
-            `dragen_illumina.job_array` AS J
-            ON
-                        CAST(J.batch_task_index AS STRING)=REGEXP_EXTRACT(task_id, r'group0-(\d+)')
-                    AND T.job_id=J.job_id
+            `dragen_illumina.tasks_status`
         WHERE
-                T.timestamp = (
-                SELECT
-                    MAX(timestamp)
-                FROM
-                    `dragen_illumina.tasks_status`
-                WHERE
-                        task_id = T.task_id) )
+            (sample_id=@SAMPLE_ID
+                OR @SAMPLE_ID="")
+          AND (job_label=@LABEL
+            OR @LABEL="")
+        QUALIFY
+            ROW_NUMBER() OVER (PARTITION BY task_id ORDER BY timestamp DESC, STARTS_WITH(status, "VERIFIED") DESC) = 1)
 SELECT
     COUNT(1) AS TOTAL,
     COUNTIF(latest.status = "RUNNING") AS RUNNING,
@@ -29,12 +24,9 @@ SELECT
     COUNTIF(latest.status = "FAILED") AS FAILED,
     COUNTIF(latest.status = "VERIFIED_OK") AS VERIFIED_OK,
     COUNTIF(latest.status = "VERIFIED_FAILED") AS VERIFIED_FAILED,
+    SUM(latest.preemptions) AS PREEMPTIONS,
 FROM
     latest
 WHERE
-    (latest.sample_id=@SAMPLE_ID
-        OR @SAMPLE_ID="")
-  AND (latest.job_label=@LABEL
-    OR @LABEL="")
-  AND (latest.timestamp >= CAST(@AFTER_TIME AS datetime))
-  AND (latest.timestamp <= CAST(@BEFORE_TIME AS datetime))
\ No newline at end of file
+    (latest.first_status_time >= CAST(@AFTER_TIME AS datetime))
+  AND (latest.first_status_time <= CAST(@BEFORE_TIME AS datetime))
\ No newline at end of file
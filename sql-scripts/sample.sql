@@ -1,7 +1,7 @@
 SELECT
-    J.job_name,
-    J.job_label,
-    J.sample_id,
+    T.job_name,
+    T.job_label,
+    T.sample_id,
     T.task_id,
     T.status,
     J.input_path,
@@ -13,12 +13,12 @@ FROM
         JOIN
     `dragen_illumina.job_array` AS J
     ON
-                CAST(J.batch_task_index AS STRING)=REGEXP_EXTRACT(task_id, r'group0-(\d+)')
-            AND T.job_id=J.job_id
+                J.batch_task_index=T.batch_task_index
+            AND J.job_id=T.job_id
 WHERE
-    (J.sample_id=@SAMPLE_ID
+    (T.sample_id=@SAMPLE_ID
         OR @SAMPLE_ID="")
-  AND (J.job_label=@LABEL
+  AND (T.job_label=@LABEL
     OR @LABEL="")
   AND (J.timestamp >= CAST(@AFTER_TIME AS datetime))
   AND (J.timestamp <= CAST(@BEFORE_TIME AS datetime))
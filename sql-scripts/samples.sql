@@ -13,10 +13,10 @@ WITH
                 WHERE
                         task_id = t.task_id ) )
 SELECT
-    J.job_name,
-    J.job_label,
-    CAST(REGEXP_EXTRACT(task_id, r'group0-(\d+)') AS INTEGER) AS batch_index,
-    J.sample_id,
+    T.job_name,
+    T.job_label,
+    T.batch_task_index AS batch_index,
+    T.sample_id,
     T.status,
     J.input_path,
     J.output_path,
@@ -28,26 +28,27 @@ FROM
         JOIN
     `dragen_illumina.job_array` AS J
     ON
-                CAST(J.batch_task_index AS STRING)=REGEXP_EXTRACT(task_id, r'group0-(\d+)')
-            AND T.job_id=J.job_id
+                J.batch_task_index=T.batch_task_index
+            AND J.job_id=T.job_id
 WHERE
-    (J.sample_id=@SAMPLE_ID
+    (T.sample_id=@SAMPLE_ID
         OR @SAMPLE_ID="")
-  AND (J.job_label=@LABEL
+  AND (T.job_label=@LABEL
     OR @LABEL="")
   AND (J.timestamp >= CAST(@AFTER_TIME AS datetime))
   AND (J.timestamp <= CAST(@BEFORE_TIME AS datetime))
 GROUP BY
     T.job_id,
     T.task_id,
-    J.sample_id,
+    T.batch_task_index,
+    T.sample_id,
     T.status,
     last_status_time,
     J.input_path,
     J.output_path,
     J.input_type,
-    J.job_label,
-    J.job_name,
+    T.job_label,
+    T.job_name,
     creation_time
 ORDER BY
     status,
@@ -58,6 +58,30 @@ resource "google_bigquery_table" "table_id" {
     "type": "DATETIME",
     "mode": "Required",
     "description": "Timestamp UTC"
+  },
+  {
+    "name": "batch_task_index",
+    "type": "INTEGER",
+    "mode": "NULLABLE",
+    "description": "Index of the task in the Batch job (batch_task_index of job_array)"
+  },
+  {
+    "name": "sample_id",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Sample ID processed by the task"
+  },
+  {
+    "name": "job_label",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Label of the job"
+  },
+  {
+    "name": "job_name",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Name of the Batch job"
   }
 ]
 EOF
@@ -117,6 +141,24 @@ resource "google_bigquery_table" "job_array_table_id" {
     "mode": "NULLABLE",
     "description": "input path for the dragen processing"
   },
+  {
+    "name": "input_size",
+    "type": "INTEGER",
+    "mode": "NULLABLE",
+    "description": "Total size in bytes of the task inputs, as checked before the job submission"
+  },
+  {
+    "name": "input_hash",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Content hash of the task input (md5 or crc32c and size), when the inputs are deduplicated"
+  },
+  {
+    "name": "config_hash",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Hash of the DRAGEN configuration of the task, when the inputs are deduplicated"
+  },
   {
     "name": "input_type",
     "type": "STRING",
@@ -145,3 +187,355 @@ resource "google_bigquery_table" "job_array_table_id" {
 EOF
 
 }
+
+resource "google_bigquery_table" "task_metrics_table_id" {
+  depends_on = [
+    google_bigquery_dataset.data_set
+  ]
+
+  deletion_protection = false
+  dataset_id          = var.dataset_id
+  table_id            = var.task_metrics_table_id
+
+  schema = <<EOF
+[
+  {
+    "name": "group_by",
+    "type": "STRING",
+    "mode": "Required",
+    "description": "Grouping of the metric (job_id, job_label or dragen_app)"
+  },
+  {
+    "name": "group_key",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Value of the grouping, such as the job id"
+  },
+  {
+    "name": "metric",
+    "type": "STRING",
+    "mode": "Required",
+    "description": "Metric name (queue_wait_seconds, run_time_seconds, verification_lag_seconds, samples_per_hour, retry_rate)"
+  },
+  {
+    "name": "count",
+    "type": "INTEGER",
+    "mode": "NULLABLE",
+    "description": "Number of observations"
+  },
+  {
+    "name": "mean",
+    "type": "FLOAT",
+    "mode": "NULLABLE",
+    "description": "Mean value (or the value itself for the rate metrics)"
+  },
+  {
+    "name": "max",
+    "type": "FLOAT",
+    "mode": "NULLABLE",
+    "description": "Maximum value"
+  },
+  {
+    "name": "p50",
+    "type": "FLOAT",
+    "mode": "NULLABLE",
+    "description": "50th percentile"
+  },
+  {
+    "name": "p90",
+    "type": "FLOAT",
+    "mode": "NULLABLE",
+    "description": "90th percentile"
+  },
+  {
+    "name": "p95",
+    "type": "FLOAT",
+    "mode": "NULLABLE",
+    "description": "95th percentile"
+  },
+  {
+    "name": "p99",
+    "type": "FLOAT",
+    "mode": "NULLABLE",
+    "description": "99th percentile"
+  },
+  {
+    "name": "histogram",
+    "type": "JSON",
+    "mode": "NULLABLE",
+    "description": "Counts per histogram bucket (upper bound in seconds)"
+  },
+  {
+    "name": "timestamp",
+    "type": "DATETIME",
+    "mode": "Required",
+    "description": "Timestamp UTC when metrics were computed"
+  }
+]
+EOF
+
+}
+
+resource "google_bigquery_table" "qc_metrics_table_id" {
+  depends_on = [
+    google_bigquery_dataset.data_set
+  ]
+
+  deletion_protection = false
+  dataset_id          = var.dataset_id
+  table_id            = var.qc_metrics_table_id
+
+  schema = <<EOF
+[
+  {
+    "name": "job_id",
+    "type": "STRING",
+    "mode": "Required",
+    "description": "Batch job uid"
+  },
+  {
+    "name": "job_label",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Label of the job"
+  },
+  {
+    "name": "batch_task_index",
+    "type": "INTEGER",
+    "mode": "Required",
+    "description": "Index of the task in the job"
+  },
+  {
+    "name": "sample_id",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Sample ID"
+  },
+  {
+    "name": "file_name",
+    "type": "STRING",
+    "mode": "Required",
+    "description": "Metrics file, relative to the output directory of the task"
+  },
+  {
+    "name": "metric_type",
+    "type": "STRING",
+    "mode": "Required",
+    "description": "Type of the metrics file, such as mapping, vc or wgs_coverage"
+  },
+  {
+    "name": "section",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Section of the metric, such as MAPPING/ALIGNING SUMMARY"
+  },
+  {
+    "name": "metric_group",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Read group or sample of the metric (empty for the summary)"
+  },
+  {
+    "name": "metric",
+    "type": "STRING",
+    "mode": "Required",
+    "description": "Metric name, such as Total input reads"
+  },
+  {
+    "name": "value",
+    "type": "FLOAT",
+    "mode": "NULLABLE",
+    "description": "Numeric value of the metric"
+  },
+  {
+    "name": "value_string",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Value of the metric as written by DRAGEN"
+  },
+  {
+    "name": "percent",
+    "type": "FLOAT",
+    "mode": "NULLABLE",
+    "description": "Percentage of the metric, when reported"
+  },
+  {
+    "name": "timestamp",
+    "type": "DATETIME",
+    "mode": "Required",
+    "description": "Timestamp UTC when metrics were harvested"
+  }
+]
+EOF
+
+}
+
+resource "google_bigquery_table" "speculation_table_id" {
+  depends_on = [
+    google_bigquery_dataset.data_set
+  ]
+
+  deletion_protection = false
+  dataset_id          = var.dataset_id
+  table_id            = var.speculation_table_id
+
+  schema = <<EOF
+[
+  {
+    "name": "timestamp",
+    "type": "DATETIME",
+    "mode": "Required",
+    "description": "Timestamp UTC when the speculation was settled"
+  },
+  {
+    "name": "job_id",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Batch job uid of the original task"
+  },
+  {
+    "name": "job_label",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Label of the job"
+  },
+  {
+    "name": "job_name",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Name of the Batch job of the original task"
+  },
+  {
+    "name": "task_id",
+    "type": "STRING",
+    "mode": "Required",
+    "description": "Task uid of the original (straggler) task"
+  },
+  {
+    "name": "sample_id",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Sample ID"
+  },
+  {
+    "name": "duplicate_job_name",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Name of the side job running the duplicate"
+  },
+  {
+    "name": "outcome",
+    "type": "STRING",
+    "mode": "Required",
+    "description": "original_verified, duplicate_verified or duplicate_failed"
+  },
+  {
+    "name": "threshold_seconds",
+    "type": "FLOAT",
+    "mode": "NULLABLE",
+    "description": "Run time above which the task was considered a straggler"
+  },
+  {
+    "name": "cancelled_job_name",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Job deleted to cancel the losing attempt (empty when it ran to its end)"
+  },
+  {
+    "name": "wasted_seconds",
+    "type": "FLOAT",
+    "mode": "NULLABLE",
+    "description": "Run time of the losing attempt"
+  },
+  {
+    "name": "wasted_vcpu_seconds",
+    "type": "FLOAT",
+    "mode": "NULLABLE",
+    "description": "Run time of the losing attempt times the vCPUs of its machine"
+  }
+]
+EOF
+
+}
+
+resource "google_bigquery_table" "input_aliases_table_id" {
+  depends_on = [
+    google_bigquery_dataset.data_set
+  ]
+
+  deletion_protection = false
+  dataset_id          = var.dataset_id
+  table_id            = var.input_aliases_table_id
+
+  schema = <<EOF
+[
+  {
+    "name": "timestamp",
+    "type": "DATETIME",
+    "mode": "Required",
+    "description": "Timestamp UTC when the job of the duplicate was submitted"
+  },
+  {
+    "name": "job_label",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Label of the job the duplicate was dropped from"
+  },
+  {
+    "name": "sample_id",
+    "type": "STRING",
+    "mode": "Required",
+    "description": "Sample ID of the duplicate input"
+  },
+  {
+    "name": "input_path",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Path of the duplicate input"
+  },
+  {
+    "name": "input_hash",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Content hash of the input (md5 or crc32c and size)"
+  },
+  {
+    "name": "config_hash",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Hash of the DRAGEN configuration"
+  },
+  {
+    "name": "alias_of_sample_id",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Sample ID of the original input"
+  },
+  {
+    "name": "alias_of_input_path",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Path of the original input"
+  },
+  {
+    "name": "alias_of_output_path",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Output directory of the original, with the results of the duplicate"
+  },
+  {
+    "name": "alias_of_job_name",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Name of the Batch job processing the original"
+  },
+  {
+    "name": "alias_of_job_label",
+    "type": "STRING",
+    "mode": "NULLABLE",
+    "description": "Label of the job processing the original"
+  }
+]
+EOF
+
+}
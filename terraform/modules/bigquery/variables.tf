@@ -35,3 +35,27 @@ variable "job_array_table_id" {
   description = "Table ID for table with job array"
 }
 
+
+variable "task_metrics_table_id" {
+  type        = string
+  description = "Table ID for task throughput and latency metrics"
+  default     = "task_metrics"
+}
+
+variable "qc_metrics_table_id" {
+  type        = string
+  description = "Table ID for DRAGEN QC metrics of the samples"
+  default     = "qc_metrics"
+}
+
+variable "speculation_table_id" {
+  type        = string
+  description = "Table ID for the speculative duplicates of the straggler tasks"
+  default     = "speculative_tasks"
+}
+
+variable "input_aliases_table_id" {
+  type        = string
+  description = "Table ID for the duplicate inputs and the originals holding their results"
+  default     = "input_aliases"
+}
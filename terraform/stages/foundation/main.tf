@@ -135,12 +135,16 @@ module "topic_batch_job_state_change_pubsub" {
 
 
 module "bigquery" {
-  depends_on            = [module.project_services, module.service_accounts]
-  source                = "../../modules/bigquery"
-  dataset_id            = var.dataset_id
-  project_id            = var.project_id
-  job_array_table_id    = var.job_array_table_id
-  tasks_status_table_id = var.tasks_status_table_id
+  depends_on             = [module.project_services, module.service_accounts]
+  source                 = "../../modules/bigquery"
+  dataset_id             = var.dataset_id
+  project_id             = var.project_id
+  job_array_table_id     = var.job_array_table_id
+  tasks_status_table_id  = var.tasks_status_table_id
+  task_metrics_table_id  = var.task_metrics_table_id
+  qc_metrics_table_id    = var.qc_metrics_table_id
+  speculation_table_id   = var.speculation_table_id
+  input_aliases_table_id = var.input_aliases_table_id
 }
 
 
@@ -100,6 +100,30 @@ variable "tasks_status_table_id" {
   }
 }
 
+variable "task_metrics_table_id" {
+  type        = string
+  description = "Table ID for task throughput and latency metrics"
+  default     = "task_metrics"
+}
+
+variable "qc_metrics_table_id" {
+  type        = string
+  description = "Table ID for DRAGEN QC metrics of the samples"
+  default     = "qc_metrics"
+}
+
+variable "speculation_table_id" {
+  type        = string
+  description = "Table ID for the speculative duplicates of the straggler tasks"
+  default     = "speculative_tasks"
+}
+
+variable "input_aliases_table_id" {
+  type        = string
+  description = "Table ID for the duplicate inputs and the originals holding their results"
+  default     = "input_aliases"
+}
+
 variable "dataset_location" {
   type        = string
   description = "BigQuery Dataset location"
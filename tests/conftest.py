@@ -0,0 +1,31 @@
+#  Copyright 2022 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""Runs the unit tests offline, against the in-memory stand-ins of benchmarks/fakes.py."""
+
+import os
+import sys
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.join(ROOT_DIR, "common/src"))
+sys.path.append(os.path.join(ROOT_DIR, "benchmarks"))
+
+from fakes import FakeCloud  # noqa: E402
+
+os.environ.setdefault("PROJECT_ID", "test-project")
+os.environ.setdefault("JOBS_LIST_URI", "gs://test-project-trigger/scheduler/jobs.csv")
+
+collect_ignore = ["slack_test.py"]  # manual Slack integration script, needs a project and a token
+
+FAKE_CLOUD = FakeCloud().install()
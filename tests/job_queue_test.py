@@ -0,0 +1,56 @@
+#  Copyright 2022 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from commonek.job_queue import JobEntry, JobQueue
+
+JOBS_LIST = "gs://bucket/scheduler/jobs.csv"
+HOUR = 3600
+
+
+def labels(entries):
+    return [entry.job_label for entry in entries]
+
+
+def test_low_priority_job_overtakes_higher_priority_jobs_added_later():
+    queue = JobQueue({}, group_weights={}, aging_seconds=60)
+    queue.reset([JobEntry("research", "gs://bucket/research.json", priority=0)], JOBS_LIST, now=0)
+
+    # jobs.csv uploaded again an hour later, with higher priority jobs
+    queue.reset([JobEntry("research", "gs://bucket/research.json", priority=0),
+                 JobEntry("clinical1", "gs://bucket/clinical1.json", priority=5),
+                 JobEntry("clinical2", "gs://bucket/clinical2.json", priority=5)], JOBS_LIST, now=HOUR)
+
+    assert labels(queue.order(now=HOUR)) == ["research", "clinical1", "clinical2"]
+    assert queue.pick_next(now=HOUR).job_label == "research"
+
+
+def test_higher_priority_job_goes_first_unless_the_low_priority_job_waited_longer():
+    for added_at, expected in [(4 * 60, ["clinical", "research"]), (6 * 60, ["research", "clinical"])]:
+        queue = JobQueue({}, group_weights={}, aging_seconds=60)
+        queue.reset([JobEntry("research", "gs://bucket/research.json", priority=0)], JOBS_LIST, now=0)
+        queue.reset([JobEntry("clinical", "gs://bucket/clinical.json", priority=5)], JOBS_LIST, now=added_at)
+        assert labels(queue.order(now=HOUR)) == expected
+
+
+def test_reupload_keeps_the_waiting_time_and_takes_the_new_priority():
+    queue = JobQueue({}, group_weights={}, aging_seconds=60)
+    queue.reset([JobEntry("job1", "gs://bucket/job1.json"), JobEntry("job2", "gs://bucket/job2.json")], JOBS_LIST,
+                now=0)
+    queue.reset([JobEntry("job2", "gs://bucket/job2.json", priority=3), JobEntry("job3", "gs://bucket/job3.json")],
+                JOBS_LIST, now=HOUR)
+
+    entries = {entry.job_label: entry for entry in queue.entries}
+    assert labels(queue.entries) == ["job1", "job2", "job3"]
+    assert [entries["job1"].enqueued_at, entries["job2"].enqueued_at, entries["job3"].enqueued_at] == [0, 0, HOUR]
+    assert entries["job2"].priority == 3
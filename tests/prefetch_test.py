@@ -0,0 +1,53 @@
+#  Copyright 2022 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from fakes import Message
+
+from commonek import prefetch
+from commonek.params import JOB_LABEL_NAME
+from commonek.speculation import SPECULATIVE_LABEL
+
+
+def running_job(name, labels, active_tasks):
+    return Message(
+        name=f"projects/p/locations/r/jobs/{name}",
+        labels=labels,
+        task_groups=[Message(name=f"projects/p/locations/r/jobs/{name}/taskGroups/group0")],
+        status=Message(state="RUNNING", task_groups={"group0": Message(counts={"RUNNING": active_tasks})}),
+    )
+
+
+def check_tail(monkeypatch, job):
+    triggered = []
+    monkeypatch.setattr(prefetch, "get_job_by_name", lambda job_name, region: job)
+    monkeypatch.setattr(prefetch, "trigger_job_from_csv", lambda **kwargs: triggered.append(kwargs) or kwargs)
+    prefetch.prefetch_next_job(job.name.split("/")[-1], region="r", threshold=2)
+    return triggered
+
+
+def test_prefetch_triggers_next_job_at_the_tail(monkeypatch):
+    triggered = check_tail(monkeypatch, running_job("job-dragen-a", {JOB_LABEL_NAME: "job1"}, active_tasks=1))
+    assert [kwargs["previous_job_label"] for kwargs in triggered] == ["job1"]
+    assert triggered[0]["early"]
+
+
+def test_prefetch_waits_while_tasks_are_left(monkeypatch):
+    assert not check_tail(monkeypatch, running_job("job-dragen-a", {JOB_LABEL_NAME: "job1"}, active_tasks=5))
+
+
+def test_speculative_side_job_does_not_trigger_next_job(monkeypatch):
+    # the single task of the side job completed, while the original job of job1 still has most of its tasks left
+    side_job = running_job("job-dragen-a-spec1234", {JOB_LABEL_NAME: "job1", SPECULATIVE_LABEL: "job-dragen-a"},
+                           active_tasks=0)
+    assert not check_tail(monkeypatch, side_job)
@@ -0,0 +1,33 @@
+#  Copyright 2022 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from fakes import Message
+
+from commonek import progress
+from commonek.params import JOB_LABEL_NAME
+
+
+def test_label_watcher_lists_the_jobs_of_the_label_only(monkeypatch):
+    calls = []
+
+    def list_jobs(region, filter=None):
+        calls.append(filter)
+        return [Message(name=f"projects/p/locations/{region}/jobs/job-dragen-a", labels={JOB_LABEL_NAME: "job1"})]
+
+    monkeypatch.setattr(progress, "get_regions", lambda: [Message(name="us-central1")])
+    monkeypatch.setattr(progress, "list_jobs", list_jobs)
+
+    jobs = progress.ProgressWatcher(job_label="job1").find_jobs()
+    assert list(jobs) == ["projects/p/locations/us-central1/jobs/job-dragen-a"]
+    assert calls == ['labels."dragen-job"="job1"']
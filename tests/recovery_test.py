@@ -0,0 +1,48 @@
+#  Copyright 2022 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import datetime
+
+from fakes import Message
+
+from commonek import recovery
+from commonek.params import JOB_LABEL_NAME, SPECULATIVE_LABEL
+from commonek.placement import SHARD_LABEL
+
+
+def failed_task(job_name, timestamp, sample_id):
+    return recovery.FailedTask(Message(job_name=job_name, timestamp=timestamp, sample_id=sample_id, job_label="job1",
+                                       variables='{"SAMPLE_ID": "%s"}' % sample_id))
+
+
+def test_retry_job_uses_the_last_job_without_shard_and_speculative_labels(monkeypatch):
+    templates = {
+        "job-dragen-ffff": Message(name="job-dragen-ffff", labels={JOB_LABEL_NAME: "job1"}),
+        "job-dragen-0000-spec1": Message(name="job-dragen-0000-spec1", labels={
+            JOB_LABEL_NAME: "job1", SHARD_LABEL: "1-of-2", SPECULATIVE_LABEL: "job-dragen-0000"}),
+    }
+    created = []
+    monkeypatch.setattr(recovery, "find_job_by_name", templates.get)
+    monkeypatch.setattr(recovery, "create_job_from_template",
+                        lambda template, environments, job_id, labels: created.append((template, labels)) or template)
+    monkeypatch.setattr(recovery, "save_retry_job_array", lambda created_job, tasks: None)
+
+    # the lexically largest job name is the oldest job
+    tasks = [failed_task("job-dragen-ffff", datetime.datetime(2026, 1, 1), "s1"),
+             failed_task("job-dragen-0000-spec1", datetime.datetime(2026, 1, 2), "s2")]
+    recovery.submit_retry_job(tasks, "job-dragen-retry-1", attempt=1)
+
+    template, labels = created[0]
+    assert template.name == "job-dragen-0000-spec1"
+    assert labels == {JOB_LABEL_NAME: "job1", recovery.RECOVERY_ATTEMPT_LABEL: "1"}
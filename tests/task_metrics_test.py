@@ -0,0 +1,32 @@
+#  Copyright 2022 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from fakes import Row
+
+from commonek import task_metrics
+from commonek.task_metrics import QUEUE_WAIT, RUN_TIME
+
+
+def test_queue_wait_is_measured_from_the_job_submission(monkeypatch):
+    statuses = [Row(job_id="job-1", task_id="job-1-group0-0", status="RUNNING", timestamp="2026-01-01 10:05:00",
+                    job_label="job1", dragen_app=None),
+                Row(job_id="job-1", task_id="job-1-group0-0", status="SUCCEEDED", timestamp="2026-01-01 11:05:00",
+                    job_label="job1", dragen_app=None)]
+    submissions = [Row(job_id="job-1", submitted="2026-01-01 10:00:00")]
+    monkeypatch.setattr(task_metrics, "run_query",
+                        lambda sql: submissions if "MIN(timestamp)" in sql else statuses)
+
+    metrics = task_metrics.load_task_metrics(job_id="job-1").compute()["job-1"]
+    assert metrics[QUEUE_WAIT]["count"] == 1 and metrics[QUEUE_WAIT]["max"] == 300
+    assert metrics[RUN_TIME]["max"] == 3600
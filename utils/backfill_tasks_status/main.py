@@ -0,0 +1,73 @@
+#  Copyright 2022 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import argparse
+import sys, os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../common/src'))
+from commonek.tasks_status import BACKFILL_MIN_AGE_MINUTES
+from commonek.tasks_status import backfill, count_pending_rows, migrate_schema
+
+
+def get_args():
+    # Read command line arguments
+    args_parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="""
+      Script to add the batch_task_index, sample_id, job_label and job_name columns to an existing tasks_status
+      table and to fill them in for the rows written before, from job_array, with a single UPDATE statement.
+      """,
+        epilog="""
+      Examples:
+
+      python main.py --schema-only  (before deploying get_status)
+      python main.py --dry-run  (after the columns are added)
+      python main.py
+      python main.py -l job1
+      """)
+
+    args_parser.add_argument('-j', dest="job_id", help="only rows of this job uid")
+    args_parser.add_argument('-l', dest="job_label", help="only rows of the jobs with this label")
+    args_parser.add_argument('-m', dest="min_age_minutes", type=int, default=BACKFILL_MIN_AGE_MINUTES,
+                             help="only rows older than this, rows still in the streaming buffer can not be updated "
+                                  f"(default {BACKFILL_MIN_AGE_MINUTES} minutes)")
+    args_parser.add_argument('--dry-run', dest="dry_run", action="store_true",
+                             help="only count the rows to backfill")
+    args_parser.add_argument('--schema-only', dest="schema_only", action="store_true",
+                             help="only add the columns, without filling in the rows written before")
+    return args_parser
+
+
+if __name__ == "__main__":
+    parser = get_args()
+    args = parser.parse_args()
+
+    if not args.dry_run and not migrate_schema():
+        sys.exit("Could not add the columns to the tasks_status table")
+    if args.schema_only:
+        print("Columns added to the tasks_status table")
+        sys.exit(0)
+    pending = count_pending_rows(job_id=args.job_id, job_label=args.job_label, min_age_minutes=args.min_age_minutes)
+    if pending is None:
+        sys.exit("Could not count the rows to backfill (are the columns added? run without --dry-run)")
+    print(f"{pending} rows to backfill")
+    if args.dry_run or not pending:
+        sys.exit(0)
+
+    if not backfill(job_id=args.job_id, job_label=args.job_label, min_age_minutes=args.min_age_minutes):
+        sys.exit("Backfill failed, see the logs")
+    remaining = count_pending_rows(job_id=args.job_id, job_label=args.job_label,
+                                   min_age_minutes=args.min_age_minutes)
+    # rows of tasks missing from job_array (such as jobs submitted outside of the pipeline) are left as they are
+    if remaining is not None:
+        print(f"{pending - remaining} rows backfilled, {remaining} rows without a job_array entry")
@@ -23,14 +23,16 @@ from commonek.logging import Logger
 
 
 def doit(batch_size: int,
-         parallelism: int,
+         parallelism,
          config_path: List[str],
          out_path: str,
          samples_input: List[str],
-         input_type: str = "cram"):
+         input_type: str = "cram",
+         max_run_duration: str = "7200s"):
 
     Logger.info(f"Preparing configurations using: \n"
                 f"  - parallelism={parallelism} \n"
+                f"  - max_run_duration={max_run_duration} \n"
                 f"  - batch_size={batch_size} \n"
                 f"  - config_path_uri={config_path} \n"
                 f"  - out_path={out_path} \n"
@@ -48,7 +50,8 @@ def doit(batch_size: int,
     for index, samples_input_uri in enumerate(samples_input):
         config_path_uri = config_path[index]
         job_count, jobs_csv_str = prepare_configuration(batch_size, config_path_uri, input_type, parallelism, samples_input_uri,
-                              bucket_name, jobs_csv_str, batch_config_dir, input_list_dir, job_count)
+                              bucket_name, jobs_csv_str, batch_config_dir, input_list_dir, job_count,
+                              max_run_duration)
 
     jobs_list_file = f"{prefix}jobs.csv"
     write_gcs_blob(bucket_name, jobs_list_file, jobs_csv_str)
@@ -59,7 +62,8 @@ def doit(batch_size: int,
 
 
 def prepare_configuration(batch_size, config_path_uri, input_type, parallelism, samples_input_uri,
-                          bucket_name, jobs_csv_str, batch_config_dir, input_list_dir, job_count):
+                          bucket_name, jobs_csv_str, batch_config_dir, input_list_dir, job_count,
+                          max_run_duration="7200s"):
 
     input_list = get_rows_from_file(samples_input_uri)
     input_name = os.path.splitext(os.path.basename(samples_input_uri))[0]
@@ -76,18 +80,21 @@ def prepare_configuration(batch_size, config_path_uri, input_type, parallelism,
             samples += " ".join(row) + "\n"
 
         write_gcs_blob(bucket_name, input_path_file, "collaborator_sample_id	cram_file_ref\n" + samples)
-        write_batch_options(bucket_name, batch_config_file, parallelism, input_type, input_path_file, config_path_uri)
+        write_batch_options(bucket_name, batch_config_file, parallelism, input_type, input_path_file, config_path_uri,
+                            max_run_duration)
         job_count += 1
 
     return job_count, jobs_csv_str
 
 
-def write_batch_options(bucket_name: str, file_name: str, parallelism: int, input_type: str,
-                        input_path: str, config_path: str):
+def write_batch_options(bucket_name: str, file_name: str, parallelism, input_type: str,
+                        input_path: str, config_path: str, max_run_duration: str = "7200s"):
+    if str(parallelism).lower() != "auto":
+        parallelism = int(parallelism)
     batch_options = {
         "run_options": {
             "parallelism": parallelism,
-            "max_run_duration": "7200s",
+            "max_run_duration": max_run_duration,
             "memory_mib": 512,
             "cpu_milli": 1000,
             "max_retry_count": 1,
@@ -117,7 +124,11 @@ def get_args():
       """)
 
     args_parser.add_argument('-p', dest="parallelism",
-                             help="how many tasks to run in parallel per single job", required=True)
+                             help="how many tasks to run in parallel per single job "
+                                  "(or 'auto' to estimate it from the historical run times)", required=True)
+    args_parser.add_argument('-d', dest="max_run_duration", default="7200s",
+                             help="maximum run duration of a single task, such as 7200s "
+                                  "(or 'auto' to estimate it from the historical run times)")
     args_parser.add_argument('-b', dest="batch_size", type=int,
                              help="how many tasks in total in a single job (job runs non-stop till completion)", required=True)
     args_parser.add_argument('-c', dest="config_path_uri",
@@ -144,4 +155,4 @@ if __name__ == "__main__":
                                                    f" input option, however lents is not equal: config_path " \
                                                    f"{len(config_path)} samples_input {len(samples_input)}"
     doit(batch_size=batch_size, parallelism=parallelism, config_path=config_path,
-         out_path=out_dir, samples_input=samples_input)
+         out_path=out_dir, samples_input=samples_input, max_run_duration=args.max_run_duration)
@@ -0,0 +1,50 @@
+#  Copyright 2022 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import argparse
+import json
+import sys, os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../common/src'))
+from commonek.params import QC_HARVEST_MAX_WORKERS
+from commonek.qc_metrics import harvest
+
+
+def get_args():
+    # Read command line arguments
+    args_parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="""
+      Script to harvest the DRAGEN QC metrics (*metrics.csv files in the output directories of the verified tasks)
+      into the BigQuery qc_metrics table. Samples harvested before are skipped.
+      """,
+        epilog="""
+      Examples:
+
+      python main.py -l job1
+      python main.py -w 64
+      """)
+
+    args_parser.add_argument('-j', dest="job_id", help="only tasks of this job uid")
+    args_parser.add_argument('-l', dest="job_label", help="only tasks of the jobs with this label")
+    args_parser.add_argument('-w', dest="max_workers", type=int, default=QC_HARVEST_MAX_WORKERS,
+                             help=f"output directories read in parallel (default {QC_HARVEST_MAX_WORKERS})")
+    return args_parser
+
+
+if __name__ == "__main__":
+    parser = get_args()
+    args = parser.parse_args()
+
+    summary = harvest(job_id=args.job_id, job_label=args.job_label, max_workers=args.max_workers)
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,68 @@
+#  Copyright 2022 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import argparse
+import importlib.util
+import json
+import sys, os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../common/src'))
+from commonek.params import RECONCILE_LOOKBACK_HOURS, RECONCILE_MAX_WORKERS, RECONCILE_SETTLE_SECONDS
+from commonek.reconciler import reconcile
+
+
+def load_get_status():
+    """get_status cloud function, replaying the transitions through its own path."""
+    path = os.path.join(os.path.dirname(__file__), '../../cloud_functions/get_status/main.py')
+    spec = importlib.util.spec_from_file_location("get_status_main", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def get_args():
+    # Read command line arguments
+    args_parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="""
+      Script to compare the task states of the recent jobs in Batch with the statuses recorded in tasks_status,
+      and to replay the missing transitions (lost task events) through the get_status path: status rows,
+      verification of the succeeded tasks and Slack messages.
+      """,
+        epilog="""
+      Examples:
+
+      python main.py --dry-run
+      python main.py -l job1 -H 72
+      """)
+
+    args_parser.add_argument('-l', dest="job_label", help="only the jobs with this label")
+    args_parser.add_argument('-H', dest="lookback_hours", type=float, default=RECONCILE_LOOKBACK_HOURS,
+                             help=f"jobs active or updated during these last hours (default {RECONCILE_LOOKBACK_HOURS})")
+    args_parser.add_argument('-w', dest="max_workers", type=int, default=RECONCILE_MAX_WORKERS,
+                             help=f"jobs whose tasks are listed at a time (default {RECONCILE_MAX_WORKERS})")
+    args_parser.add_argument('-s', dest="settle_seconds", type=float, default=RECONCILE_SETTLE_SECONDS,
+                             help=f"leave out the transitions of these last seconds (default {RECONCILE_SETTLE_SECONDS})")
+    args_parser.add_argument('--dry-run', dest="dry_run", action="store_true",
+                             help="only list the missing transitions, do not replay them")
+    return args_parser
+
+
+if __name__ == "__main__":
+    parser = get_args()
+    args = parser.parse_args()
+
+    replay = None if args.dry_run else load_get_status().replay_transitions
+    summary = reconcile(job_label=args.job_label, lookback_hours=args.lookback_hours, max_workers=args.max_workers,
+                        settle_seconds=args.settle_seconds, replay=replay, dry_run=args.dry_run)
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,55 @@
+#  Copyright 2022 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import argparse
+import json
+import sys, os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../common/src'))
+from commonek.params import RECOVERY_MAX_ATTEMPTS
+from commonek.recovery import recover
+
+
+def get_args():
+    # Read command line arguments
+    args_parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="""
+      Script to classify the failed tasks (FAILED and VERIFIED_FAILED) of a job or label from their logs,
+      and resubmit the transient failures (license server timeout, S3 authentication, out of memory, preemption)
+      as one retry job.
+      """,
+        epilog="""
+      Examples:
+
+      python main.py -l job1 --dry-run
+      python main.py -j job-dragen-461625f-9040151d-96d3-4c7f0
+      """)
+
+    group = args_parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('-j', dest="job_id", help="failed tasks of this job uid")
+    group.add_argument('-l', dest="job_label", help="failed tasks of the jobs with this label")
+    args_parser.add_argument('-m', dest="max_attempts", type=int, default=RECOVERY_MAX_ATTEMPTS,
+                             help=f"resubmissions per sample (default {RECOVERY_MAX_ATTEMPTS})")
+    args_parser.add_argument('--dry-run', dest="dry_run", action="store_true",
+                             help="only classify the failures, do not submit the retry job")
+    return args_parser
+
+
+if __name__ == "__main__":
+    parser = get_args()
+    args = parser.parse_args()
+
+    summary = recover(job_id=args.job_id, job_label=args.job_label, dry_run=args.dry_run,
+                      max_attempts=args.max_attempts)
+    print(json.dumps(summary, indent=2))
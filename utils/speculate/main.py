@@ -0,0 +1,56 @@
+#  Copyright 2022 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import argparse
+import json
+import sys, os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../common/src'))
+from commonek.params import SPECULATION_MAX_ACTIVE, SPECULATION_PERCENTILE
+from commonek.speculation import monitor
+
+
+def get_args():
+    # Read command line arguments
+    args_parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="""
+      Script to find the straggler tasks (running longer than a percentile of the durations predicted for their
+      DRAGEN app and input size) and submit a speculative duplicate of each of them as a side job.
+      """,
+        epilog="""
+      Examples:
+
+      python main.py -p 90 --dry-run
+      python main.py -l job1 -p 95
+      """)
+
+    group = args_parser.add_mutually_exclusive_group()
+    group.add_argument('-j', dest="job_id", help="running tasks of this job uid")
+    group.add_argument('-l', dest="job_label", help="running tasks of the jobs with this label")
+    args_parser.add_argument('-p', dest="percentile", type=float, default=SPECULATION_PERCENTILE or 95,
+                             help=f"percentile of the predicted durations (default {SPECULATION_PERCENTILE or 95})")
+    args_parser.add_argument('-m', dest="max_active", type=int, default=SPECULATION_MAX_ACTIVE,
+                             help=f"duplicates running at a time (default {SPECULATION_MAX_ACTIVE})")
+    args_parser.add_argument('--dry-run', dest="dry_run", action="store_true",
+                             help="only list the stragglers, do not submit the duplicates")
+    return args_parser
+
+
+if __name__ == "__main__":
+    parser = get_args()
+    args = parser.parse_args()
+
+    summary = monitor(job_id=args.job_id, job_label=args.job_label, percentile=args.percentile,
+                      max_active=args.max_active, dry_run=args.dry_run)
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,67 @@
+#  Copyright 2022 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import argparse
+import sys, os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../common/src'))
+from commonek.helper import split_uri_2_bucket_prefix
+from commonek.gcs_helper import write_gcs_blob
+from commonek.task_metrics import load_task_metrics, save_task_metrics_to_bq
+
+
+def get_args():
+    # Read command line arguments
+    args_parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="""
+      Script to compute queue wait, run time, verification lag, samples per hour and retry rate
+      from the task status transitions recorded in BigQuery.
+      """,
+        epilog="""
+      Examples:
+
+      python main.py -l job1 -g dragen_app
+      python main.py -a 2023-10-07T03:23:10 -g job_label -o gs://$PROJECT_ID-output/metrics.json --bq
+      """)
+
+    args_parser.add_argument('-j', dest="job_id", help="only tasks of this job uid")
+    args_parser.add_argument('-l', dest="job_label", help="only tasks of the jobs with this label")
+    args_parser.add_argument('-a', dest="after_time", help="only status changes after this time")
+    args_parser.add_argument('-g', dest="group_by", default="job_id",
+                             choices=["job_id", "job_label", "dragen_app"],
+                             help="how to group the metrics (default job_id)")
+    args_parser.add_argument('-o', dest="out_path",
+                             help="gs:// or local path to save metrics as json (printed when not set)")
+    args_parser.add_argument('--bq', dest="save_bq", action="store_true",
+                             help="also save summary into the BigQuery task metrics table")
+    return args_parser
+
+
+if __name__ == "__main__":
+    parser = get_args()
+    args = parser.parse_args()
+
+    metrics = load_task_metrics(job_id=args.job_id, job_label=args.job_label, after_time=args.after_time)
+    metrics_json = metrics.to_json(args.group_by)
+    if not args.out_path:
+        print(metrics_json)
+    elif args.out_path.startswith("gs://"):
+        bucket_name, file_name = split_uri_2_bucket_prefix(args.out_path)
+        write_gcs_blob(bucket_name, file_name, metrics_json, "application/json")
+    else:
+        with open(args.out_path, "w") as f:
+            f.write(metrics_json)
+
+    if args.save_bq:
+        save_task_metrics_to_bq(metrics, args.group_by)
@@ -0,0 +1,91 @@
+#  Copyright 2022 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import argparse
+import datetime
+import json
+import sys, os
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../common/src'))
+from commonek.progress import DELETED, Progress, ProgressWatcher, THROUGHPUT_WINDOW_SECONDS, load_history
+
+STATES = ["PENDING", "ASSIGNED", "RUNNING", "SUCCEEDED", "FAILED", "UNEXECUTED", DELETED]
+
+
+def get_args():
+    # Read command line arguments
+    args_parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="""
+      Script to follow the progress of a job or label from the Batch task listings: counts per task state,
+      throughput and ETA, refreshed every interval. Jobs no longer in Batch are reported from the BigQuery tables.
+      """,
+        epilog="""
+      Examples:
+
+      python main.py -l job1
+      python main.py -j job-dragen-ae0e459505 -i 10 --changes
+      python main.py -l job1 --once --json
+      """)
+
+    group = args_parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('-j', dest="job_name", help="job name (such as job-dragen-ae0e459505) or uid")
+    group.add_argument('-l', dest="job_label", help="the jobs with this label")
+    args_parser.add_argument('-i', dest="interval", type=float, default=30,
+                             help="seconds between the polls (default 30)")
+    args_parser.add_argument('-w', dest="window", type=float, default=THROUGHPUT_WINDOW_SECONDS,
+                             help=f"seconds of completions for the throughput (default {THROUGHPUT_WINDOW_SECONDS})")
+    args_parser.add_argument('--changes', dest="changes", action="store_true",
+                             help="print the task state changes of every poll")
+    args_parser.add_argument('--once', dest="once", action="store_true", help="print a single poll and exit")
+    args_parser.add_argument('--json', dest="json", action="store_true", help="print the polls as json")
+    return args_parser
+
+
+def format_duration(seconds: float) -> str:
+    return str(datetime.timedelta(seconds=int(seconds)))
+
+
+def render(progress: Progress, show_changes: bool) -> str:
+    lines = []
+    if show_changes:
+        lines += [f"  {change}" for change in progress.changes]
+    timestamp = datetime.datetime.fromtimestamp(progress.timestamp).strftime("%Y-%m-%d %H:%M:%S")
+    counts = "  ".join(f"{state.lower()} {progress.counts[state]}" for state in STATES if progress.counts.get(state))
+    line = f"{timestamp}  jobs {len(progress.jobs)}  tasks {progress.total}  {counts}"
+    if progress.throughput is not None:
+        line += f"  | {progress.throughput:.1f} tasks/h"
+    if progress.remaining == 0:
+        line += "  done"
+    elif progress.eta_seconds is not None:
+        line += f"  ETA {format_duration(progress.eta_seconds)}"
+    lines.append(line)
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = get_args()
+    args = parser.parse_args()
+
+    watcher = ProgressWatcher(job_name=args.job_name, job_label=args.job_label, window=args.window)
+    while True:
+        progress = watcher.poll()
+        if not progress.jobs:
+            print(f"No job in Batch, history from BigQuery: "
+                  f"{json.dumps(load_history(job_name=args.job_name, job_label=args.job_label))}")
+            break
+        print(json.dumps(progress.to_dict()) if args.json else render(progress, args.changes), flush=True)
+        if args.once or progress.remaining == 0:
+            break
+        time.sleep(args.interval)